@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+#
+# Read throughput of several worker processes while other processes keep
+# writing view counts, with SQLite defaults (rollback journal,
+# synchronous=FULL, no busy timeout) and with PRAGMAs from ‘fungo.sqlite’
+# (WAL, busy timeout etc.).
+#
+# Writers bump views with bare ‘F()’ updates in a tight loop, ten per
+# transaction, without ‘counters’ and its receivers, so that the database
+# and not Python is the bottleneck. Operations that fail with “database is
+# locked” are counted and tried again.
+#
+# Every mode gets a fresh database file in a temporary directory.
+#
+# Usage: python benchmarks/concurrency.py [readers] [writers] [seconds]
+#                                         [number of categories]
+#
+
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fungo_project.settings')
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import OperationalError, connections, transaction
+from django.db.models import F
+
+from fungo import loader, sqlite
+from fungo.models import Category, Page
+from fungo.testing import use_test_caches
+
+MODES = [
+    ('defaults', {'journal_mode': 'DELETE', 'synchronous': 'FULL',
+                  'busy_timeout': 0}),
+    ('tuned', sqlite.DEFAULT_PRAGMAS),
+]
+
+def make_records(n):
+    for i in range(1, n + 1):
+        yield {'type': 'category', 'name': 'category {0}'.format(i)}
+        for j in range(5):
+            yield {'type': 'page', 'category': 'category {0}'.format(i),
+                   'title': 'page {0}'.format(j),
+                   'url': 'http://example.com/{0}/{1}'.format(i, j)}
+
+def read(n):
+    pk = random.randint(1, n)
+    Category.objects.get(pk=pk)
+    list(Page.objects.filter(category_id=pk).order_by('-views'))
+
+def write(n):
+    with transaction.atomic():
+        for i in range(10):
+            Category.objects.filter(pk=random.randint(1, n)).update(
+                views=F('views') + 1)
+
+def work(kind, operation, n, deadline, results):
+    done = locked = 0
+    while time.time() < deadline:
+        try:
+            operation(n)
+            done += 1
+        except OperationalError as e:
+            if not sqlite.is_locked(e):
+                raise
+            locked += 1
+    results.put((kind, done, locked))
+
+def reader(n, deadline, results):
+    work('read', read, n, deadline, results)
+
+def writer(n, deadline, results):
+    work('write', write, n, deadline, results)
+
+def run_mode(pragmas, readers, writers, seconds, n):
+    directory = tempfile.mkdtemp()
+    try:
+        settings.FUNGO_SQLITE_PRAGMAS = pragmas
+        connections['default'].close()
+        connections['default'].settings_dict['NAME'] = \
+            os.path.join(directory, 'bench.sqlite3')
+        call_command('migrate', verbosity=0)
+        loader.load(make_records(n))
+        # Every worker opens its own connection.
+        connections.close_all()
+        results = multiprocessing.Queue()
+        deadline = time.time() + seconds
+        workers = [multiprocessing.Process(target=reader,
+                                           args=(n, deadline, results))
+                   for i in range(readers)]
+        workers += [multiprocessing.Process(target=writer,
+                                            args=(n, deadline, results))
+                    for i in range(writers)]
+        for w in workers:
+            w.start()
+        totals = {'read': [0, 0], 'write': [0, 0]}
+        for w in workers:
+            kind, done, failed = results.get()
+            totals[kind][0] += done
+            totals[kind][1] += failed
+        for w in workers:
+            w.join()
+        return totals
+    finally:
+        connections['default'].close()
+        shutil.rmtree(directory)
+
+def main():
+    readers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    n = int(sys.argv[4]) if len(sys.argv) > 4 else 10000
+    # Workers are forked, they inherit it.
+    use_test_caches()
+    print('{0} readers, {1} writers, {2} s, {3} categories'
+          .format(readers, writers, seconds, n))
+    for name, pragmas in MODES:
+        totals = run_mode(pragmas, readers, writers, seconds, n)
+        print('{0:<9} {1:9.0f} reads/s {2:7.0f} writes/s, locked: '
+              '{3:6d} reads {4:6d} writes'
+              .format(name, totals['read'][0] / seconds,
+                      totals['write'][0] / seconds, totals['read'][1],
+                      totals['write'][1]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+#
+# Cost of rendering a kwacro (see ‘fungo.templatetags.kwacros’): a single
+# use with default arguments and a use in a loop, with and without ‘only’.
+#
+# Fails if the loop with ‘only’ (isolated scope) is slower than without it
+# (scope pushed on the caller's context) by more than ‘TOLERANCE’.
+#
+# Usage: python benchmarks/kwacros.py [iterations] [repetitions]
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fungo_project.settings')
+
+import django
+django.setup()
+
+from django.template import Context, Template
+from django.test.utils import override_settings
+
+MACRO_LIBRARY = (
+    '{% load kwacros %}'
+    '{% kwacro greet name greeting="Hello" punct="!" %}'
+    '{{ greeting }}, {{ name }}{{ punct }}{% endkwacro %}')
+
+TEMPLATES = [{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'OPTIONS': {
+        'loaders': [('django.template.loaders.locmem.Loader',
+                     {'macros.html': MACRO_LIBRARY})],
+    },
+}]
+
+TOLERANCE = 1.1
+
+def percentile(xs, p):
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))]
+
+def measure(template, context, repetitions):
+    timings = []
+    for i in range(repetitions):
+        start = time.perf_counter()
+        template.render(context)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return percentile(timings, 50) * 1000
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    header = '{% load kwacros %}{% loadkwacros "macros.html" %}'
+    users = ['user{0}'.format(i) for i in range(iterations)]
+    cases = [
+        ('single use', '{% usekwacro greet name %}', {'name': 'Bob'}),
+        ('loop', '{% for u in users %}{% usekwacro greet u punct="." %}'
+         '{% endfor %}', {'users': users}),
+        ('loop, only', '{% for u in users %}'
+         '{% usekwacro greet u punct="." only %}{% endfor %}',
+         {'users': users}),
+    ]
+    print('{0:<12} {1:>10}'.format('p50', 'ms'))
+    results = {}
+    with override_settings(TEMPLATES=TEMPLATES):
+        for name, source, context in cases:
+            template = Template(header + source)
+            results[name] = measure(template, Context(context), repetitions)
+            print('{0:<12} {1:10.3f}'.format(name, results[name]))
+    if results['loop, only'] > results['loop'] * TOLERANCE:
+        sys.exit('‘only’ is slower than pushing a scope')
+
+if __name__ == '__main__':
+    main()
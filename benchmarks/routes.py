@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+#
+# Throughput, latency and queries per request of every fungo URL.
+#
+# For every scale a fresh database is created (as for tests, the real one is
+# not touched) and seeded with that many categories, pages and users through
+# the bulk loader, then every route is requested through Django test client.
+# Results are printed and stored as JSON, by default in
+# ‘benchmarks/results/<commit>.json’ (ignored by git), so runs on different
+# commits can be compared with ‘--compare’.
+#
+# Usage: python benchmarks/routes.py [--scales 1k,100k,1m] [--requests N]
+#                                     [--output FILE] [--compare FILE]
+#
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fungo_project.settings')
+
+import django
+django.setup()
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+
+from fungo import clicks, counters, loader, search
+from fungo.models import Category, Page, User
+from fungo.testing import use_test_caches
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+PASSWORD = 'secret'
+
+def make_words(rnd, n=5000):
+    return [''.join(rnd.choice(string.ascii_lowercase)
+                    for i in range(rnd.randint(3, 9)))
+            for j in range(n)]
+
+# Seeded on its own: names of categories must not depend on import order
+# or on what else has used ‘random’ by then.
+WORDS = make_words(random.Random(42))
+
+def category_name(i):
+    rnd = random.Random(i)
+    return '{0} {1} {2}'.format(rnd.choice(WORDS), rnd.choice(WORDS), i)
+
+def make_records(n):
+    for i in range(1, n + 1):
+        yield {'type': 'category', 'name': category_name(i),
+               'views': int(random.paretovariate(1.2)),
+               'likes': int(random.paretovariate(1.5))}
+    for i in range(1, n + 1):
+        yield {'type': 'page', 'category': category_name(random.randint(1, n)),
+               'title': 'Page {0}'.format(i),
+               'url': 'http://example.com/{0}'.format(i),
+               'views': int(random.paretovariate(1.2))}
+
+def seed(n):
+    """
+    Create ‘n’ categories, ‘n’ pages and ‘n’ users.
+    """
+    loader.load(make_records(n), batch_size=5000)
+    # Hashing is slow on purpose, all users share the same password.
+    password = make_password(PASSWORD)
+    batch = []
+    for i in range(1, n + 1):
+        batch.append(User(username='user{0}'.format(i), password=password))
+        if len(batch) == 5000:
+            User.objects.bulk_create(batch)
+            batch = []
+    User.objects.bulk_create(batch)
+
+def routes(n):
+    """
+    Return list of (name, client, function returning path and query
+    parameters) for every route, ‘n’ is the scale.
+    """
+    anonymous = Client()
+    user = Client()
+    user.login(username='user1', password=PASSWORD)
+    cat_ids = list(Category.objects.values_list('id', flat=True)
+                   .order_by('?')[:1000])
+    slugs = list(Category.objects.filter(pk__in=cat_ids)
+                 .values_list('slug', flat=True))
+    page_ids = list(Page.objects.values_list('id', flat=True)
+                    .order_by('?')[:1000])
+    words = [w[:random.randint(1, len(w))] for w in WORDS[:1000]]
+    return [
+        ('index', anonymous,
+         lambda: (reverse('index'), {})),
+        ('index (user)', user,
+         lambda: (reverse('index'), {})),
+        ('category', anonymous,
+         lambda: (reverse('category', args=[random.choice(slugs)]), {})),
+        ('category (user)', user,
+         lambda: (reverse('category', args=[random.choice(slugs)]), {})),
+        ('like_category', user,
+         lambda: (reverse('like_category'),
+                  {'category_id': random.choice(cat_ids)})),
+        ('suggest_category', anonymous,
+         lambda: (reverse('suggest_category'),
+                  {'suggestion': random.choice(words)})),
+        ('suggest_category_json', anonymous,
+         lambda: (reverse('suggest_category_json'),
+                  {'suggestion': random.choice(words)})),
+        ('all_users', anonymous,
+         lambda: (reverse('all_users'), {'pagesize': 20})),
+        ('user_page', anonymous,
+         lambda: (reverse('user_page', args=['user{0}'.format(
+             random.randint(1, n))]), {})),
+        ('goto', anonymous,
+         lambda: (reverse('goto'), {'page_id': random.choice(page_ids)})),
+        ('about', anonymous,
+         lambda: (reverse('about'), {})),
+        ('api_categories', anonymous,
+         lambda: (reverse('api_categories'), {})),
+        ('api_pages', anonymous,
+         lambda: (reverse('api_pages', args=[random.choice(slugs)]), {})),
+        ('api_users', anonymous,
+         lambda: (reverse('api_users'), {})),
+    ]
+
+def percentile(xs, p):
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))]
+
+def run_route(client, request, count, warmup=10):
+    for i in range(warmup):
+        client.get(*request())
+    timings, queries = [], 0
+    started = time.perf_counter()
+    for i in range(count):
+        path, params = request()
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            response = client.get(path, params)
+            if response.streaming:
+                # Rows are read as the response is sent.
+                b''.join(response.streaming_content)
+            timings.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            raise RuntimeError('{0} returned {1}'
+                               .format(path, response.status_code))
+        queries += len(ctx.captured_queries)
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    return {
+        'requests':    count,
+        'rps':         count / elapsed,
+        'p50_ms':      percentile(timings, 50) * 1000,
+        'p99_ms':      percentile(timings, 99) * 1000,
+        'max_ms':      timings[-1] * 1000,
+        'queries_avg': queries / count,
+    }
+
+def run_scale(n, count):
+    # Fresh database in a temporary directory for every scale.
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    test_settings['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0)
+    cache.clear()
+    search.reset()
+    try:
+        start = time.perf_counter()
+        seed(n)
+        seconds = time.perf_counter() - start
+        print('  seeded in {0:.1f} s'.format(seconds))
+        results = {'seed_seconds': seconds, 'routes': {}}
+        for name, client, request in routes(n):
+            r = run_route(client, request, count)
+            results['routes'][name] = r
+            print('  {0:<21} {1:8.1f} req/s  p50 {2:7.2f} ms  '
+                  'p99 {3:7.2f} ms  {4:5.1f} queries'
+                  .format(name, r['rps'], r['p50_ms'], r['p99_ms'],
+                          r['queries_avg']))
+        # Don't let background writers touch the next database.
+        clicks.drain()
+        counters.flush()
+        return results
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(old, new):
+    print('Compared to {0}:'.format(old.get('commit')))
+    for scale, results in new['scales'].items():
+        old_routes = old.get('scales', {}).get(scale, {}).get('routes', {})
+        for name, r in results['routes'].items():
+            o = old_routes.get(name)
+            if o is None:
+                continue
+            print('  {0:>4} {1:<21} p50 {2:+7.1f}%  p99 {3:+7.1f}%  '
+                  'queries {4:+5.1f}'
+                  .format(scale, name,
+                          (r['p50_ms'] / o['p50_ms'] - 1) * 100,
+                          (r['p99_ms'] / o['p99_ms'] - 1) * 100,
+                          r['queries_avg'] - o['queries_avg']))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scales', default='1k,100k',
+                        help='comma-separated list of: ' +
+                        ', '.join(sorted(SCALES, key=SCALES.get)))
+    parser.add_argument('--requests', type=int, default=500,
+                        help='requests per route')
+    parser.add_argument('--output', help='where to write JSON results')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    args = parser.parse_args()
+
+    random.seed(42)
+    setup_test_environment()
+    # Caches are cleared below, don't touch the shared one.
+    use_test_caches()
+    # Budget warnings would drown the report.
+    logging.getLogger('fungo.requests').setLevel(logging.ERROR)
+
+    commit = git_commit()
+    report = {
+        'commit':  commit,
+        'date':    datetime.datetime.now().isoformat(),
+        'python':  platform.python_version(),
+        'django':  django.get_version(),
+        'scales':  {},
+    }
+    for scale in args.scales.split(','):
+        print('{0} categories, pages and users:'.format(scale))
+        report['scales'][scale] = run_scale(SCALES[scale], args.requests)
+
+    output = args.output or os.path.join(BASE_DIR, 'benchmarks', 'results',
+                                         '{0}.json'.format(commit))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print('Results written to {0}'.format(output))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+if __name__ == '__main__':
+    main()
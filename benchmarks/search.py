@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+#
+# Latency of category search (see ‘fungo.search’) on a synthetic index,
+# while view counts keep changing as they do when counters are flushed.
+#
+# Fails if p99 is over the budget.
+#
+# Usage: python benchmarks/search.py [number of categories] [queries]
+#                                    [p99 budget, ms]
+#
+
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fungo_project.settings')
+
+import django
+django.setup()
+
+from fungo import search
+from fungo.search import CategoryIndex
+
+FLUSH_EVERY = 100 # queries
+FLUSH_SIZE = 500 # categories with new views per flush
+
+def make_words(rnd, n=20000):
+    return [''.join(rnd.choice(string.ascii_lowercase)
+                    for i in range(rnd.randint(3, 9)))
+            for j in range(n)]
+
+def make_rows(rnd, words, n):
+    for pk in range(1, n + 1):
+        name = ' '.join(rnd.choice(words) for i in range(rnd.randint(1, 3)))
+        # Views are heavily skewed, as they are in real life.
+        yield pk, '{0} {1}'.format(name, pk), int(rnd.paretovariate(1.2))
+
+def make_queries(rnd, names, n):
+    queries = []
+    for i in range(n):
+        name = rnd.choice(names)
+        size = rnd.randint(0, 8)
+        start = rnd.randint(0, max(0, len(name) - size))
+        queries.append(name[start:start + size])
+    # Some queries that match nothing, and rare two-letter ones.
+    queries += [''.join(rnd.choice(string.ascii_lowercase)
+                        for i in range(6)) for j in range(n // 10)]
+    queries += ['zq', 'qx', 'jz'] * (n // 100)
+    rnd.shuffle(queries)
+    return queries
+
+def percentile(xs, p):
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))]
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    q = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    budget = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    rnd = random.Random(42)
+    rows = list(make_rows(rnd, make_words(rnd), n))
+    start = time.perf_counter()
+    index = CategoryIndex(rows)
+    print('Built index of {0} categories in {1:.1f} s'
+          .format(len(index), time.perf_counter() - start))
+    queries = make_queries(rnd, [name for pk, name, views in rows], q)
+    # Let re-ranking happen during the run.
+    search.RANK_REFRESH = 0.5
+    timings = []
+    for i, query in enumerate(queries):
+        if i % FLUSH_EVERY == 0:
+            for pk in rnd.sample(range(1, n + 1), FLUSH_SIZE):
+                index.bump(pk, rnd.randint(1, 10))
+        start = time.perf_counter()
+        index.search(query, 5)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    p99 = percentile(timings, 99) * 1000
+    print('{0} queries: p50 {1:.3f} ms, p99 {2:.3f} ms, max {3:.3f} ms'
+          .format(len(timings), percentile(timings, 50) * 1000, p99,
+                  timings[-1] * 1000))
+    if p99 > budget:
+        sys.exit('p99 is over the budget of {0} ms'.format(budget))
+
+if __name__ == '__main__':
+    main()
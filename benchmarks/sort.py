@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+# Cost of the hot sorts (top categories and pages, pages of a category by
+# views) and of page counts, without and with indexes and denormalized
+# counts of migration ‘fungo.0002_indexes_and_counts’.
+#
+# A fresh database (as for tests) is seeded, migrated back to
+# ‘0001_initial’ for the “before” numbers and forward again for the “after”
+# ones. Queries are raw SQL, because models don't match the old schema.
+#
+# Usage: python benchmarks/sort.py [number of categories] [pages per
+#                                   category] [repetitions]
+#
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fungo_project.settings')
+
+import django
+django.setup()
+
+from django.core.management import call_command
+from django.db import connection
+
+from fungo import loader
+
+QUERIES = [
+    ('top categories by likes',
+     'SELECT id, name, likes FROM fungo_category ORDER BY likes DESC LIMIT 5',
+     False),
+    ('top categories by views',
+     'SELECT id, name, views FROM fungo_category ORDER BY views DESC LIMIT 5',
+     False),
+    ('top pages by views',
+     'SELECT id, title, views FROM fungo_page ORDER BY views DESC LIMIT 5',
+     False),
+    ('pages of category by views',
+     'SELECT id, title, views FROM fungo_page WHERE category_id = %s '
+     'ORDER BY views DESC',
+     True),
+]
+
+COUNT_BEFORE = ('SELECT COUNT(*) FROM fungo_page WHERE category_id = %s', True)
+COUNT_AFTER = ('SELECT page_count FROM fungo_category WHERE id = %s', True)
+
+def make_records(n, pages):
+    for i in range(1, n + 1):
+        yield {'type': 'category', 'name': 'category {0}'.format(i),
+               'views': int(random.paretovariate(1.2)),
+               'likes': int(random.paretovariate(1.5))}
+    for i in range(n * pages):
+        yield {'type': 'page',
+               'category': 'category {0}'.format(random.randint(1, n)),
+               'title': 'page {0}'.format(i),
+               'url': 'http://example.com/{0}'.format(i),
+               'views': int(random.paretovariate(1.2))}
+
+def percentile(xs, p):
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))]
+
+def measure(sql, per_category, n, repetitions):
+    timings = []
+    with connection.cursor() as cursor:
+        for i in range(repetitions):
+            params = [random.randint(1, n)] if per_category else []
+            start = time.perf_counter()
+            cursor.execute(sql, params)
+            cursor.fetchall()
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    return percentile(timings, 50) * 1000
+
+def measure_all(n, repetitions, count_query):
+    results = [measure(sql, per_category, n, repetitions)
+               for name, sql, per_category in QUERIES]
+    results.append(measure(count_query[0], count_query[1], n, repetitions))
+    return results
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    pages = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    repetitions = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    random.seed(42)
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        start = time.perf_counter()
+        loader.load(make_records(n, pages), batch_size=5000)
+        print('Seeded {0} categories and {1} pages in {2:.1f} s'
+              .format(n, n * pages, time.perf_counter() - start))
+        call_command('migrate', 'fungo', '0001', verbosity=0)
+        before = measure_all(n, repetitions, COUNT_BEFORE)
+        call_command('migrate', 'fungo', verbosity=0)
+        after = measure_all(n, repetitions, COUNT_AFTER)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+    names = [name for name, sql, per_category in QUERIES]
+    names.append('page count of category')
+    print('{0:<28} {1:>12} {2:>12} {3:>9}'
+          .format('p50', 'before, ms', 'after, ms', 'speedup'))
+    for name, b, a in zip(names, before, after):
+        print('{0:<28} {1:12.3f} {2:12.3f} {3:8.0f}x'
+              .format(name, b, a, b / a if a else float('inf')))
+
+if __name__ == '__main__':
+    main()
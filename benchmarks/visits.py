@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+#
+# Cost of visit counting on the homepage with visits kept in database
+# sessions, cache sessions and a signed cookie (see ‘fungo.visits’).
+#
+# Every client makes its first visit (the counter is written) and then a
+# few repeated visits on the same day (nothing should be written).
+#
+# Usage: python benchmarks/visits.py [clients] [visits per client]
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fungo_project.settings')
+
+import django
+django.setup()
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment)
+
+from fungo import leaderboards
+from fungo.testing import use_test_caches
+
+BACKENDS = [
+    ('db sessions', {'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+                     'FUNGO_VISITS_STORE': 'session'}),
+    ('cache sessions',
+     {'SESSION_ENGINE': 'django.contrib.sessions.backends.cache',
+      'FUNGO_VISITS_STORE': 'session'}),
+    ('signed cookie', {'FUNGO_VISITS_STORE': 'cookie'}),
+]
+
+def run(clients, per_client):
+    url = reverse('index')
+    first, repeated, queries = [], [], 0
+    for i in range(clients):
+        client = Client()
+        for j in range(per_client):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                client.get(url)
+                elapsed = time.perf_counter() - start
+            queries += len(ctx.captured_queries)
+            (repeated if j else first).append(elapsed)
+    return (sum(first) / len(first) * 1000,
+            sum(repeated) / max(len(repeated), 1) * 1000,
+            queries / (clients * per_client))
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_client = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    setup_test_environment()
+    # Caches are cleared below, don't touch the shared one.
+    use_test_caches()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        cache.clear()
+        leaderboards.top('categories') # warm up, we measure visits only
+        leaderboards.top('pages')
+        print('{0:<16} {1:>12} {2:>12} {3:>12}'
+              .format('', 'first, ms', 'repeat, ms', 'queries/req'))
+        for name, overrides in BACKENDS:
+            with override_settings(**overrides):
+                first, repeated, queries = run(clients, per_client)
+            print('{0:<16} {1:12.2f} {2:12.2f} {3:12.2f}'
+                  .format(name, first, repeated, queries))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Read-only JSON API: categories, pages of a category and users.
+
+Responses are streamed: rows come from ‘.iterator()’ (no queryset cache)
+and are written out one by one, so even big pages (up to
+‘FUNGO_API_MAX_LIMIT’ rows) are served in constant memory (SQLite backend
+fetches raw rows at once, but model instances and JSON are still made one
+at a time). Parameters:
+
+* ‘limit’ — number of rows, ‘FUNGO_API_DEFAULT_LIMIT’ by default;
+
+* ‘fields’ — comma-separated fields to include, all by default, ‘id’ is
+  always included; only these columns are fetched (‘.only()’);
+
+* ‘cursor’ — where to continue, it's ‘next’ of the previous response.
+
+Paging is by keyset on ‘id’ (see ‘fungo.pagination’), so deep pages cost
+the same as the first one. A response looks like:
+
+    {"results": [{"id": 1, …}, …], "next": "cursor or null"}
+
+Bad parameters give ‘400 Bad Request’ with {"error": "…"}.
+"""
+
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+
+from fungo import pagination
+
+DEFAULT_LIMIT = 100
+DEFAULT_MAX_LIMIT = 10000
+KEY = 'id'
+
+# Fields that can be requested (model field names), name → attribute.
+CATEGORY_FIELDS = {
+    'id':         'id',
+    'name':       'name',
+    'slug':       'slug',
+    'views':      'views',
+    'likes':      'likes',
+    'page_count': 'page_count',
+}
+
+PAGE_FIELDS = {
+    'id':       'id',
+    'category': 'category_id',
+    'title':    'title',
+    'url':      'url',
+    'views':    'views',
+}
+
+USER_FIELDS = {
+    'id':          'id',
+    'username':    'username',
+    'date_joined': 'date_joined',
+}
+
+def bad_request(message):
+    return JsonResponse({'error': message}, status=400)
+
+def parse_fields(value, allowed):
+    """
+    Return list of fields requested by ‘value’ (of the ‘fields’ parameter)
+    out of ‘allowed’. Raise ‘ValueError’ if some of them are unknown.
+    """
+    if not value:
+        return sorted(allowed, key=lambda name: name != KEY)
+    fields = [KEY]
+    for name in value.split(','):
+        name = name.strip()
+        if name not in allowed:
+            raise ValueError('Unknown field: {0}'.format(name))
+        if name not in fields:
+            fields.append(name)
+    return fields
+
+def parse_limit(value):
+    max_limit = getattr(settings, 'FUNGO_API_MAX_LIMIT', DEFAULT_MAX_LIMIT)
+    if not value:
+        return min(getattr(settings, 'FUNGO_API_DEFAULT_LIMIT', DEFAULT_LIMIT),
+                   max_limit)
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('Limit must be a number')
+    if not 1 <= limit <= max_limit:
+        raise ValueError('Limit must be from 1 to {0}'.format(max_limit))
+    return limit
+
+def _encode(obj, fields, allowed):
+    return json.dumps({name: getattr(obj, allowed[name]) for name in fields},
+                      cls=DjangoJSONEncoder, sort_keys=True)
+
+def _stream(first, rows, fields, allowed, limit, number):
+    yield '{"results": ['
+    n, last, obj = 0, None, first
+    while obj is not None:
+        if n == limit:
+            # One row more than asked for: there is a next page.
+            cursor = pagination.encode_cursor('a', last, number + 1)
+            yield '], "next": {0}}}'.format(json.dumps(cursor))
+            return
+        yield (',' if n else '') + _encode(obj, fields, allowed)
+        n, last = n + 1, getattr(obj, KEY)
+        obj = next(rows, None)
+    yield '], "next": null}'
+
+def stream(request, queryset, allowed):
+    """
+    Return streaming JSON response with a page of ‘queryset’ chosen by
+    request parameters, ‘allowed’ are fields that can be requested.
+    """
+    try:
+        fields = parse_fields(request.GET.get('fields'), allowed)
+        limit = parse_limit(request.GET.get('limit'))
+        value, number = None, 1
+        if request.GET.get('cursor'):
+            direction, value, number = pagination.decode_cursor(
+                request.GET['cursor'])
+            if direction != 'a' or not isinstance(value, int):
+                raise ValueError('Invalid cursor')
+    except ValueError as e:
+        return bad_request(str(e))
+    if value is not None:
+        queryset = queryset.filter(**{KEY + '__gt': value})
+    queryset = queryset.only(*fields).order_by(KEY)[:limit + 1]
+    rows = queryset.iterator()
+    # Run the query now, while the request is being served (it's counted
+    # and routed as part of it), rows are read as they are streamed.
+    first = next(rows, None)
+    return StreamingHttpResponse(
+        _stream(first, rows, fields, allowed, limit, number),
+        content_type='application/json')
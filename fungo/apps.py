@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+class FungoConfig(AppConfig):
+    name = 'fungo'
+    verbose_name = 'Fungo'
+
+    def ready(self):
+        # Connect signal receivers.
+        import fungo.receivers
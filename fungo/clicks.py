@@ -0,0 +1,168 @@
+"""
+Asynchronous click log for outbound links (‘track_url’).
+
+The redirect view shouldn't wait for the database: it looks URL of the
+page up in the cache (the database is only hit on a cache miss), puts a
+click event on an in-process queue and redirects right away. A background
+worker thread takes events off the queue, aggregates them and every
+‘FUNGO_CLICK_FLUSH_INTERVAL’ seconds (or every ‘FUNGO_CLICK_BATCH_SIZE’
+events) writes them out in one transaction: ‘Page.views’ is bumped with
+‘F()’ updates and, if ‘FUNGO_CLICK_DAILY_STATS’ is on, per-day counts are
+added to ‘DailyClicks’ for analytics.
+
+If the queue is full, the click goes to the view counter buffer instead
+(see ‘fungo.counters’), so it still gets counted. Whatever is left in the
+queue is written out when the process exits.
+"""
+
+import atexit
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from fungo import counters
+from fungo.sqlite import retry_on_locked
+from fungo.models import DailyClicks, Page
+
+DEFAULT_FLUSH_INTERVAL = 5 # seconds
+DEFAULT_BATCH_SIZE = 1000
+QUEUE_SIZE = 100000
+URL_TIMEOUT = 3600 # seconds
+
+_queue = queue.Queue(QUEUE_SIZE)
+_worker = None
+_worker_lock = threading.Lock()
+_flush_lock = threading.Lock()
+
+def _url_key(page_id):
+    return 'fungo:page-url:{0}'.format(page_id)
+
+def page_url(page_id):
+    """
+    Return URL of page with id ‘page_id’ or None if there is no such page.
+    """
+    key = _url_key(page_id)
+    url = cache.get(key)
+    if url is None:
+        urls = Page.objects.filter(id=page_id).values_list('url', flat=True)
+        if not urls:
+            return None
+        url = urls[0]
+        cache.set(key, url, URL_TIMEOUT)
+    return url
+
+def forget_url(page_id):
+    """
+    Drop cached URL of page ‘page_id’ (called when the page changes).
+    """
+    cache.delete(_url_key(page_id))
+
+def record_click(page_id):
+    """
+    Register click on page ‘page_id’. This never touches the database.
+    """
+    try:
+        _queue.put_nowait((page_id, timezone.now().date()))
+    except queue.Full:
+        counters.get_counter().incr(Page, page_id)
+        return
+    _ensure_worker()
+
+def write_clicks(clicks):
+    """
+    Write aggregated ‘clicks’, a mapping (page id, day) → number of clicks,
+    to the database in one transaction.
+    """
+    views = defaultdict(int)
+    for (page_id, day), n in clicks.items():
+        views[page_id] += n
+    _write(clicks, views)
+    # Only once the transaction has committed, and only once.
+    counters.notify(Page, views)
+
+@retry_on_locked
+def _write(clicks, views):
+    daily = getattr(settings, 'FUNGO_CLICK_DAILY_STATS', True)
+    with transaction.atomic():
+        counters.increment(Page, views)
+        if daily:
+            for (page_id, day), n in clicks.items():
+                _add_daily(page_id, day, n)
+
+def _add_daily(page_id, day, n):
+    rows = DailyClicks.objects.filter(page_id=page_id, day=day)
+    if rows.update(clicks=F('clicks') + n):
+        return
+    try:
+        with transaction.atomic():
+            DailyClicks.objects.create(page_id=page_id, day=day, clicks=n)
+    except IntegrityError:
+        # Somebody has just created the row, add to it then.
+        rows.update(clicks=F('clicks') + n)
+
+def drain():
+    """
+    Take all events that are currently in the queue and write them out.
+    Return number of events written.
+    """
+    with _flush_lock:
+        clicks = defaultdict(int)
+        n = 0
+        while True:
+            try:
+                event = _queue.get_nowait()
+            except queue.Empty:
+                break
+            clicks[event] += 1
+            n += 1
+        if clicks:
+            try:
+                write_clicks(clicks)
+            except Exception:
+                # Keep at least the views: hand them over to the view
+                # counter, it retries on its own.
+                counter = counters.get_counter()
+                for (page_id, day), k in clicks.items():
+                    counter.incr(Page, page_id, k)
+                raise
+        return n
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name='fungo-clicks',
+                                       daemon=True)
+            _worker.start()
+
+def _run():
+    interval = getattr(settings, 'FUNGO_CLICK_FLUSH_INTERVAL',
+                       DEFAULT_FLUSH_INTERVAL)
+    batch_size = getattr(settings, 'FUNGO_CLICK_BATCH_SIZE',
+                         DEFAULT_BATCH_SIZE)
+    while True:
+        deadline = time.time() + interval
+        # Wait until there is a full batch or the interval is over.
+        while _queue.qsize() < batch_size and time.time() < deadline:
+            time.sleep(min(0.1, interval))
+        try:
+            drain()
+        except Exception:
+            # Views went to the view counter, see ‘drain’.
+            pass
+
+@atexit.register
+def _drain_at_exit():
+    try:
+        drain()
+    except Exception:
+        pass
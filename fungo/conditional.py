@@ -0,0 +1,103 @@
+"""
+Conditional GET for pages that repeat visitors and crawlers hit most.
+
+Views build an ETag from whatever the page is made of (e.g. ‘updated’
+timestamps of category and its pages, cached leaderboards) and the user it
+is rendered for, before running list queries and rendering. If the client
+already has that version, it gets ‘304 Not Modified’ and nothing else is
+done.
+
+Only ETags are used for validation: pages differ per user, so
+modification time alone can't tell whether the client's copy is right.
+
+Every ETag also includes version of the deploy (‘deploy_version’), so that
+new markup or static bundles aren't answered with 304 for pages whose data
+hasn't changed.
+"""
+
+import hashlib
+import os
+
+from django.conf import settings
+from django.http import HttpResponseNotModified
+from django.template.utils import get_app_template_dirs
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+
+_deploy_version = None
+
+def _template_dirs():
+    for engine in settings.TEMPLATES:
+        for directory in engine.get('DIRS', []):
+            yield directory
+        if engine.get('APP_DIRS'):
+            for directory in get_app_template_dirs('templates'):
+                yield directory
+
+def _compute_deploy_version():
+    digest = hashlib.md5()
+    manifest = os.path.join(settings.STATIC_ROOT or '', 'staticfiles.json')
+    if os.path.isfile(manifest):
+        with open(manifest, 'rb') as f:
+            digest.update(f.read())
+    for directory in _template_dirs():
+        for root, dirs, files in os.walk(directory):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                digest.update('{0}\x00{1}\x00'.format(
+                    path, os.stat(path).st_mtime).encode('utf-8'))
+    return digest.hexdigest()
+
+def deploy_version():
+    """
+    Return ‘FUNGO_DEPLOY_VERSION’ if it's set, otherwise digest of the
+    static files manifest and modification times of templates. The latter
+    is computed once per process: deploys restart processes.
+    """
+    version = getattr(settings, 'FUNGO_DEPLOY_VERSION', None)
+    if version is not None:
+        return version
+    global _deploy_version
+    if _deploy_version is None:
+        _deploy_version = _compute_deploy_version()
+    return _deploy_version
+
+def make_etag(user, *parts):
+    """
+    Build ETag of content made of ‘parts’ rendered for ‘user’.
+    """
+    if user.is_authenticated():
+        who = 'u{0}'.format(user.pk)
+    else:
+        who = 'anon'
+    data = '\x00'.join([deploy_version(), who] +
+                       [str(part) for part in parts])
+    return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+def _finish(response, etag):
+    response['ETag'] = quote_etag(etag)
+    # Let browsers keep the page, but make them ask whether it's still good,
+    # and don't let shared caches keep per-user pages.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def not_modified(request, etag):
+    """
+    Return ‘304 Not Modified’ response if the client has version ‘etag’,
+    None otherwise.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return None
+    etags = parse_etags(if_none_match)
+    if etag in etags or '*' in etags:
+        return _finish(HttpResponseNotModified(), etag)
+    return None
+
+def add_etag(response, etag):
+    """
+    Add ‘etag’ to full response ‘response’.
+    """
+    return _finish(response, etag)
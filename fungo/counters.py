@@ -0,0 +1,252 @@
+"""
+View counters for categories and pages.
+
+Every hit on ‘category’ and ‘track_url’ used to do a read-modify-write on
+the whole row (‘views += 1; save()’), which costs one full UPDATE per
+request and loses increments when two requests race. Here increments go
+into an in-process buffer instead and are written out periodically as one
+‘UPDATE … SET views = views + n’ per touched row.
+
+The counter backend is pluggable, see ‘FUNGO_VIEW_COUNTER’ setting:
+
+* ‘fungo.counters.BufferedViewCounter’ (default) — write-behind buffer,
+  flushed every ‘FUNGO_VIEW_COUNTER_FLUSH_INTERVAL’ seconds by a daemon
+  thread and on process exit;
+
+* ‘fungo.counters.ImmediateViewCounter’ — no buffering, every hit is an
+  atomic ‘F()’ update right away.
+
+Counts are exact: the buffer is only touched under a lock, flushing swaps
+it out atomically, the database side uses ‘F()’ expressions so concurrent
+flushes from several processes add up, and deltas that failed to be
+written are put back into the buffer. ‘counters_changed’ is sent only
+after the increments have committed, and errors of its receivers are
+logged, not raised: what's committed must never be written again.
+
+‘manage.py flush_counters’ forces a flush: it leaves a flush request in
+the default cache which flusher threads of running processes pick up
+within a second (given the cache is shared between processes, as
+memcached is).
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from fungo.signals import counters_changed, counters_changing
+from fungo.sqlite import retry_on_locked
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COUNTER = 'fungo.counters.BufferedViewCounter'
+DEFAULT_FLUSH_INTERVAL = 10 # seconds
+FLUSH_REQUEST_KEY = 'fungo:counters:flush-request'
+
+def _label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.model_name)
+
+def increment(model, deltas, field='views'):
+    """
+    Add deltas from ‘deltas’ (mapping primary key → increment) to ‘field’ of
+    corresponding rows of ‘model’. If ‘field’ is one of ‘VISIBLE_COUNTERS’
+    of the model, its ‘updated’ timestamp is bumped too. This must be
+    called in a transaction, call ‘notify’ once it has committed.
+    ‘counters_changing’ is sent here, its receivers write in the same
+    transaction.
+    """
+    touch = field in getattr(model, 'VISIBLE_COUNTERS', ())
+    now = timezone.now()
+    for pk, n in deltas.items():
+        values = {field: F(field) + n}
+        if touch:
+            values['updated'] = now
+        model.objects.filter(pk=pk).update(**values)
+    counters_changing.send(sender=model, field=field, deltas=deltas, now=now)
+
+def notify(model, deltas, field='views', slugs=None):
+    """
+    Send ‘counters_changed’ for committed increments. Errors of receivers
+    are logged: the increments are in the database already, so whatever
+    called us must not retry them.
+    """
+    for receiver, result in counters_changed.send_robust(
+            sender=model, field=field, deltas=deltas, slugs=slugs):
+        if isinstance(result, Exception):
+            logger.error('%s failed on changed %s of %s', receiver, field,
+                         _label(model), exc_info=result)
+
+@retry_on_locked
+def write_increments(model, deltas, field='views'):
+    """
+    Like ‘increment’, but in a transaction of its own (retried if the
+    database is locked). Doesn't notify.
+    """
+    with transaction.atomic():
+        increment(model, deltas, field)
+
+def apply_increments(model, deltas, field='views'):
+    """
+    Write increments ‘deltas’ of ‘field’ in one transaction and notify.
+    """
+    write_increments(model, deltas, field)
+    notify(model, deltas, field)
+
+class ImmediateViewCounter:
+    """
+    Counter that writes every increment to the database right away.
+    """
+
+    def incr(self, model, pk, n=1):
+        apply_increments(model, {pk: n})
+
+    def pending(self, model, pk):
+        return 0
+
+    def flush(self):
+        return 0
+
+class BufferedViewCounter:
+    """
+    Write-behind counter. Increments are accumulated in memory and written
+    to the database in batches.
+    """
+
+    def __init__(self, interval=None):
+        if interval is None:
+            interval = getattr(settings,
+                               'FUNGO_VIEW_COUNTER_FLUSH_INTERVAL',
+                               DEFAULT_FLUSH_INTERVAL)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._buffer = defaultdict(int) # (model label, pk) → increment
+        self._flusher = None
+
+    def incr(self, model, pk, n=1):
+        with self._lock:
+            self._buffer[(_label(model), pk)] += n
+        if self.interval <= 0:
+            # Buffering is disabled, write it out right now.
+            self.flush()
+        else:
+            self._ensure_flusher()
+
+    def pending(self, model, pk):
+        """
+        Return increment for given object that's not yet in the database.
+        """
+        with self._lock:
+            return self._buffer.get((_label(model), pk), 0)
+
+    def flush(self):
+        """
+        Write all buffered increments to the database. Return number of rows
+        that were updated.
+        """
+        with self._lock:
+            buffer, self._buffer = self._buffer, defaultdict(int)
+        if not buffer:
+            return 0
+        by_model = defaultdict(dict)
+        for (label, pk), n in buffer.items():
+            by_model[label][pk] = n
+        while by_model:
+            label, deltas = by_model.popitem()
+            model = apps.get_model(label)
+            try:
+                write_increments(model, deltas)
+            except Exception:
+                # Don't lose anything, put the deltas (including ones we
+                # haven't got to yet) back and let the next flush try again.
+                by_model[label] = deltas
+                with self._lock:
+                    for label, deltas in by_model.items():
+                        for pk, n in deltas.items():
+                            self._buffer[(label, pk)] += n
+                raise
+            # Committed, so this is outside of the ‘try’ (and doesn't raise).
+            notify(model, deltas)
+        return len(buffer)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(target=self._run,
+                                             name='fungo-view-counter',
+                                             daemon=True)
+            self._flusher.start()
+
+    def _run(self):
+        last_flush = time.time()
+        last_request = cache.get(FLUSH_REQUEST_KEY)
+        while True:
+            time.sleep(min(self.interval, 1))
+            request = cache.get(FLUSH_REQUEST_KEY)
+            if (time.time() - last_flush < self.interval and
+                request == last_request):
+                continue
+            last_flush, last_request = time.time(), request
+            try:
+                self.flush()
+            except Exception:
+                # Deltas are back in the buffer, we'll retry next time.
+                pass
+
+_counter = None
+_counter_lock = threading.Lock()
+
+def get_counter():
+    """
+    Return process-wide view counter as configured by ‘FUNGO_VIEW_COUNTER’.
+    """
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                path = getattr(settings, 'FUNGO_VIEW_COUNTER', DEFAULT_COUNTER)
+                _counter = import_string(path)()
+    return _counter
+
+def count_view(obj, n=1):
+    """
+    Register ‘n’ views of ‘obj’ (a ‘Category’ or a ‘Page’).
+    """
+    get_counter().incr(type(obj), obj.pk, n)
+
+def pending_views(obj):
+    """
+    Return number of views of ‘obj’ that are not yet in the database.
+    """
+    return get_counter().pending(type(obj), obj.pk)
+
+def flush():
+    """
+    Write all buffered view counts to the database.
+    """
+    return get_counter().flush()
+
+def request_flush():
+    """
+    Ask flusher threads of all processes sharing the cache to flush now.
+    """
+    cache.set(FLUSH_REQUEST_KEY, time.time(), None)
+
+@atexit.register
+def _flush_at_exit():
+    if _counter is not None:
+        try:
+            _counter.flush()
+        except Exception:
+            pass
@@ -0,0 +1,66 @@
+"""
+Fragment cache for blocks shared by all pages (navbar, sidebar, title).
+
+Fragments are cached per user (or once for all anonymous users) and per
+template, since child templates override blocks inside them. Fragments
+that depend on categories also include category version in their key: the
+version is bumped whenever a category is saved or deleted (see
+‘fungo.receivers’), so stale fragments are never read again and simply
+expire. The ‘{% fragment %}’ tag that uses this lives in ‘fungo_extras’.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+DEFAULT_TIMEOUT = 600 # seconds
+CATEGORY_VERSION_KEY = 'fungo:fragments:category-version'
+
+def category_version():
+    """
+    Return current version of category data.
+    """
+    version = cache.get(CATEGORY_VERSION_KEY)
+    if version is None:
+        cache.add(CATEGORY_VERSION_KEY, 1, None)
+        version = cache.get(CATEGORY_VERSION_KEY, 1)
+    return version
+
+def bump_category_version():
+    """
+    Invalidate all fragments that depend on categories.
+    """
+    try:
+        cache.incr(CATEGORY_VERSION_KEY)
+    except ValueError:
+        # The key is missing, whatever was cached before is orphaned anyway.
+        cache.add(CATEGORY_VERSION_KEY, 1, None)
+
+def fragment_key(name, template_name, user, vary=()):
+    """
+    Build cache key for fragment ‘name’ rendered in template
+    ‘template_name’ for ‘user’. Values in ‘vary’ are added to the key.
+    """
+    if user is not None and user.is_authenticated():
+        who = 'u{0}'.format(user.pk)
+    else:
+        who = 'anon'
+    parts = [name, template_name or '', who]
+    parts += [str(v) for v in vary]
+    digest = hashlib.md5('\x00'.join(parts).encode('utf-8')).hexdigest()
+    return 'fungo:fragment:{0}:{1}'.format(name, digest)
+
+def get_or_render(key, render, timeout=None):
+    """
+    Return cached fragment under ‘key’ or call ‘render’ and cache what it
+    returns.
+    """
+    content = cache.get(key)
+    if content is None:
+        content = render()
+        if timeout is None:
+            timeout = getattr(settings, 'FUNGO_FRAGMENT_CACHE_TIMEOUT',
+                              DEFAULT_TIMEOUT)
+        cache.set(key, content, timeout)
+    return content
@@ -0,0 +1,191 @@
+"""
+Profile pictures: validation and resized variants.
+
+Uploads are checked by ‘validate_picture’ (real image of an allowed
+format, not too big in bytes or pixels). When a profile gets a new
+picture, a worker pool (‘FUNGO_PICTURE_WORKERS’ threads, Pillow releases
+the GIL while resizing) makes a square variant of it for every size in
+‘FUNGO_PICTURE_SIZES’, as JPEG (PNG if it's transparent) and WebP (if
+Pillow supports it), next to the original:
+
+    profile_images/bob.png → profile_images/variants/bob.png.small.png
+                             profile_images/variants/bob.png.small.webp
+
+so the upload request doesn't wait for it. Variants of the old picture are
+deleted. Templates link variants with ‘{% picture %}’ from ‘fungo_extras’,
+which falls back to the original until they are ready.
+"""
+
+import atexit
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+logger = logging.getLogger('fungo.images')
+
+DEFAULT_SIZES = {'small': 48, 'medium': 160, 'large': 512} # pixels
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_MAX_PIXELS = 4096 * 4096
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+VARIANTS_DIR = 'variants'
+
+_pool = None
+_pool_lock = threading.Lock()
+_pending = set()
+
+def sizes():
+    return getattr(settings, 'FUNGO_PICTURE_SIZES', DEFAULT_SIZES)
+
+def webp_supported():
+    return Image is not None and features.check('webp')
+
+def validate_picture(f):
+    """
+    Raise ‘ValidationError’ unless uploaded file ‘f’ is an acceptable
+    picture.
+    """
+    if getattr(f, '_committed', False):
+        # Stored already, it was checked when it was uploaded.
+        return
+    max_bytes = getattr(settings, 'FUNGO_PICTURE_MAX_BYTES',
+                        DEFAULT_MAX_BYTES)
+    if f.size > max_bytes:
+        raise ValidationError('Picture is too big, the limit is {0} KB.'
+                              .format(max_bytes // 1024))
+    if Image is None:
+        return
+    max_pixels = getattr(settings, 'FUNGO_PICTURE_MAX_PIXELS',
+                         DEFAULT_MAX_PIXELS)
+    try:
+        f.seek(0)
+        image = Image.open(f)
+        width, height = image.size
+        image_format = image.format
+        image.verify()
+    except Exception:
+        # Pillow raises all kinds of things on broken files (and on
+        # decompression bombs).
+        raise ValidationError('Upload a valid image.')
+    finally:
+        f.seek(0)
+    if image_format not in ALLOWED_FORMATS:
+        raise ValidationError('Upload a JPEG, PNG, GIF or WebP image.')
+    if width * height > max_pixels:
+        raise ValidationError('Picture has too many pixels.')
+
+def variant_name(name, size, ext):
+    """
+    Return storage name of variant of picture ‘name’ of ‘size’ (name from
+    ‘FUNGO_PICTURE_SIZES’) in format ‘ext’.
+    """
+    # The whole file name is kept: storage only keeps names unique with
+    # extensions, so ‘bob.png’ and ‘bob.jpg’ may belong to different users.
+    directory, filename = posixpath.split(name)
+    return posixpath.join(directory, VARIANTS_DIR,
+                          '{0}.{1}.{2}'.format(filename, size, ext))
+
+def variant_names(name):
+    """
+    Return all names variants of ‘name’ may have.
+    """
+    return [variant_name(name, size, ext)
+            for size in sizes() for ext in ('jpg', 'png', 'webp')]
+
+def _encode(image, image_format, **options):
+    out = io.BytesIO()
+    image.save(out, image_format, **options)
+    return out.getvalue()
+
+def _replace(name, content):
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(content))
+
+def make_variants(name):
+    """
+    Write variants of picture ‘name’ to storage. Return list of their
+    names.
+    """
+    with default_storage.open(name) as f:
+        image = Image.open(f)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    transparent = image.mode in ('RGBA', 'LA', 'P') and (
+        image.mode != 'P' or 'transparency' in image.info)
+    image = image.convert('RGBA' if transparent else 'RGB')
+    result = []
+    for size, pixels in sizes().items():
+        thumb = ImageOps.fit(image, (pixels, pixels), Image.LANCZOS)
+        if transparent:
+            variants = [('png', 'PNG', {'optimize': True})]
+        else:
+            variants = [('jpg', 'JPEG', {'quality': 85, 'optimize': True,
+                                         'progressive': True})]
+        if webp_supported():
+            variants.append(('webp', 'WEBP', {'quality': 80, 'method': 4}))
+        for ext, image_format, options in variants:
+            target = variant_name(name, size, ext)
+            _replace(target, _encode(thumb, image_format, **options))
+            result.append(target)
+    return result
+
+def delete_variants(name):
+    for target in variant_names(name):
+        if default_storage.exists(target):
+            default_storage.delete(target)
+
+def _process(new, old):
+    try:
+        if old:
+            delete_variants(old)
+        if new:
+            make_variants(new)
+    except Exception:
+        # The original is still there and is used instead.
+        logger.exception('Failed to process picture %s', new)
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(getattr(settings,
+                                               'FUNGO_PICTURE_WORKERS',
+                                               DEFAULT_WORKERS))
+        return _pool
+
+def picture_changed(new, old):
+    """
+    Make variants of picture ‘new’ and delete variants of picture ‘old’ in
+    the background (either can be empty).
+    """
+    if Image is None:
+        return
+    future = _get_pool().submit(_process, new, old)
+    _pending.add(future)
+    future.add_done_callback(_pending.discard)
+
+def wait():
+    """
+    Wait until all pictures submitted so far are processed.
+    """
+    for future in list(_pending):
+        future.result()
+
+def _shutdown_at_exit():
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+
+atexit.register(_shutdown_at_exit)
@@ -0,0 +1,133 @@
+"""
+Cached top-N lists (leaderboards) shown on the homepage.
+
+Instead of running ‘ORDER BY … LIMIT N’ on every homepage hit, top
+categories (by likes) and top pages (by views) are kept in the cache and
+updated incrementally when their score changes: through model save path
+(‘post_save’, ‘post_delete’) and through bulk counter updates (view count
+flushes, likes), see ‘fungo.receivers’.
+
+Updates from different processes may race, so every board is rebuilt from
+the database when it gets older than ‘FUNGO_LEADERBOARD_MAX_AGE’ seconds —
+that's the bound on how stale a board can be. In between the boards are
+served without touching the database.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from fungo.models import Category, Page
+
+DEFAULT_SIZE = 5
+DEFAULT_MAX_AGE = 60 # seconds
+
+# name → (model, score field)
+BOARDS = {
+    'categories': (Category, 'likes'),
+    'pages':      (Page, 'views'),
+}
+
+def _key(name):
+    return 'fungo:leaderboard:' + name
+
+def _size():
+    return getattr(settings, 'FUNGO_LEADERBOARD_SIZE', DEFAULT_SIZE)
+
+def _max_age():
+    return getattr(settings, 'FUNGO_LEADERBOARD_MAX_AGE', DEFAULT_MAX_AGE)
+
+def _store(name, built_at, items):
+    cache.set(_key(name), (built_at, items), _max_age())
+
+def rebuild(name):
+    """
+    Build board ‘name’ from the database and cache it.
+    """
+    model, field = BOARDS[name]
+    items = list(model.objects.order_by('-' + field)[:_size()])
+    _store(name, time.time(), items)
+    return items
+
+def invalidate():
+    """
+    Drop all boards, e.g. after bulk changes that bypass model signals.
+    """
+    cache.delete_many([_key(name) for name in BOARDS])
+
+def top(name):
+    """
+    Return list of top objects of board ‘name’.
+    """
+    entry = cache.get(_key(name))
+    if entry is None or time.time() - entry[0] > _max_age():
+        return rebuild(name)
+    return entry[1]
+
+def _boards_for(model, field=None):
+    for name, (board_model, board_field) in BOARDS.items():
+        if board_model is model and field in (None, board_field):
+            yield name, board_field
+
+def _merge(name, field, built_at, items, candidates):
+    """
+    Merge ‘candidates’ (fresh objects) into ‘items’ and store the result. If
+    an object that is already on the board lost some score, we can't know
+    who should replace it, so the board is dropped instead.
+    """
+    size = _size()
+    by_pk = {obj.pk: obj for obj in items}
+    for obj in candidates:
+        old = by_pk.get(obj.pk)
+        if old is not None and getattr(obj, field) < getattr(old, field):
+            cache.delete(_key(name))
+            return
+        if (old is not None or len(items) < size or
+            getattr(obj, field) > getattr(items[-1], field)):
+            by_pk[obj.pk] = obj
+    items = sorted(by_pk.values(), key=lambda obj: getattr(obj, field),
+                   reverse=True)[:size]
+    _store(name, built_at, items)
+
+def object_saved(obj):
+    for name, field in _boards_for(type(obj)):
+        entry = cache.get(_key(name))
+        if entry is not None:
+            _merge(name, field, entry[0], entry[1], [obj])
+
+def object_deleted(obj):
+    for name, field in _boards_for(type(obj)):
+        entry = cache.get(_key(name))
+        if entry is not None and obj.pk in [x.pk for x in entry[1]]:
+            cache.delete(_key(name))
+
+def counters_changed(model, field, deltas):
+    """
+    Apply bulk increments ‘deltas’ (primary key → increment) of ‘field’.
+    Objects that are on the board already are updated in place, others are
+    fetched (in one query) only if they could get on the board.
+    """
+    for name, field in _boards_for(model, field):
+        entry = cache.get(_key(name))
+        if entry is None:
+            continue
+        built_at, items = entry
+        on_board = {obj.pk: obj for obj in items}
+        candidates, fetch = [], []
+        for pk, n in deltas.items():
+            obj = on_board.get(pk)
+            if obj is not None:
+                # Copy, so that the comparison in ‘_merge’ sees old value.
+                new = model(**{f.attname: getattr(obj, f.attname)
+                               for f in model._meta.concrete_fields})
+                setattr(new, field, getattr(obj, field) + n)
+                candidates.append(new)
+            elif n > 0:
+                fetch.append(pk)
+        if fetch:
+            qs = model.objects.filter(pk__in=fetch)
+            if len(items) >= _size():
+                qs = qs.filter(**{field + '__gt': getattr(items[-1], field)})
+            candidates += list(qs)
+        _merge(name, field, built_at, items, candidates)
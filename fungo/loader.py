@@ -0,0 +1,254 @@
+"""
+Bulk, idempotent loader of categories and pages.
+
+Records are streamed from JSON Lines or CSV files and written in batches:
+every batch is one transaction that looks up which rows already exist (a
+few queries per batch), inserts new ones with ‘bulk_create’ and updates only
+those existing rows that actually changed. Categories are keyed by slug,
+pages by (category, title), so loading the same file twice leaves the
+database as it was after the first run. Memory use depends on batch size,
+not on size of the input.
+
+Every record is a dict with ‘type’ key:
+
+* category: ‘name’, optional ‘views’ and ‘likes’;
+
+* page: ‘category’ (name or slug of the category, it must exist or be
+  loaded earlier in the same input), ‘title’, ‘url’, optional ‘views’.
+
+Records that are not objects, of unknown type, without required keys or
+with counters that are not whole numbers are skipped.
+
+As with ‘update()’, bulk writes bypass model signals, so derived data
+(leaderboards, fragments, trending totals, cached responses, the search
+index of this process) is invalidated once loading is done, as
+‘fungo.receivers’ does on saves, and ‘Category.page_count’ of affected
+categories is recounted per batch. Search indexes of other processes
+catch up when they are rebuilt.
+"""
+
+import csv
+import json
+import re
+import time
+
+from django.db import connection, transaction
+from django.template.defaultfilters import slugify
+from django.utils import timezone
+
+from fungo import fragments, leaderboards, responsecache, search, trending
+from fungo.models import Category, Page
+
+DEFAULT_BATCH_SIZE = 1000
+
+# SQLite doesn't allow more than 999 parameters in a query, so lookups are
+# split into chunks of this size (pages need two parameters per key).
+LOOKUP_CHUNK = 400
+
+REQUIRED = {
+    'category': ('name',),
+    'page':     ('category', 'title', 'url'),
+}
+
+COUNTERS = {
+    'category': ('views', 'likes'),
+    'page':     ('views',),
+}
+
+class LoaderError(Exception):
+    pass
+
+def _chunks(xs, n=LOOKUP_CHUNK):
+    xs = list(xs)
+    for i in range(0, len(xs), n):
+        yield xs[i:i + n]
+
+def _int(value):
+    # Whole numbers only: ‘int()’ would truncate floats and take booleans.
+    if value is None or value == '':
+        return 0
+    if isinstance(value, bool):
+        raise ValueError('Not a number: {0!r}'.format(value))
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and re.match(r'\s*[-+]?\d+\s*\Z', value):
+        return int(value)
+    raise ValueError('Not a whole number: {0!r}'.format(value))
+
+def read_jsonl(f):
+    """
+    Yield records from file object ‘f’ with one JSON object per line.
+    """
+    for n, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise LoaderError('line {0}: {1}'.format(n, e))
+
+def read_csv(f):
+    """
+    Yield records from CSV file object ‘f’ with header row.
+    """
+    for row in csv.DictReader(f):
+        yield row
+
+class Stats:
+
+    def __init__(self):
+        self.created = {'category': 0, 'page': 0}
+        self.updated = {'category': 0, 'page': 0}
+        self.unchanged = {'category': 0, 'page': 0}
+        self.skipped = 0
+        self.started = time.time()
+
+    @property
+    def rows(self):
+        return (sum(self.created.values()) + sum(self.updated.values()) +
+                sum(self.unchanged.values()))
+
+    @property
+    def rate(self):
+        elapsed = time.time() - self.started
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return ('{0} rows ({1} categories and {2} pages created, {3} '
+                'categories and {4} pages updated, {5} unchanged, {6} '
+                'skipped) in {7:.1f} s, {8:.0f} rows/s').format(
+                    self.rows,
+                    self.created['category'], self.created['page'],
+                    self.updated['category'], self.updated['page'],
+                    sum(self.unchanged.values()), self.skipped,
+                    time.time() - self.started, self.rate)
+
+def _load_categories(records, stats):
+    by_slug = {}
+    for r in records:
+        by_slug[slugify(r['name'])] = r # last one wins
+    existing = {}
+    for chunk in _chunks(by_slug):
+        for pk, slug, name, views, likes in (
+                Category.objects.filter(slug__in=chunk)
+                .values_list('id', 'slug', 'name', 'views', 'likes')):
+            existing[slug] = (pk, name, views, likes)
+    new = []
+    for slug, r in by_slug.items():
+        values = (r['name'], max(0, _int(r.get('views'))), _int(r.get('likes')))
+        if slug not in existing:
+            new.append(Category(slug=slug, name=values[0], views=values[1],
+                                likes=values[2]))
+        elif existing[slug][1:] != values:
+            Category.objects.filter(pk=existing[slug][0]).update(
+                name=values[0], views=values[1], likes=values[2],
+                updated=timezone.now())
+            stats.updated['category'] += 1
+        else:
+            stats.unchanged['category'] += 1
+    Category.objects.bulk_create(new)
+    stats.created['category'] += len(new)
+
+def _existing_pages(keys):
+    # Look up (category, title) pairs with one row-value ‘IN’, i.e. one
+    # probe of the (category, title) index per pair. The ORM can't express
+    # this and an equivalent OR of conditions is slow to build.
+    table = connection.ops.quote_name(Page._meta.db_table)
+    sql = ('SELECT id, category_id, title, url, views FROM {0} '
+           'WHERE (category_id, title) IN (VALUES {1})'
+           .format(table, ', '.join(['(%s, %s)'] * len(keys))))
+    params = [x for key in keys for x in key]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+def _recount_pages(category_ids):
+    # New pages come in bulk, bypassing ‘Page.save’, so their categories
+    # are recounted, in the same transaction. Recounting (rather than
+    # adding) is right even if the count was off before.
+    category = connection.ops.quote_name(Category._meta.db_table)
+    page = connection.ops.quote_name(Page._meta.db_table)
+    for chunk in _chunks(category_ids):
+        sql = ('UPDATE {0} SET page_count = (SELECT COUNT(*) FROM {1} '
+               'WHERE {1}.category_id = {0}.id) WHERE id IN ({2})'
+               .format(category, page, ', '.join(['%s'] * len(chunk))))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, chunk)
+
+def _load_pages(records, stats):
+    # Pages usually come grouped by category, slugify every name just once.
+    slugs = {name: slugify(name) for name in {r['category'] for r in records}}
+    cat_ids = {}
+    for chunk in _chunks(set(slugs.values())):
+        cat_ids.update(Category.objects.filter(slug__in=chunk)
+                       .values_list('slug', 'id'))
+    by_key = {}
+    for r in records:
+        cat_id = cat_ids.get(slugs[r['category']])
+        if cat_id is None:
+            stats.skipped += 1
+            continue
+        by_key[(cat_id, r['title'])] = r # last one wins
+    existing = {}
+    for chunk in _chunks(by_key):
+        for pk, cat_id, title, url, views in _existing_pages(chunk):
+            existing[(cat_id, title)] = (pk, url, views)
+    new = []
+    for (cat_id, title), r in by_key.items():
+        values = (r['url'], _int(r.get('views')))
+        if (cat_id, title) not in existing:
+            new.append(Page(category_id=cat_id, title=title, url=values[0],
+                            views=values[1]))
+        elif existing[(cat_id, title)][1:] != values:
+            Page.objects.filter(pk=existing[(cat_id, title)][0]).update(
+                url=values[0], views=values[1], updated=timezone.now())
+            stats.updated['page'] += 1
+        else:
+            stats.unchanged['page'] += 1
+    Page.objects.bulk_create(new)
+    stats.created['page'] += len(new)
+    _recount_pages({page.category_id for page in new})
+
+def load(records, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Load ‘records’ (an iterable of dicts, see module docstring) into the
+    database, ‘batch_size’ records per transaction. ‘progress’, if given, is
+    called with ‘Stats’ after every batch. Return ‘Stats’.
+    """
+    stats = Stats()
+    batch = {'category': [], 'page': []}
+
+    def flush():
+        with transaction.atomic():
+            # Categories go first, pages in the same batch may refer to them.
+            if batch['category']:
+                _load_categories(batch['category'], stats)
+            if batch['page']:
+                _load_pages(batch['page'], stats)
+        batch['category'], batch['page'] = [], []
+        if progress is not None:
+            progress(stats)
+
+    for r in records:
+        kind = r.get('type') if isinstance(r, dict) else None
+        if kind not in batch or not all(r.get(k) for k in REQUIRED[kind]):
+            stats.skipped += 1
+            continue
+        try:
+            counts = {k: _int(r.get(k)) for k in COUNTERS[kind]}
+        except (TypeError, ValueError):
+            stats.skipped += 1
+            continue
+        batch[kind].append(dict(r, **counts))
+        if len(batch['category']) + len(batch['page']) >= batch_size:
+            flush()
+    if batch['category'] or batch['page']:
+        flush()
+
+    leaderboards.invalidate()
+    fragments.bump_category_version()
+    trending.invalidate()
+    responsecache.invalidate_all()
+    search.reset()
+    return stats
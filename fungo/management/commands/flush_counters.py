@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from fungo import counters
+
+class Command(BaseCommand):
+    help = 'Write buffered view counts of categories and pages to database.'
+
+    def handle(self, *args, **options):
+        # Our own buffer is written right here, running processes flush
+        # theirs as soon as they notice the request.
+        n = counters.flush()
+        counters.request_flush()
+        self.stdout.write('Flushed view counts of {0} object(s), requested '
+                          'flush from running processes.'.format(n))
@@ -0,0 +1,52 @@
+import io
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fungo import loader
+
+class Command(BaseCommand):
+    help = ('Load categories and pages from JSON Lines or CSV files. '
+            'Existing rows are updated, so loading is idempotent.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', metavar='FILE',
+                            help="Input file, ‘-’ means standard input.")
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            help='Input format (guessed from file extension '
+                            'by default).')
+        parser.add_argument('--batch-size', type=int,
+                            default=loader.DEFAULT_BATCH_SIZE,
+                            help='Number of records per transaction.')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('Batch size must be positive.')
+        for path in options['files']:
+            fmt = options['format'] or self.guess_format(path)
+            read = loader.read_csv if fmt == 'csv' else loader.read_jsonl
+            if path == '-':
+                f = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8',
+                                     newline='')
+            else:
+                f = open(path, encoding='utf-8', newline='')
+            try:
+                stats = loader.load(read(f), batch_size, self.progress)
+            except loader.LoaderError as e:
+                raise CommandError('{0}: {1}'.format(path, e))
+            finally:
+                f.close()
+            self.stdout.write('{0}: {1}'.format(path, stats))
+
+    def guess_format(self, path):
+        if os.path.splitext(path)[1].lower() == '.csv':
+            return 'csv'
+        return 'jsonl'
+
+    def progress(self, stats):
+        if self.verbosity > 1:
+            self.stdout.write('… {0} rows, {1:.0f} rows/s'
+                              .format(stats.rows, stats.rate))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fungo import routers
+
+class Command(BaseCommand):
+    help = ('Copy the primary database onto the read replica (stand-in for '
+            'real replication of SQLite databases).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep copying every that many seconds.')
+
+    def handle(self, *args, **options):
+        target = routers.replica_alias()
+        if target == routers.DEFAULT_DB_ALIAS:
+            raise CommandError('No replica, set FUNGO_REPLICA_DATABASE.')
+        while True:
+            routers.replicate(target=target)
+            if options['verbosity'] > 1:
+                self.stdout.write('Replicated to {0}.'.format(target))
+            if options['interval'] <= 0:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from fungo import trending
+
+class Command(BaseCommand):
+    help = ('Roll hourly hit buckets older than retention up into daily '
+            'ones and delete expired daily buckets (run it from cron).')
+
+    def handle(self, *args, **options):
+        n = trending.roll_up()
+        if options['verbosity'] > 1:
+            self.stdout.write('Rolled up {0} hourly buckets.'.format(n))
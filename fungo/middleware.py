@@ -0,0 +1,148 @@
+"""
+Per-request instrumentation and database routing.
+
+‘RequestStatsMiddleware’ measures number of SQL queries and time spent in
+them, template render time, total time and response size of every request
+and records them per view in ‘fungo.stats’. Every request is also logged
+to ‘fungo.requests’ logger (DEBUG level), requests over query budget are
+logged with WARNING level.
+
+Query budgets are set per view with ‘FUNGO_QUERY_BUDGETS’ setting, a dict
+that maps dotted view names (e.g. ‘fungo.views.index’) to maximal number
+of queries; ‘default’ applies to all other views.
+
+To see queries without DEBUG, the middleware turns on query logging of
+database connections for the duration of the request.
+
+‘ReplicaPinningMiddleware’ tells ‘fungo.routers’ where reads of a request
+should go and pins clients that have written something to the primary
+database for a while.
+"""
+
+import functools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends import django as django_backend
+
+from fungo import routers, stats
+
+logger = logging.getLogger('fungo.requests')
+
+_local = threading.local()
+
+def _install_template_timer():
+    ## Time rendering of templates by wrapping ‘render’ of Django template
+    ## backend. Only the outermost render is timed, nested ones (included
+    ## in it) are not counted twice.
+    template_class = django_backend.Template
+    if getattr(template_class.render, 'fungo_timed', False):
+        return
+    original = template_class.render
+
+    @functools.wraps(original)
+    def render(self, *args, **kwargs):
+        state = getattr(_local, 'state', None)
+        if state is None or state['rendering']:
+            return original(self, *args, **kwargs)
+        state['rendering'] = True
+        start = time.time()
+        try:
+            return original(self, *args, **kwargs)
+        finally:
+            state['template_time'] += time.time() - start
+            state['rendering'] = False
+
+    render.fungo_timed = True
+    template_class.render = render
+
+def view_name(view_func):
+    name = getattr(view_func, '__name__', type(view_func).__name__)
+    return '{0}.{1}'.format(view_func.__module__, name)
+
+def query_budget(view):
+    budgets = getattr(settings, 'FUNGO_QUERY_BUDGETS', {})
+    return budgets.get(view, budgets.get('default'))
+
+class RequestStatsMiddleware:
+
+    def __init__(self):
+        _install_template_timer()
+
+    def process_request(self, request):
+        conns = {}
+        for conn in connections.all():
+            conns[conn.alias] = (conn.force_debug_cursor,
+                                 len(conn.queries_log))
+            conn.force_debug_cursor = True
+        _local.state = {
+            'start':         time.time(),
+            'view':          'unresolved',
+            'connections':   conns,
+            'rendering':     False,
+            'template_time': 0.0,
+        }
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = getattr(_local, 'state', None)
+        if state is not None:
+            state['view'] = view_name(view_func)
+
+    def process_response(self, request, response):
+        state = getattr(_local, 'state', None)
+        if state is None:
+            return response
+        _local.state = None
+        queries, sql_time = 0, 0.0
+        for conn in connections.all():
+            forced, start = state['connections'].get(conn.alias, (False, 0))
+            for query in list(conn.queries_log)[start:]:
+                queries += 1
+                sql_time += float(query['time'])
+            conn.force_debug_cursor = forced
+        total_time = time.time() - state['start']
+        if response.streaming:
+            size = 0
+        else:
+            size = len(response.content)
+        view = state['view']
+        budget = query_budget(view)
+        over_budget = budget is not None and queries > budget
+        stats.record_request(view,
+                             queries=queries,
+                             sql_time=sql_time,
+                             template_time=state['template_time'],
+                             total_time=total_time,
+                             size=size,
+                             over_budget=over_budget)
+        message = ('%s %s (%s): %d queries, %.1f ms SQL, %.1f ms templates, '
+                   '%.1f ms total, %d bytes')
+        args = (request.method, request.path, view, queries, sql_time * 1000,
+                state['template_time'] * 1000, total_time * 1000, size)
+        if over_budget:
+            logger.warning(message + ', over budget of %d queries',
+                           *(args + (budget,)))
+        else:
+            logger.debug(message, *args)
+        return response
+
+class ReplicaPinningMiddleware:
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def process_request(self, request):
+        routers.start_request(
+            pinned=(request.method not in self.SAFE_METHODS or
+                    routers.PIN_COOKIE in request.COOKIES))
+
+    def process_response(self, request, response):
+        if not routers.end_request():
+            return response
+        if routers.replica_alias() != routers.DEFAULT_DB_ALIAS:
+            response.set_cookie(routers.PIN_COOKIE, '1',
+                                max_age=routers.pin_seconds(),
+                                httponly=True)
+        return response
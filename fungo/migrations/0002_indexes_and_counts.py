@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fungo', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='page_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='voter_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='likes',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='views',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='page',
+            name='views',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterIndexTogether(
+            name='page',
+            index_together=set([('category', 'views'), ('category', 'title')]),
+        ),
+        # Fill in the denormalized counts.
+        migrations.RunSQL(
+            ['UPDATE fungo_category SET '
+             'page_count = (SELECT COUNT(*) FROM fungo_page '
+             'WHERE fungo_page.category_id = fungo_category.id), '
+             'voter_count = (SELECT COUNT(*) FROM fungo_vote '
+             'WHERE fungo_vote.category_id = fungo_category.id)'],
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fungo', '0003_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyHits',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('day', models.DateField(db_index=True)),
+                ('hits', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(to='fungo.Category')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily hits',
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyHits',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('hour', models.DateTimeField(db_index=True)),
+                ('hits', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(to='fungo.Category')),
+            ],
+            options={
+                'verbose_name_plural': 'Hourly hits',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='hourlyhits',
+            unique_together=set([('category', 'hour')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyhits',
+            unique_together=set([('category', 'day')]),
+        ),
+    ]
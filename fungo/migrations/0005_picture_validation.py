@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import fungo.images
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fungo', '0004_hits'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='picture',
+            field=models.ImageField(blank=True, validators=[fungo.images.validate_picture], upload_to='profile_images'),
+        ),
+    ]
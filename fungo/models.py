@@ -1,23 +1,68 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.template.defaultfilters import slugify
 from django.utils import timezone
 from django.contrib.auth.models import User
 import datetime
 
+from fungo.images import validate_picture
+
 # Models
 
+class CategoryQuerySet(models.QuerySet):
+
+    def with_like_state(self, user):
+        """
+        Add ‘liked_by_user’ (1 or 0) to every category: whether ‘user’ has
+        liked it. This is a subquery (a probe of the unique index on votes),
+        not a query per category. Number of pages is in ‘page_count’ column
+        already.
+        """
+        if user is None or not user.is_authenticated():
+            return self.extra(select={'liked_by_user': '0'})
+        sql = ('EXISTS (SELECT 1 FROM {0} WHERE {0}.category_id = {1}.id '
+               'AND {0}.user_id = %s)'
+               .format(Vote._meta.db_table, Category._meta.db_table))
+        return self.extra(select={'liked_by_user': sql},
+                          select_params=[user.pk])
+
 class Category(models.Model):
     name   = models.CharField(max_length=128, unique=True)
-    views  = models.IntegerField(default=0)
-    likes  = models.IntegerField(default=0)
-    voters = models.ManyToManyField(User)
+    # Both are sort keys of the homepage and search, hence the indexes.
+    views  = models.IntegerField(default=0, db_index=True)
+    likes  = models.IntegerField(default=0, db_index=True)
+    voters = models.ManyToManyField(User, through='Vote')
     slug   = models.SlugField(unique=True)
 
+    # Denormalized counts, so they can be shown (and sorted by) without
+    # counting related rows. They are kept up to date in the same
+    # transaction as changes of pages and votes: see ‘Page.save’,
+    # ‘fungo.receivers’, ‘fungo.votes’ and ‘fungo.loader’.
+    page_count  = models.IntegerField(default=0, editable=False)
+    voter_count = models.IntegerField(default=0, editable=False)
+
+    # When anything shown on category page changed last, for conditional
+    # GET (see ‘fungo.conditional’). Bulk updates set it explicitly.
+    updated = models.DateTimeField(auto_now=True)
+
+    # Counters that are shown on pages: bulk increments of these bump
+    # ‘updated’, see ‘fungo.counters’. Views of categories are not shown.
+    VISIBLE_COUNTERS = ('likes',)
+
+    objects = CategoryQuerySet.as_manager()
+
+    def __init__(self, *args, **kwargs):
+        models.Model.__init__(self, *args, **kwargs)
+        # Renaming changes the slug, and the page under the old one has to
+        # be dropped from the response cache, see ‘fungo.receivers’.
+        self._saved_slug = self.__dict__.get('slug')
+
     def save(self, *args, **kwargs):
         self.slug = slugify(self.name)
         if self.views < 0:
             self.views = 0;
         models.Model.save(self, *args, **kwargs)
+        self._saved_slug = self.slug
 
     def __str__(self):
         return self.name
@@ -25,22 +70,119 @@ class Category(models.Model):
     class Meta:
         verbose_name_plural = "Categories"
 
+class Vote(models.Model):
+    # One row per (user, category) pair, the unique index makes both the
+    # “has this user liked it?” lookup and double-like protection cheap.
+    user     = models.ForeignKey(User)
+    category = models.ForeignKey(Category)
+
+    def __str__(self):
+        return '{0} → {1}'.format(self.user, self.category)
+
+    class Meta:
+        unique_together = ('user', 'category')
+
 class Page(models.Model):
     category = models.ForeignKey(Category)
     title = models.CharField(max_length=128)
     url = models.URLField()
-    views = models.IntegerField(default=0)
+    views = models.IntegerField(default=0, db_index=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    VISIBLE_COUNTERS = ('views',)
+
+    def __init__(self, *args, **kwargs):
+        models.Model.__init__(self, *args, **kwargs)
+        # Remember where the page was, so we know which ‘page_count’ to fix
+        # when it's moved to another category. Don't touch the attribute if
+        # it's deferred, that would cost a query.
+        self._saved_category_id = self.__dict__.get('category_id')
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            models.Model.save(self, *args, **kwargs)
+            if adding:
+                self._add_to_count(self.category_id, 1)
+            elif self._saved_category_id not in (None, self.category_id):
+                self._add_to_count(self._saved_category_id, -1)
+                self._add_to_count(self.category_id, 1)
+        self._saved_category_id = self.category_id
+
+    @staticmethod
+    def _add_to_count(category_id, n):
+        Category.objects.filter(pk=category_id).update(
+            page_count=F('page_count') + n)
 
     def __str__(self):
         return self.title
 
+    class Meta:
+        # Pages are looked up by (category, title) when loading data in bulk,
+        # see ‘fungo.loader’, and listed by views within category.
+        index_together = [('category', 'title'), ('category', 'views')]
+
+class DailyClicks(models.Model):
+    # Outbound clicks on a page per day, aggregated by ‘fungo.clicks’.
+    page   = models.ForeignKey(Page)
+    day    = models.DateField()
+    clicks = models.IntegerField(default=0)
+
+    def __str__(self):
+        return '{0} on {1}: {2}'.format(self.page, self.day, self.clicks)
+
+    class Meta:
+        unique_together = ('page', 'day')
+        verbose_name_plural = "Daily clicks"
+
+class HourlyHits(models.Model):
+    # Views of a category and clicks on its pages during an hour (‘hour’ is
+    # its start), for trending rankings, see ‘fungo.trending’. Buckets older
+    # than retention are rolled up into ‘DailyHits’.
+    category = models.ForeignKey(Category)
+    hour     = models.DateTimeField(db_index=True)
+    hits     = models.IntegerField(default=0)
+
+    def __str__(self):
+        return '{0} at {1}: {2}'.format(self.category, self.hour, self.hits)
+
+    class Meta:
+        unique_together = ('category', 'hour')
+        verbose_name_plural = "Hourly hits"
+
+class DailyHits(models.Model):
+    # Rolled up ‘HourlyHits’.
+    category = models.ForeignKey(Category)
+    day      = models.DateField(db_index=True)
+    hits     = models.IntegerField(default=0)
+
+    def __str__(self):
+        return '{0} on {1}: {2}'.format(self.category, self.day, self.hits)
+
+    class Meta:
+        unique_together = ('category', 'day')
+        verbose_name_plural = "Daily hits"
+
 class UserProfile(models.Model):
     # This line is required. Links ‘UserProfile’ to a User model instance.
     user = models.OneToOneField(User)
 
     # The additional attributes we wish to include.
     website = models.URLField(blank=True)
-    picture = models.ImageField(upload_to='profile_images', blank=True)
+    # Resized variants are made in the background, see ‘fungo.images’.
+    picture = models.ImageField(upload_to='profile_images', blank=True,
+                                validators=[validate_picture])
+
+    def __init__(self, *args, **kwargs):
+        models.Model.__init__(self, *args, **kwargs)
+        # Variants of the old picture go when it's replaced, see
+        # ‘fungo.receivers’.
+        picture = self.__dict__.get('picture')
+        self._saved_picture = getattr(picture, 'name', picture)
+
+    def save(self, *args, **kwargs):
+        models.Model.save(self, *args, **kwargs)
+        self._saved_picture = self.picture.name
 
     def __str__(self):
         return self.user.username
@@ -0,0 +1,170 @@
+"""
+Keyset (cursor) pagination.
+
+OFFSET pagination gets linearly slower for deep pages, because the database
+still has to walk all the skipped rows, and computing total number of pages
+requires counting the whole set. Here pages are addressed by opaque cursors
+that remember a value of the ordering key where the page starts (or ends),
+so every page is fetched with ‘WHERE key > value ORDER BY key LIMIT n’
+which is an index range scan no matter how deep the page is.
+
+Total count (used only to show number of the last page) is approximate: it
+is cached for a while instead of being recounted on every request.
+
+The ordering key must be unique (e.g. ‘username’), otherwise rows with
+equal keys on page boundary may be skipped.
+"""
+
+from django.core import signing
+from django.core.cache import cache
+
+CURSOR_SALT = 'fungo.pagination'
+
+def encode_cursor(direction, value, number):
+    """
+    Build opaque cursor. ‘direction’ is ‘a’ (rows after ‘value’) or ‘b’
+    (rows before ‘value’), ‘value’ of None means beginning or end of the
+    set respectively, ‘number’ is number of the page (for display only).
+    """
+    return signing.dumps([direction, value, number], salt=CURSOR_SALT,
+                         compress=True)
+
+def decode_cursor(cursor):
+    """
+    Inverse of ‘encode_cursor’. Raise ‘ValueError’ if cursor is malformed.
+    """
+    try:
+        direction, value, number = signing.loads(cursor, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if direction not in ('a', 'b') or not isinstance(number, int):
+        raise ValueError('Invalid cursor')
+    return direction, value, number
+
+def cached_count(queryset, key, timeout=60):
+    """
+    Return approximate number of rows in ‘queryset’: the exact number is
+    computed once and then cached under ‘key’ for ‘timeout’ seconds.
+    """
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+def pages_total(count, per_page):
+    return max(1, (count + per_page - 1) // per_page)
+
+class KeysetPage:
+
+    def __init__(self, object_list, number, cursor, has_next, has_previous,
+                 next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.number = number
+        self.cursor = cursor
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+class KeysetPaginator:
+    """
+    Paginate ‘queryset’ by unique field ‘key’, ‘per_page’ rows on a page.
+    """
+
+    def __init__(self, queryset, key, per_page):
+        self.queryset = queryset
+        self.key = key
+        self.per_page = per_page
+
+    def _after(self, value):
+        qs = self.queryset
+        if value is not None:
+            qs = qs.filter(**{self.key + '__gt': value})
+        return qs.order_by(self.key)
+
+    def _before(self, value):
+        qs = self.queryset
+        if value is not None:
+            qs = qs.filter(**{self.key + '__lt': value})
+        return qs.order_by('-' + self.key)
+
+    def page(self, cursor=None):
+        """
+        Return page identified by ‘cursor’ (first page if it's None). Raise
+        ‘ValueError’ if cursor is malformed.
+        """
+        if cursor:
+            direction, value, number = decode_cursor(cursor)
+        else:
+            direction, value, number = 'a', None, 1
+        n = self.per_page
+        if direction == 'a':
+            rows = list(self._after(value)[:n + 1])
+            has_next = len(rows) > n
+            has_previous = value is not None
+            rows = rows[:n]
+        else:
+            rows = list(self._before(value)[:n + 1])
+            has_previous = len(rows) > n
+            has_next = value is not None
+            rows = rows[:n][::-1]
+        if not has_previous:
+            number = 1
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor('a', self._key_of(rows[-1]),
+                                        number + 1)
+        if rows and has_previous:
+            previous_cursor = encode_cursor('b', self._key_of(rows[0]),
+                                            number - 1)
+        return KeysetPage(rows, number, cursor, has_next, has_previous,
+                          next_cursor, previous_cursor)
+
+    def _key_of(self, obj):
+        return getattr(obj, self.key)
+
+    def window(self, page, total, radius=3):
+        """
+        Return list of (page number, cursor) pairs for pages around ‘page’
+        (at most ‘radius’ pages in each direction) plus the first and the
+        last page. ‘total’ is (approximate) number of pages. Only keys of
+        rows inside the window are fetched.
+        """
+        n = self.per_page
+        result = [(page.number, page.cursor)]
+        # One extra key tells whether the farthest page is non-empty.
+        limit = (radius - 1) * n + 1
+        if page.object_list and page.has_next:
+            last = self._key_of(page.object_list[-1])
+            keys = list(self._after(last)
+                        .values_list(self.key, flat=True)[:limit])
+            bounds = [last] + keys[n - 1::n]
+            for j, value in enumerate(bounds[:radius], start=1):
+                if len(keys) <= (j - 1) * n:
+                    break
+                result.append((page.number + j,
+                               encode_cursor('a', value, page.number + j)))
+        if page.object_list and page.has_previous:
+            first = self._key_of(page.object_list[0])
+            keys = list(self._before(first)
+                        .values_list(self.key, flat=True)[:limit])
+            bounds = [first] + keys[n - 1::n]
+            for j, value in enumerate(bounds[:radius], start=1):
+                if page.number - j < 1 or len(keys) <= (j - 1) * n:
+                    break
+                result.append((page.number - j,
+                               encode_cursor('b', value, page.number - j)))
+        numbers = [number for number, cursor in result]
+        if page.has_previous and 1 not in numbers:
+            result.append((1, None))
+        if page.has_next and total > max(numbers):
+            result.append((total, encode_cursor('b', None, total)))
+        result.sort(key=lambda x: x[0])
+        return result
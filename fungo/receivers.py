@@ -0,0 +1,131 @@
+"""
+Signal receivers that keep derived data (search index, cached leaderboards,
+fragments and responses, cached page URLs, denormalized counts, hit
+buckets) in sync with models, and set up new database connections.
+"""
+
+from django.core.urlresolvers import reverse
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from fungo import (clicks, fragments, images, leaderboards, responsecache,
+                   search, sqlite, trending)
+from fungo.models import Category, Page, User, UserProfile, Vote
+from fungo.signals import counters_changed, counters_changing
+
+def invalidate_responses(slugs):
+    """
+    Drop cached responses of category pages with ‘slugs’ and of the
+    homepage, which lists top categories and pages.
+    """
+    responsecache.invalidate(reverse('index'))
+    for slug in set(slugs):
+        if slug:
+            responsecache.invalidate(reverse('category', args=[slug]))
+
+def invalidate_category_responses(category_ids, slugs=None):
+    """
+    Like ‘invalidate_responses’, for categories with ‘category_ids’. Their
+    slugs are looked up unless ‘slugs’ (id → slug) has them all.
+    """
+    if slugs is None or not all(pk in slugs for pk in category_ids):
+        slugs = dict(Category.objects.filter(pk__in=category_ids)
+                     .values_list('pk', 'slug'))
+    invalidate_responses(slugs[pk] for pk in category_ids if pk in slugs)
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    search.category_saved(instance)
+    leaderboards.object_saved(instance)
+    fragments.bump_category_version()
+    trending.invalidate()
+    invalidate_responses([instance.slug, instance._saved_slug])
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    search.category_deleted(instance)
+    leaderboards.object_deleted(instance)
+    fragments.bump_category_version()
+    trending.invalidate()
+    invalidate_responses([instance.slug])
+
+@receiver(post_save, sender=Page)
+def page_saved(sender, instance, **kwargs):
+    leaderboards.object_saved(instance)
+    clicks.forget_url(instance.pk)
+    # Suggestions show number of pages.
+    search.invalidate_suggestions()
+    # The page may have been moved from another category.
+    invalidate_category_responses(
+        {instance.category_id, instance._saved_category_id})
+
+@receiver(post_delete, sender=Page)
+def page_deleted(sender, instance, **kwargs):
+    # Deletion runs in a transaction, so the count is fixed atomically
+    # with it, queryset deletes included.
+    Category.objects.filter(pk=instance.category_id).update(
+        page_count=F('page_count') - 1, updated=timezone.now())
+    leaderboards.object_deleted(instance)
+    clicks.forget_url(instance.pk)
+    search.invalidate_suggestions()
+    invalidate_category_responses([instance.category_id])
+
+@receiver(post_delete, sender=Vote)
+def vote_deleted(sender, instance, **kwargs):
+    # Whether the user can like it has changed.
+    Category.objects.filter(pk=instance.category_id).update(
+        voter_count=F('voter_count') - 1, updated=timezone.now())
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        responsecache.invalidate(reverse('all_users'))
+
+@receiver(post_save, sender=UserProfile)
+def profile_saved(sender, instance, **kwargs):
+    if instance.picture.name != instance._saved_picture:
+        images.picture_changed(instance.picture.name, instance._saved_picture)
+
+@receiver(post_delete, sender=UserProfile)
+def profile_deleted(sender, instance, **kwargs):
+    if instance.picture.name:
+        images.picture_changed(None, instance.picture.name)
+
+# Hit buckets are written in the transaction of the views, so they are
+# retried (or rolled back) together with them.
+
+@receiver(counters_changing, sender=Category)
+def category_counters_changing(sender, field, deltas, now, **kwargs):
+    if field == 'views':
+        trending.add_hits(deltas, now)
+
+@receiver(counters_changing, sender=Page)
+def page_counters_changing(sender, field, deltas, now, **kwargs):
+    if field == 'views':
+        # Views of pages are clicks on them, see ‘fungo.clicks’.
+        trending.add_hits(trending.category_hits(deltas), now)
+
+@receiver(counters_changed, sender=Category)
+def category_counters_changed(sender, field, deltas, slugs=None, **kwargs):
+    if field == 'views':
+        search.views_changed(deltas)
+        trending.hits_added(deltas)
+    leaderboards.counters_changed(sender, field, deltas)
+    if field in Category.VISIBLE_COUNTERS:
+        invalidate_category_responses(deltas, slugs)
+
+@receiver(counters_changed, sender=Page)
+def page_counters_changed(sender, field, deltas, **kwargs):
+    if field == 'views':
+        trending.hits_added(trending.category_hits(deltas))
+    leaderboards.counters_changed(sender, field, deltas)
+    if field in Page.VISIBLE_COUNTERS:
+        invalidate_responses(Category.objects.filter(page__pk__in=deltas)
+                             .values_list('slug', flat=True))
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    sqlite.configure_connection(connection)
@@ -0,0 +1,248 @@
+"""
+Response cache for pages that logged-out visitors get.
+
+Views decorated with ‘cache_anonymous’ keep full responses to anonymous
+GET requests in an in-process LRU cache limited by number of entries and
+total size (‘FUNGO_RESPONSE_CACHE_MAX_ENTRIES’ and
+‘FUNGO_RESPONSE_CACHE_MAX_BYTES’). An entry is keyed by path, query
+string and whatever the view varies on (e.g. visit count on the about
+page). A request is anonymous if it has no session cookie, so telling
+doesn't cost a session lookup.
+
+Invalidation is per path: every path has a version in the shared cache,
+so all processes see it. Saving or deleting a category or a page, as well
+as changes of counters shown on pages (likes of categories, views of
+pages), drop the category's page and the homepage only, see
+‘fungo.receivers’. Bulk changes (‘fungo.loader’) drop everything at once
+with ‘invalidate_all’, which bumps a generation shared by all paths.
+Entries also expire after
+‘FUNGO_RESPONSE_CACHE_TIMEOUT’, which bounds staleness of pages rendered
+from a lagging read replica.
+
+Cookies are not cached. Things that must happen on every request (view
+counting, visit tracking) are registered by the view with ‘on_hit’ and
+are done for cached responses too. Hits and misses are counted in
+‘fungo.stats’.
+"""
+
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.http import parse_etags
+
+from fungo import conditional, stats
+
+DEFAULT_MAX_ENTRIES = 500
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_TIMEOUT = 60 # seconds
+
+class Entry:
+
+    def __init__(self, path, version, response, hooks, timeout):
+        self.path = path
+        self.version = version
+        self.status = response.status_code
+        self.content = response.content
+        self.headers = list(response.items())
+        self.etag = None
+        if response.has_header('ETag'):
+            self.etag = parse_etags(response['ETag'])[0]
+        self.hooks = hooks
+        self.expires = time.time() + timeout
+        self.size = len(self.content) + sum(len(k) + len(v)
+                                            for k, v in self.headers)
+
+    def response(self):
+        """
+        Build a new response, hooks may set cookies on it.
+        """
+        response = HttpResponse(self.content, status=self.status)
+        for header, value in self.headers:
+            response[header] = value
+        return response
+
+class LRUCache:
+    """
+    Entries by key, least recently used are evicted first when there are
+    more than ‘max_entries’ of them or their size exceeds ‘max_bytes’.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, max_entries, max_bytes):
+        if entry.size > max_bytes:
+            return
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = entry
+            self.size += entry.size
+            while len(self.entries) > max_entries or self.size > max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def drop_path(self, path):
+        with self.lock:
+            for key in [k for k, e in self.entries.items() if e.path == path]:
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+_cache = LRUCache()
+
+def _setting(name, default):
+    return getattr(settings, 'FUNGO_RESPONSE_CACHE_' + name, default)
+
+GENERATION_KEY = 'fungo:response:generation'
+
+def _version_key(path):
+    digest = hashlib.md5(path.encode('utf-8')).hexdigest()
+    return 'fungo:response:version:{0}'.format(digest)
+
+def path_version(path):
+    """
+    Return current version of ‘path’ (together with the generation), None
+    if it's not known.
+    """
+    key = _version_key(path)
+    values = cache.get_many([GENERATION_KEY, key])
+    if key not in values:
+        return None
+    return values.get(GENERATION_KEY), values[key]
+
+def _ensure_version(path):
+    # Start from a value that's unlikely to have been used before, so that
+    # entries made before the shared cache was cleared don't match again.
+    start = int(time.time() * 1000000)
+    cache.add(GENERATION_KEY, start, None)
+    cache.add(_version_key(path), start, None)
+    return path_version(path)
+
+def invalidate(path):
+    """
+    Drop cached responses of ‘path’ in all processes.
+    """
+    try:
+        cache.incr(_version_key(path))
+    except ValueError:
+        # No version, so no entry can match it anyway.
+        pass
+    _cache.drop_path(path)
+
+def invalidate_all():
+    """
+    Drop cached responses of all paths in all processes.
+    """
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # No generation, so no entry can match it anyway.
+        pass
+    _cache.clear()
+
+def clear():
+    """
+    Drop all cached responses of this process.
+    """
+    _cache.clear()
+
+def on_hit(response, hook):
+    """
+    Call ‘hook’ with request and response whenever a cached copy of
+    ‘response’ is served.
+    """
+    if not hasattr(response, 'fungo_hit_hooks'):
+        response.fungo_hit_hooks = []
+    response.fungo_hit_hooks.append(hook)
+    return response
+
+def is_anonymous(request):
+    return settings.SESSION_COOKIE_NAME not in request.COOKIES
+
+def _cache_key(request, vary):
+    # Deploy version is in ETags of cached responses, see ‘fungo.conditional’.
+    parts = [conditional.deploy_version(), request.path,
+             request.META.get('QUERY_STRING', '')]
+    parts += [str(v) for v in vary]
+    return '\x00'.join(parts)
+
+def _cacheable(request, response):
+    return (response.status_code == 200 and not response.streaming and
+            # The page has a CSRF token of this client.
+            not request.META.get('CSRF_COOKIE_USED') and
+            # The request has logged somebody in or the like.
+            settings.SESSION_COOKIE_NAME not in response.cookies)
+
+def _serve(request, entry):
+    if entry.etag is not None:
+        response = conditional.not_modified(request, entry.etag)
+        if response is not None:
+            return response
+    return entry.response()
+
+def cache_anonymous(view=None, vary=None):
+    """
+    Serve anonymous GET requests of ‘view’ from the response cache.
+    ‘vary’, if given, returns things besides the URL that the response
+    depends on.
+    """
+    if view is None:
+        return functools.partial(cache_anonymous, vary=vary)
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (request.method != 'GET' or not is_anonymous(request) or
+                not _setting('ENABLED', True)):
+            return view(request, *args, **kwargs)
+        key = _cache_key(request, vary(request) if vary else ())
+        entry = _cache.get(key)
+        if entry is not None:
+            if (entry.expires > time.time() and
+                    entry.version == path_version(entry.path)):
+                stats.incr('response_cache.hits')
+                response = _serve(request, entry)
+                for hook in entry.hooks:
+                    hook(request, response)
+                return response
+            _cache.delete(key)
+        stats.incr('response_cache.misses')
+        # Taken before rendering: if the path is invalidated meanwhile, what
+        # we render may be stale already.
+        version = _ensure_version(request.path)
+        response = view(request, *args, **kwargs)
+        if _cacheable(request, response):
+            entry = Entry(request.path, version, response,
+                          getattr(response, 'fungo_hit_hooks', []),
+                          _setting('TIMEOUT', DEFAULT_TIMEOUT))
+            _cache.set(key, entry,
+                       _setting('MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+                       _setting('MAX_BYTES', DEFAULT_MAX_BYTES))
+        return response
+
+    return wrapper
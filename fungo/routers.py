@@ -0,0 +1,120 @@
+"""
+Read/write splitting between the primary database and a read replica.
+
+With ‘FUNGO_REPLICA_DATABASE’ set to an alias from ‘DATABASES’,
+‘ReplicaRouter’ sends reads done while serving a request to the replica,
+all writes go to the primary (‘default’). Reads go to the primary when:
+
+* we are not serving a request (management commands, background writers
+  of counters and clicks), since these read what they are going to write;
+
+* the request is not GET/HEAD/OPTIONS;
+
+* the request or a request shortly before it has written something: after
+  a write ‘ReplicaPinningMiddleware’ sets a cookie that pins the client to
+  the primary for ‘FUNGO_REPLICA_PIN_SECONDS’ (read-your-writes, e.g. a
+  like shows up immediately), that's how long replication may lag.
+
+Sessions are always read from and written to the primary and don't pin.
+
+Replication itself is outside of Django's business, ‘replicate’ is a stand-in
+that copies one SQLite database onto another (see ‘manage.py replicate’).
+"""
+
+import os
+import sqlite3
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+DEFAULT_PIN_SECONDS = 10
+PIN_COOKIE = 'fungo_primary'
+
+# Apps whose data must never be read stale.
+PRIMARY_ONLY_APPS = {'sessions'}
+
+_local = threading.local()
+
+def replica_alias():
+    alias = getattr(settings, 'FUNGO_REPLICA_DATABASE', None)
+    if alias is None or alias not in connections.databases:
+        return DEFAULT_DB_ALIAS
+    return alias
+
+def pin_seconds():
+    return getattr(settings, 'FUNGO_REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS)
+
+def start_request(pinned):
+    """
+    Start serving a request, reads go to the replica unless ‘pinned’.
+    """
+    _local.pinned = pinned
+    _local.wrote = False
+
+def end_request():
+    """
+    Stop serving a request, return True if it has written something.
+    """
+    wrote = getattr(_local, 'wrote', False)
+    _local.__dict__.pop('pinned', None)
+    _local.wrote = False
+    return wrote
+
+def is_pinned():
+    return getattr(_local, 'pinned', True)
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS or is_pinned():
+            return DEFAULT_DB_ALIAS
+        return replica_alias()
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in PRIMARY_ONLY_APPS:
+            # Whatever the rest of this request reads should see the write.
+            _local.wrote = True
+            if hasattr(_local, 'pinned'):
+                _local.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Schema gets to the replica with data.
+        return db == DEFAULT_DB_ALIAS
+
+def replicate(source=DEFAULT_DB_ALIAS, target=None):
+    """
+    Copy SQLite database ‘source’ onto ‘target’ (by default the replica).
+    This is a stand-in for real replication, good for development and
+    tests.
+    """
+    if target is None:
+        target = replica_alias()
+    if target == source:
+        return
+    src = connections[source]
+    dst = connections[target]
+    src.ensure_connection()
+    if hasattr(sqlite3.Connection, 'backup'):
+        # Online backup writes pages into the existing file, so other open
+        # connections to the replica see the new data.
+        dst.ensure_connection()
+        src.connection.backup(dst.connection)
+        return
+    # Older Python: write a fresh copy and swap it in. Connections of other
+    # processes keep reading the old copy until they reconnect.
+    path = dst.settings_dict['NAME']
+    tmp = path + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    src.connection.execute('VACUUM INTO ?', (tmp,))
+    dst.close()
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.replace(tmp, path)
@@ -0,0 +1,316 @@
+"""
+In-memory substring search over category names.
+
+Sidebar search used to run ‘name__contains’ on every keystroke, which is a
+full table scan plus a sort on ‘views’. Here we keep a trigram index over
+lower-cased names together with view counts, so a query is answered by
+intersecting a few posting lists and picking top-k candidates by views.
+
+Queries that are too short to have a trigram use posting lists of one-
+and two-letter grams: short lists (rare grams) are ranked on the spot,
+for long ones (common grams) categories are walked in order of views
+until ‘k’ matches are found, which stops early as most names match. That
+order is re-sorted in a background thread after view counts change, at
+most every ‘RANK_REFRESH’ seconds, and swapped in when it's ready;
+searches use the previous order meanwhile.
+
+The index is built lazily from the database and kept up to date
+incrementally: ‘Category’ saves and deletes, and view count flushes (see
+‘fungo.receivers’) are applied as they happen. Changes made by other
+processes are picked up when the index gets older than
+‘FUNGO_SEARCH_INDEX_MAX_AGE’ seconds and is rebuilt.
+
+Matching is case-insensitive, as ‘name__contains’ is on SQLite.
+
+Suggestions (the JSON sidebar search, see ‘suggest’) are the same for
+everybody, so they are also kept in an LRU cache: lower-cased query → top
+categories. The cache is versioned: any change of categories (including
+views and number of pages) bumps the version and older entries are not
+used again. Rebuilding the index does it too, so changes made by other
+processes get to the cache with the index.
+"""
+
+import heapq
+import operator
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+
+from fungo.models import Category
+
+DEFAULT_MAX_AGE = 300 # seconds
+DEFAULT_SUGGEST_CACHE_SIZE = 1000 # entries
+
+# Re-sorting all categories by views after every view count flush would be
+# too expensive, so the order used for walking is refreshed at most this
+# often (seconds).
+RANK_REFRESH = 5
+
+def _trigrams(s):
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+def _short_grams(s):
+    # One- and two-letter grams.
+    return set(s).union(map(operator.add, s, s[1:]))
+
+class CategoryIndex:
+    """
+    Trigram index over category names with view counts for ranking.
+    """
+
+    def __init__(self, rows=()):
+        self._lock = threading.RLock()
+        self._names = {} # id → lower-cased name
+        self._views = {} # id → views
+        # gram → list of ids, trigrams and one- and two-letter grams. Lists
+        # are append-only, stale entries (of deleted or renamed categories)
+        # are filtered out on lookup, which is much cheaper than keeping
+        # sets.
+        self._grams = defaultdict(list)
+        self._short = defaultdict(list)
+        self._ranked = [] # ids by views, descending, as of last ‘rank’
+        self._ranked_at = 0
+        self._added = None # ids added while ‘rank’ is sorting
+        self._ranking = None # timer of scheduled ‘rank’
+        self.built_at = time.time()
+        for pk, name, views in rows:
+            self._add(pk, name, views)
+        self.rank()
+
+    def __len__(self):
+        return len(self._names)
+
+    def _add(self, pk, name, views):
+        name = name.lower()
+        if pk not in self._names:
+            self._ranked.append(pk)
+            if self._added is not None:
+                self._added.append(pk)
+        self._names[pk] = name
+        self._views[pk] = views
+        grams, short = self._grams, self._short
+        for gram in _trigrams(name):
+            grams[gram].append(pk)
+        for gram in _short_grams(name):
+            short[gram].append(pk)
+
+    def update(self, pk, name, views):
+        """
+        Add category or update its name and views.
+        """
+        with self._lock:
+            if self._names.get(pk) == name.lower():
+                self._views[pk] = views
+            else:
+                self._add(pk, name, views)
+            self._schedule_rank()
+
+    def remove(self, pk):
+        with self._lock:
+            self._names.pop(pk, None)
+            self._views.pop(pk, None)
+
+    def bump(self, pk, n):
+        """
+        Add ‘n’ to views of category ‘pk’ (if we know about it).
+        """
+        with self._lock:
+            if pk in self._views:
+                self._views[pk] += n
+                self._schedule_rank()
+
+    def _schedule_rank(self):
+        # Called with the lock held.
+        if self._ranking is None:
+            delay = max(0, self._ranked_at + RANK_REFRESH - time.time())
+            self._ranking = threading.Timer(delay, self.rank)
+            self._ranking.daemon = True
+            self._ranking.start()
+
+    def rank(self):
+        """
+        Sort categories by views for walking. The sort itself runs without
+        the lock, searches use the old order until the new one is swapped
+        in.
+        """
+        with self._lock:
+            self._ranking = None
+            views = dict(self._views)
+            self._added = []
+        ranked = sorted(views, key=views.__getitem__, reverse=True)
+        with self._lock:
+            # Categories added while we were sorting.
+            ranked.extend(self._added)
+            self._ranked, self._added = ranked, None
+            self._ranked_at = time.time()
+
+    def _candidates(self, query):
+        postings = []
+        for gram in _trigrams(query):
+            ids = self._grams.get(gram)
+            if not ids:
+                return ()
+            postings.append(ids)
+        postings.sort(key=len)
+        result = set(postings[0])
+        for ids in postings[1:]:
+            result.intersection_update(ids)
+            if not result:
+                break
+        return result
+
+    def search(self, query, k=5):
+        """
+        Return ids of top ‘k’ (by views) categories whose names contain
+        ‘query’.
+        """
+        if k <= 0:
+            return []
+        query = query.lower()
+        names = self._names
+        with self._lock:
+            if len(query) >= 3:
+                candidates = self._candidates(query)
+            else:
+                candidates = self._short.get(query, ()) if query else names
+                # Ranking n candidates costs n, walking categories in order
+                # of views until k of them match costs about k · N / n.
+                if len(candidates) ** 2 > k * len(names):
+                    return self._walk(query, k)
+            matches = {pk for pk in candidates
+                       if pk in names and query in names[pk]}
+            return heapq.nlargest(k, matches, key=self._views.__getitem__)
+
+    def _walk(self, query, k):
+        names = self._names
+        result = []
+        for pk in self._ranked:
+            name = names.get(pk)
+            if name is not None and query in name and pk not in result:
+                result.append(pk)
+                if len(result) == k:
+                    break
+        return result
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    """
+    Return process-wide category index, (re)building it from the database
+    when it doesn't exist yet or is too old.
+    """
+    global _index
+    max_age = getattr(settings, 'FUNGO_SEARCH_INDEX_MAX_AGE', DEFAULT_MAX_AGE)
+    index = _index
+    if index is None or time.time() - index.built_at > max_age:
+        with _index_lock:
+            if _index is index:
+                rows = (Category.objects.values_list('id', 'name', 'views')
+                        .iterator())
+                _index = CategoryIndex(rows)
+                _suggestions.invalidate()
+            index = _index
+    return index
+
+def search_categories(query, k=5, user=None):
+    """
+    Return list of top ‘k’ (by views) categories whose names contain
+    ‘query’, with ‘liked_by_user’ for ‘user’ (see ‘CategoryQuerySet’).
+    """
+    ids = get_index().search(query, k)
+    cats = Category.objects.with_like_state(user).in_bulk(ids)
+    return [cats[pk] for pk in ids if pk in cats]
+
+class SuggestCache:
+    """
+    LRU cache of suggestions, at most ‘size’ entries. Entries made before
+    the last ‘invalidate’ are not returned.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key → (version, value)
+        self.version = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != self.version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, version, value, size):
+        with self._lock:
+            if version != self.version:
+                # Computed from data that has changed since.
+                return
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+_suggestions = SuggestCache()
+
+def suggest(query, k=5):
+    """
+    Return list of top ‘k’ (by views) categories whose names contain
+    ‘query’ as dicts with ‘id’, ‘name’, ‘slug’ and ‘page_count’. This is the
+    same for all users, so it's cached.
+    """
+    key = (query.lower(), k)
+    result = _suggestions.get(key)
+    if result is None:
+        index = get_index()
+        # Taken after the index is (re)built, that invalidates the cache.
+        version = _suggestions.version
+        ids = index.search(query, k)
+        rows = {}
+        if ids:
+            rows = {row['id']: row for row in Category.objects
+                    .filter(pk__in=ids)
+                    .values('id', 'name', 'slug', 'page_count')}
+        result = [rows[pk] for pk in ids if pk in rows]
+        size = getattr(settings, 'FUNGO_SUGGEST_CACHE_SIZE',
+                       DEFAULT_SUGGEST_CACHE_SIZE)
+        _suggestions.set(key, version, result, size)
+    return result
+
+def invalidate_suggestions():
+    _suggestions.invalidate()
+
+# Incremental updates, these are called from ‘fungo.receivers’. If the index
+# is not built yet there's nothing to update: it will be built from the
+# database anyway.
+
+def category_saved(category):
+    invalidate_suggestions()
+    if _index is not None:
+        _index.update(category.pk, category.name, category.views)
+
+def category_deleted(category):
+    invalidate_suggestions()
+    if _index is not None:
+        _index.remove(category.pk)
+
+def views_changed(deltas):
+    invalidate_suggestions()
+    if _index is not None:
+        for pk, n in deltas.items():
+            _index.bump(pk, n)
+
+def reset():
+    """
+    Drop the index, it will be rebuilt on next search.
+    """
+    global _index
+    _index = None
+    invalidate_suggestions()
@@ -0,0 +1,17 @@
+"""
+Fungo's own signals, receivers live in ‘fungo.receivers’.
+"""
+
+from django.dispatch import Signal
+
+# Sent when counter columns were changed in bulk with ‘F()’ updates, which
+# bypass ‘post_save’. ‘sender’ is the model class, ‘field’ is name of the
+# column and ‘deltas’ maps primary keys to increments. ‘slugs’, if the
+# sender knows them, maps primary keys to slugs and saves receivers a
+# lookup.
+counters_changed = Signal(providing_args=['field', 'deltas', 'slugs'])
+
+# Sent by ‘fungo.counters.increment’ inside of the transaction that changes
+# counters, for writes that must commit (or be retried) together with the
+# counters. Arguments are the same, plus ‘now’, time of the change.
+counters_changing = Signal(providing_args=['field', 'deltas', 'now'])
@@ -0,0 +1,84 @@
+"""
+SQLite tuning for production.
+
+Every new SQLite connection is configured with PRAGMAs from
+‘FUNGO_SQLITE_PRAGMAS’ (see ‘configure_connection’, called on
+‘connection_created’ from ‘fungo.receivers’). Defaults enable write-ahead
+log, so readers don't block writers and vice versa, with
+‘synchronous=NORMAL’ (safe in WAL mode, only the last transactions may be
+lost on power failure), memory-mapped I/O, bigger page cache and a busy
+timeout, so that a connection waits for the write lock instead of failing
+right away.
+
+Busy timeout doesn't help when a transaction that has read something wants
+to write and another connection is writing: SQLite fails with “database is
+locked” immediately to avoid deadlock. Short write transactions are
+wrapped with ‘retry_on_locked’ that runs them again after a short pause.
+"""
+
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous':  'NORMAL',
+    'mmap_size':    256 * 1024 * 1024, # bytes
+    'cache_size':   -64 * 1024,        # negative means KiB
+    'busy_timeout': 5000,              # ms
+}
+DEFAULT_RETRIES = 5
+RETRY_DELAY = 0.01 # seconds, doubled after every attempt
+
+def pragmas():
+    return getattr(settings, 'FUNGO_SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+
+def configure_connection(connection):
+    """
+    Apply ‘FUNGO_SQLITE_PRAGMAS’ to new connection ‘connection’.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    # Use the underlying connection, so that this doesn't show up in logs
+    # and query counts of whatever code happened to open the connection.
+    for name, value in pragmas().items():
+        connection.connection.execute('PRAGMA {0} = {1}'.format(name, value))
+
+def is_locked(error):
+    return 'database is locked' in str(error)
+
+def retry_on_locked(func=None, using=DEFAULT_DB_ALIAS):
+    """
+    Decorator that runs ‘func’ again when it fails because the database is
+    locked. ‘func’ should be a whole transaction: if it's called inside of
+    another one, the error is re-raised, the outer transaction is the one to
+    retry.
+    """
+    if func is None:
+        return functools.partial(retry_on_locked, using=using)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, 'FUNGO_SQLITE_LOCKED_RETRIES',
+                          DEFAULT_RETRIES)
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if (not is_locked(e) or attempt >= retries or
+                    connections[using].in_atomic_block):
+                    raise
+            attempt += 1
+            delay = RETRY_DELAY * 2 ** attempt * random.uniform(0.5, 1.5)
+            logger.debug('%s: database is locked, retry %d in %.3f s',
+                         func.__name__, attempt, delay)
+            time.sleep(delay)
+
+    return wrapper
@@ -0,0 +1,106 @@
+"""
+In-process request statistics.
+
+‘fungo.middleware.RequestStatsMiddleware’ records for every request the
+number of SQL queries, total SQL time, template render time, total time
+and response size, aggregated per view into counters and histograms.
+Other components can keep their own named counters here too. Everything
+can be seen as JSON at the ‘stats’ URL (staff only).
+
+Statistics are per process and are lost on restart.
+"""
+
+import bisect
+import threading
+from collections import defaultdict
+
+# Upper bounds of histogram buckets, the last bucket is unbounded.
+TIME_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000] # ms
+QUERY_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100]
+
+class Histogram:
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+
+    def as_dict(self):
+        labels = ['<={0}'.format(b) for b in self.bounds]
+        labels.append('>{0}'.format(self.bounds[-1]))
+        return dict(zip(labels, self.counts))
+
+class ViewStats:
+
+    def __init__(self):
+        self.requests = 0
+        self.over_budget = 0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.total_time = 0.0
+        self.bytes = 0
+        self.time_histogram = Histogram(TIME_BUCKETS)
+        self.query_histogram = Histogram(QUERY_BUCKETS)
+
+    def add(self, queries, sql_time, template_time, total_time, size,
+            over_budget):
+        self.requests += 1
+        self.over_budget += over_budget
+        self.queries += queries
+        self.sql_time += sql_time
+        self.template_time += template_time
+        self.total_time += total_time
+        self.bytes += size
+        self.time_histogram.add(total_time * 1000)
+        self.query_histogram.add(queries)
+
+    def as_dict(self):
+        n = self.requests or 1
+        return {
+            'requests':          self.requests,
+            'over_budget':       self.over_budget,
+            'queries_avg':       self.queries / n,
+            'sql_ms_avg':        self.sql_time * 1000 / n,
+            'template_ms_avg':   self.template_time * 1000 / n,
+            'total_ms_avg':      self.total_time * 1000 / n,
+            'bytes_avg':         self.bytes / n,
+            'time_ms_histogram': self.time_histogram.as_dict(),
+            'queries_histogram': self.query_histogram.as_dict(),
+        }
+
+_lock = threading.Lock()
+_views = defaultdict(ViewStats)
+_counters = defaultdict(int)
+
+def record_request(view, **kwargs):
+    """
+    Add measurements of one request served by ‘view’ (see ‘ViewStats.add’
+    for keyword arguments).
+    """
+    with _lock:
+        _views[view].add(**kwargs)
+
+def incr(name, n=1):
+    """
+    Increment named counter ‘name’.
+    """
+    with _lock:
+        _counters[name] += n
+
+def snapshot():
+    """
+    Return all statistics as a JSON-serializable dict.
+    """
+    with _lock:
+        return {
+            'views':    {view: s.as_dict() for view, s in _views.items()},
+            'counters': dict(_counters),
+        }
+
+def reset():
+    with _lock:
+        _views.clear()
+        _counters.clear()
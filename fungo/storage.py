@@ -0,0 +1,137 @@
+"""
+Static files storage that prepares assets for long-term caching.
+
+On top of what ‘ManifestStaticFilesStorage’ does (content hash in file
+names, rewritten references in CSS, manifest used by ‘{% static %}’),
+‘collectstatic’ with this storage:
+
+* builds bundles from ‘FUNGO_STATIC_BUNDLES’: every bundle is concatenation
+  of its source files, minified (CSS always, JS if ‘rjsmin’ is installed),
+  and then it's hashed as any other file;
+
+* writes precompressed siblings of hashed text files: ‘.gz’ always, ‘.br’
+  if ‘brotli’ is installed, for the web server to serve as they are.
+
+Hashed file names never change content, so the web server can serve them
+with far-future ‘Expires’/‘Cache-Control’. Use ‘{% static_bundle %}’ from
+‘fungo_extras’ to link bundles: until ‘collectstatic’ is run (development,
+tests) it links the source files one by one.
+"""
+
+import gzip
+import io
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.txt', '.eot', '.ttf', '.ico')
+MIN_COMPRESS_SIZE = 256 # bytes, smaller files are not worth it
+
+def bundles():
+    return getattr(settings, 'FUNGO_STATIC_BUNDLES', {})
+
+def minify_css(css):
+    """
+    Remove comments and needless whitespace from ‘css’.
+    """
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+def minify_js(js):
+    if rjsmin is None:
+        return js
+    return rjsmin.jsmin(js)
+
+def build_bundle(name, sources, read):
+    """
+    Return content of bundle ‘name’ made of ‘sources’, ‘read’ returns
+    content of a source file by its name.
+    """
+    parts = [read(source) for source in sources]
+    if name.endswith('.css'):
+        return minify_css('\n'.join(parts))
+    # Semicolons keep statements of different files apart.
+    return minify_js(';\n'.join(parts))
+
+def gzip_bytes(data):
+    out = io.BytesIO()
+    # Fixed mtime, so that the same input gives the same output.
+    with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=9,
+                       mtime=0) as f:
+        f.write(data)
+    return out.getvalue()
+
+class FungoStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # No manifest entry and no file to hash: ‘collectstatic’ hasn't
+            # been run. That's fine in development only, in production an
+            # unhashed name would be cached forever.
+            if settings.DEBUG:
+                return name
+            raise
+
+    def has_hashed(self, name):
+        """
+        Return True if ‘collectstatic’ has produced hashed ‘name’.
+        """
+        return self.hash_key(name) in self.hashed_files
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        for name, sources in bundles().items():
+            content = build_bundle(
+                name, sources,
+                lambda source: self._read_source(paths, source))
+            if self.exists(name):
+                self.delete(name)
+            self._save(name, ContentFile(content.encode('utf-8')))
+            paths[name] = (self, name)
+        for name, hashed_name, processed in super().post_process(
+                paths, dry_run, **options):
+            if hashed_name is not None and not isinstance(processed,
+                                                          Exception):
+                self._compress(hashed_name)
+            yield name, hashed_name, processed
+
+    def _read_source(self, paths, name):
+        storage, path = paths[name]
+        with storage.open(path) as f:
+            return f.read().decode(settings.FILE_CHARSET)
+
+    def _compress(self, name):
+        if not name.endswith(COMPRESSIBLE):
+            return
+        with self.open(name) as f:
+            data = f.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        variants = [('.gz', gzip_bytes)]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress))
+        for suffix, compress in variants:
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                continue
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(compressed))
@@ -1,8 +1,114 @@
 from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+from fungo import fragments, images, storage
 from fungo.models import Category
 
 register = template.Library()
 
-@register.inclusion_tag('fungo/cats.html')
-def get_category_list(cat=None):
-    return {'cats': Category.objects.all(), 'act_cat': cat}
+@register.inclusion_tag('fungo/cats.html', takes_context=True)
+def get_category_list(context, cat=None):
+    cats = Category.objects.with_like_state(context.get('user'))
+    return {'cats': cats, 'act_cat': cat}
+
+class FragmentNode(template.Node):
+
+    def __init__(self, nodelist, name, versioned, vary):
+        self.nodelist = nodelist
+        self.name = name
+        self.versioned = versioned
+        self.vary = vary
+
+    def render(self, context):
+        vary = [fe.resolve(context) for fe in self.vary]
+        if self.versioned:
+            vary.append(fragments.category_version())
+        template_name = getattr(context.template, 'name', None)
+        key = fragments.fragment_key(self.name.resolve(context),
+                                     template_name,
+                                     context.get('user'),
+                                     vary)
+        return fragments.get_or_render(key,
+                                       lambda: self.nodelist.render(context))
+
+@register.tag(name='fragment')
+def do_fragment(parser, token):
+    """
+    Cache enclosed part of template, see ‘fungo.fragments’:
+
+        {% fragment "name" [versioned] [value ...] %}
+        …
+        {% endfragment %}
+
+    Fragment is cached per user and template it's rendered in. With
+    ‘versioned’ it's also dropped when any category changes. Additional
+    values are added to cache key.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(
+            "'%s' tag requires at least one argument (fragment name)"
+            % bits[0])
+    name, rest = parser.compile_filter(bits[1]), bits[2:]
+    versioned = bool(rest) and rest[0] == 'versioned'
+    if versioned:
+        rest = rest[1:]
+    vary = [parser.compile_filter(bit) for bit in rest]
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(nodelist, name, versioned, vary)
+
+@register.simple_tag
+def static_bundle(name):
+    """
+    Link static bundle ‘name’ (CSS or JS), see ‘fungo.storage’:
+
+        {% static_bundle 'js/fungo.js' %}
+
+    Once ‘collectstatic’ has built the bundle, this is one tag with hashed
+    URL of the bundle. Otherwise, and always with DEBUG (bundles are not
+    served by ‘runserver’ then), source files are linked one by one.
+    """
+    has_hashed = getattr(staticfiles_storage, 'has_hashed', None)
+    if not settings.DEBUG and has_hashed is not None and has_hashed(name):
+        urls = [staticfiles_storage.url(name)]
+    else:
+        urls = [staticfiles_storage.url(source)
+                for source in storage.bundles()[name]]
+    if name.endswith('.css'):
+        html = '<link href="{0}" rel="stylesheet">'
+    else:
+        html = '<script src="{0}"></script>'
+    return mark_safe('\n    '.join(format_html(html, url) for url in urls))
+
+@register.simple_tag
+def picture(picture, size='medium', alt=''):
+    """
+    Show profile picture ‘picture’ (value of ‘UserProfile.picture’) of
+    ‘size’ from ‘FUNGO_PICTURE_SIZES’, see ‘fungo.images’:
+
+        {% picture profile.picture 'small' alt=user_name %}
+
+    The WebP variant is offered to browsers that take it, others get JPEG
+    or PNG. Until the variants are made, the original is shown scaled
+    down.
+    """
+    if not picture:
+        return ''
+    pixels = images.sizes()[size]
+    sources, src = [], picture.url
+    for ext, mime in (('webp', 'image/webp'), ('png', None), ('jpg', None)):
+        name = images.variant_name(picture.name, size, ext)
+        if default_storage.exists(name):
+            if mime is None:
+                src = default_storage.url(name)
+                break
+            sources.append(format_html('<source srcset="{0}" type="{1}">',
+                                       default_storage.url(name), mime))
+    img = format_html('<img src="{0}" width="{1}" height="{1}" alt="{2}">',
+                      src, pixels, alt)
+    return format_html('<picture>{0}{1}</picture>',
+                       mark_safe(''.join(sources)), img)
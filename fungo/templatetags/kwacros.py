@@ -44,6 +44,12 @@ Usage example:
     default arg1 default arg2 Default baz
     new f,o,o,b,a,r diff kwarg
 
+   Arguments are only visible inside the macro, they don't leak into the
+   calling template. Add ‘only’ to render the macro without access to the
+   calling template's variables at all:
+
+    {% usekwacro test2args1kwarg "foo" "bar" only %}
+
 4) Alternatively save your macros in a separate
    file, e.g. "mymacros.html" and load it to the
    current template with:
@@ -54,14 +60,72 @@ Usage example:
 Bear in mind that defined and loaded kwacros are local
 to each template file and are not inherited
 through {% extends ... %} tags.
+
+Macro libraries loaded with {% loadkwacros %} are parsed once per process
+and shared by all templates that load them. With DEBUG on, a library is
+re-parsed when its file changes (judging by mtime).
 """
 
+import os
+import threading
+
 from django import template
-from django.template.base import FilterExpression
+from django.conf import settings
+from django.template import Context
+from django.template.engine import Engine
 from django.template.loader import get_template
 
 register = template.Library()
 
+# Registry of parsed macro libraries: filename → (path, mtime, macros).
+_libraries = {}
+_libraries_lock = threading.RLock()
+
+
+def _find_library_path(filename):
+    ## Find file the library is loaded from, so that we can watch its
+    ## mtime. None if we can't tell (e.g. it's not loaded from a file).
+    try:
+        engine = Engine.get_default()
+    except Exception:
+        return None
+    for loader in engine.template_loaders:
+        for l in getattr(loader, 'loaders', [loader]):
+            sources = getattr(l, 'get_template_sources', None)
+            if sources is None:
+                continue
+            for path in sources(filename):
+                if os.path.isfile(path):
+                    return path
+    return None
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except (OSError, TypeError):
+        return None
+
+
+def _load_library(filename):
+    ## Return dict of macros defined in template ‘filename’, parsing it
+    ## only if it's not in the registry yet (or has changed, in debug).
+    entry = _libraries.get(filename)
+    if entry is not None:
+        path, mtime, macros = entry
+        if not settings.DEBUG or path is None or _mtime(path) == mtime:
+            return macros
+    with _libraries_lock:
+        path = _find_library_path(filename)
+        mtime = _mtime(path)
+        t = get_template(filename)
+        ## Backend templates wrap the actual compiled template.
+        nodelist = getattr(t, 'template', t).nodelist
+        macros = {macro.name: macro
+                  for macro in nodelist.get_nodes_by_type(DefineMacroNode)}
+        _libraries[filename] = (path, mtime, macros)
+    return macros
+
 
 def _setup_macros_dict(parser):
     ## Metadata of each macro are stored in a new attribute
@@ -75,7 +139,7 @@ def _setup_macros_dict(parser):
 
 
 class DefineMacroNode(template.Node):
-    def __init__(self, name, nodelist, args):
+    def __init__(self, name, nodelist, args, parser):
 
         self.name = name
         self.nodelist = nodelist
@@ -85,8 +149,9 @@ class DefineMacroNode(template.Node):
             if "=" not in a:
                 self.args.append(a)
             else:
+                ## Default values are compiled once, here.
                 name, value = a.split("=")
-                self.kwargs[name] = value
+                self.kwargs[name] = parser.compile_filter(value)
 
     def render(self, context):
         ## empty string - {% macro %} tag does no output
@@ -111,7 +176,8 @@ def do_macro(parser, token):
     ## of 'parser' class. That way we can access it later
     ## in the template when processing 'usemacro' tags.
     _setup_macros_dict(parser)
-    parser._macros[macro_name] = DefineMacroNode(macro_name, nodelist, args)
+    parser._macros[macro_name] = DefineMacroNode(macro_name, nodelist, args,
+                                                 parser)
     return parser._macros[macro_name]
 
 
@@ -131,42 +197,53 @@ def do_loadmacros(parser, token):
         raise template.TemplateSyntaxError(m)
     if filename[0] in ('"', "'") and filename[-1] == filename[0]:
         filename = filename[1:-1]
-    t = get_template(filename)
-    macros = t.nodelist.get_nodes_by_type(DefineMacroNode)
+    macros = _load_library(filename)
     ## Metadata of each macro are stored in a new attribute
     ## of 'parser' class. That way we can access it later
     ## in the template when processing 'usemacro' tags.
     _setup_macros_dict(parser)
-    for macro in macros:
-        parser._macros[macro.name] = macro
+    parser._macros.update(macros)
     return LoadMacrosNode()
 
 
+def _isolated(context, scope):
+    ## Bare context that holds only ‘scope’ and shares the rest (render
+    ## context, template, settings) with ‘context’. ‘context.new()’ would
+    ## copy the whole render context on every call.
+    isolated = Context.__new__(Context)
+    isolated.__dict__.update(context.__dict__)
+    isolated._reset_dicts(scope)
+    return isolated
+
+
 class UseMacroNode(template.Node):
 
-    def __init__(self, macro, fe_args, fe_kwargs):
+    def __init__(self, macro, fe_args, fe_kwargs, only=False):
         self.macro = macro
         self.fe_args = fe_args
         self.fe_kwargs = fe_kwargs
+        self.only = only
+        ## Slot table: (name, expression) for every macro parameter, in
+        ## order, computed once here so that rendering is a single pass.
+        ## Missing positional arguments have no expression and become "".
+        self.slots = []
+        for i, arg in enumerate(macro.args):
+            fe = fe_args[i] if i < len(fe_args) else None
+            self.slots.append((arg, fe))
+        for name, default in macro.kwargs.items():
+            self.slots.append((name, fe_kwargs.get(name, default)))
 
     def render(self, context):
-
-        for i, arg in enumerate(self.macro.args):
-            try:
-                fe = self.fe_args[i]
-                context[arg] = fe.resolve(context)
-            except IndexError:
-                context[arg] = ""
-
-        for name, default in iter(self.macro.kwargs.items()):
-            if name in self.fe_kwargs:
-                context[name] = self.fe_kwargs[name].resolve(context)
-            else:
-                context[name] = FilterExpression(default,
-                                                 self.macro.parser
-                ).resolve(context)
-
-        return self.macro.nodelist.render(context)
+        ## Arguments are resolved in the caller's context, then the macro
+        ## body is rendered in one scope pushed on top of it (or, with
+        ## ‘only’, in a fresh context), so nothing leaks to the caller.
+        scope = {}
+        for name, fe in self.slots:
+            scope[name] = fe.resolve(context) if fe is not None else ""
+        if self.only:
+            return self.macro.nodelist.render(_isolated(context, scope))
+        with context.push(scope):
+            return self.macro.nodelist.render(context)
 
 
 @register.tag(name="usekwacro")
@@ -184,6 +261,10 @@ def do_usemacro(parser, token):
         m = "Macro '%s' is not defined" % macro_name
         raise template.TemplateSyntaxError(m)
 
+    only = bool(values) and values[-1] == "only"
+    if only:
+        values = values[:-1]
+
     fe_kwargs = {}
     fe_args = []
 
@@ -191,10 +272,9 @@ def do_usemacro(parser, token):
         if "=" in val:
             # kwarg
             name, value = val.split("=")
-            fe_kwargs[name] = FilterExpression(value, parser)
+            fe_kwargs[name] = parser.compile_filter(value)
         else:  # arg
             # no validation, go for it ...
-            fe_args.append(FilterExpression(val, parser))
+            fe_args.append(parser.compile_filter(val))
 
-    macro.parser = parser
-    return UseMacroNode(macro, fe_args, fe_kwargs)
+    return UseMacroNode(macro, fe_args, fe_kwargs, only)
@@ -0,0 +1,138 @@
+"""
+Test helpers that keep number of queries and rows fetched by views in
+check.
+
+‘QueryBudgetMixin.assertQueryBudget’ is like Django's ‘assertNumQueries’,
+but it also counts rows fetched from the database and fails if there are
+more than given bound. Exact number of queries catches per-row lookups
+(N+1), bound on rows catches unbounded queries like
+‘Category.objects.all()’ that return the same number of queries no matter
+how big the table is.
+
+Tests and benchmarks clear the cache as they please, so they run with a
+private in-process one (‘TEST_CACHES’) rather than with the one shared by
+running processes: ‘TestRunner’ (it's ‘TEST_RUNNER’ in settings) switches
+to it for tests, benchmarks call ‘use_test_caches’. Tests also use plain
+static files storage, as ‘collectstatic’ isn't run for them; tests of
+‘fungo.storage’ switch back to it.
+"""
+
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fungo-tests',
+    },
+}
+
+def use_test_caches():
+    """
+    Replace ‘CACHES’ with ‘TEST_CACHES’ until the returned override is
+    disabled.
+    """
+    override = override_settings(CACHES=TEST_CACHES)
+    override.enable()
+    return override
+
+TEST_STATICFILES_STORAGE = \
+    'django.contrib.staticfiles.storage.StaticFilesStorage'
+
+class TestRunner(DiscoverRunner):
+    """
+    Test runner that keeps tests away from the shared cache and from the
+    manifest of ‘collectstatic’.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.caches_override = use_test_caches()
+        self.storage_override = override_settings(
+            STATICFILES_STORAGE=TEST_STATICFILES_STORAGE)
+        self.storage_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.storage_override.disable()
+        self.caches_override.disable()
+        super().teardown_test_environment(**kwargs)
+
+class _RowCountingCursor:
+    """
+    Wrapper of DB-API cursor that counts fetched rows.
+    """
+
+    def __init__(self, cursor, context):
+        self.cursor = cursor
+        self.context = context
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        for row in self.cursor:
+            self.context.rows += 1
+            yield row
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            self.context.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self.cursor.fetchmany(*args, **kwargs)
+        self.context.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self.context.rows += len(rows)
+        return rows
+
+class CaptureRowsContext(CaptureQueriesContext):
+    """
+    Capture queries (as ‘CaptureQueriesContext’ does) and count rows
+    fetched by them in ‘rows’ attribute.
+    """
+
+    def __enter__(self):
+        self.rows = 0
+        connection = self.connection
+        create_cursor = connection.create_cursor
+        connection.create_cursor = \
+            lambda: _RowCountingCursor(create_cursor(), self)
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Drop the instance attribute, so the method of the class is used
+        # again.
+        del self.connection.create_cursor
+        super().__exit__(exc_type, exc_value, traceback)
+
+class QueryBudgetMixin:
+    """
+    Mixin for ‘TestCase’ with ‘assertQueryBudget’.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, queries, max_rows, using=DEFAULT_DB_ALIAS):
+        """
+        Assert that code in the ‘with’ block runs exactly ‘queries’ queries
+        that fetch at most ‘max_rows’ rows in total.
+        """
+        with CaptureRowsContext(connections[using]) as context:
+            yield context
+        executed = '\n'.join('{0}. {1}'.format(i, q['sql']) for i, q in
+                             enumerate(context.captured_queries, start=1))
+        self.assertEqual(
+            len(context), queries,
+            '{0} queries executed, {1} expected\nCaptured queries were:\n{2}'
+            .format(len(context), queries, executed))
+        self.assertLessEqual(
+            context.rows, max_rows,
+            '{0} rows fetched, at most {1} expected\nCaptured queries '
+            'were:\n{2}'.format(context.rows, max_rows, executed))
@@ -1,8 +1,38 @@
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.db import OperationalError, connection, connections, transaction
+from django.template import Context, Template
+from django.template.base import Parser
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from fungo.models import Category
 
-from fungo.models import Category
+from fungo import (clicks, counters, images, leaderboards, pagination,
+                   responsecache, routers, search, sqlite, stats, storage,
+                   trending, visits, votes)
+from fungo.models import (Category, DailyClicks, DailyHits, HourlyHits, Page,
+                          User, UserProfile)
+from fungo.signals import counters_changed
+from fungo.testing import QueryBudgetMixin
+from fungo.templatetags import kwacros
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from datetime import date, timedelta
+from PIL import Image
+from unittest import mock
 
 class CategoryMethodTests(TestCase):
 
@@ -22,6 +52,23 @@ class CategoryMethodTests(TestCase):
         cat.save()
         self.assertEqual(cat.slug, 'random-category-string')
 
+    def test_page_count(self):
+        """
+        ‘page_count’ should follow pages that are added, moved and deleted.
+        """
+        a = add_cat('a', 0, 0)
+        b = add_cat('b', 0, 0)
+        pages = [Page.objects.create(category=a, title=str(i), url='http://a')
+                 for i in range(3)]
+        pages[0].category = b
+        pages[0].save()
+        pages[1].delete()
+        counts = dict(Category.objects.values_list('name', 'page_count'))
+        self.assertEqual(counts, {'a': 1, 'b': 1})
+        Page.objects.all().delete()
+        counts = dict(Category.objects.values_list('name', 'page_count'))
+        self.assertEqual(counts, {'a': 0, 'b': 0})
+
 def add_cat(name, views, likes):
     c = Category.objects.get_or_create(name=name)[0]
     c.views = views
@@ -31,6 +78,9 @@ def add_cat(name, views, likes):
 
 class IndexViewTests(TestCase):
 
+    def setUp(self):
+        cache.clear()
+
     def test_index_view_with_no_categories(self):
         """
         If no categories exist, an appropriate message should be displayed.
@@ -55,3 +105,1297 @@ class IndexViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "tmp test temp")
         self.assertEqual(len(response.context['categories']), 4)
+
+class ViewCounterTests(TestCase):
+
+    def test_category_views_are_buffered(self):
+        """
+        Views of a category should get to the database only after flush.
+        """
+        cat = add_cat('test', 0, 0)
+        self.client.get(reverse('category', args=[cat.slug]))
+        self.client.get(reverse('category', args=[cat.slug]))
+        self.assertEqual(counters.pending_views(cat), 2)
+        self.assertEqual(Category.objects.get(pk=cat.pk).views, 0)
+        counters.flush()
+        self.assertEqual(counters.pending_views(cat), 0)
+        self.assertEqual(Category.objects.get(pk=cat.pk).views, 2)
+
+    def test_concurrent_increments_are_exact(self):
+        """
+        No increment should be lost when many threads count views at once.
+        """
+        cat = add_cat('test', 5, 0)
+        page = Page.objects.create(category=cat, title='t', url='http://a.b')
+        counter = counters.BufferedViewCounter(interval=3600)
+
+        def hit():
+            for i in range(500):
+                counter.incr(Category, cat.pk)
+                counter.incr(Page, page.pk, 2)
+
+        threads = [threading.Thread(target=hit) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        counter.flush()
+        self.assertEqual(Category.objects.get(pk=cat.pk).views, 5 + 4000)
+        self.assertEqual(Page.objects.get(pk=page.pk).views, 8000)
+
+    def test_failing_receiver_does_not_repeat_increments(self):
+        """
+        Committed increments should neither be retried nor put back into
+        the buffer when a receiver of ‘counters_changed’ fails.
+        """
+        cat = add_cat('test', 0, 0)
+        counter = counters.BufferedViewCounter(interval=3600)
+        counter.incr(Category, cat.pk, 3)
+
+        def fail(**kwargs):
+            raise OperationalError('database is locked')
+
+        counters_changed.connect(fail, sender=Category)
+        self.addCleanup(counters_changed.disconnect, fail, sender=Category)
+        with self.assertLogs('fungo.counters', 'ERROR'):
+            counter.flush()
+        self.assertEqual(counter.pending(Category, cat.pk), 0)
+        self.assertEqual(Category.objects.get(pk=cat.pk).views, 3)
+
+class VoteTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('bob', password='secret')
+        self.client.login(username='bob', password='secret')
+
+    def test_like_category_only_once(self):
+        """
+        Second like of the same category by the same user should be ignored.
+        """
+        cat = add_cat('test', 0, 3)
+        url = reverse('like_category')
+        response = self.client.get(url, {'category_id': cat.id})
+        self.assertEqual(response.content, b'4')
+        response = self.client.get(url, {'category_id': cat.id})
+        self.assertEqual(response.content, b'4')
+        self.assertEqual(Category.objects.get(pk=cat.pk).likes, 4)
+        self.assertEqual(Category.objects.get(pk=cat.pk).voter_count, 1)
+        self.assertTrue(votes.has_liked(self.user, cat))
+        self.user.delete()
+        self.assertEqual(Category.objects.get(pk=cat.pk).voter_count, 0)
+
+    def test_liked_category_ids(self):
+        """
+        Bulk lookup should return exactly the liked categories in one query.
+        """
+        cats = [add_cat(name, 0, 0) for name in ('a', 'b', 'c')]
+        votes.like(self.user, cats[0])
+        votes.like(self.user, cats[2])
+        with self.assertNumQueries(1):
+            liked = votes.liked_category_ids(self.user, cats)
+        self.assertEqual(liked, {cats[0].id, cats[2].id})
+
+class LikeStateTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('bob', password='secret')
+        self.cats = [add_cat(name, 0, 0) for name in ('a', 'b', 'c')]
+        votes.like(self.user, self.cats[1])
+
+    def test_with_like_state(self):
+        """
+        Like state of all categories should come in one query.
+        """
+        with self.assertNumQueries(1):
+            liked = {c.name: bool(c.liked_by_user) for c in
+                     Category.objects.with_like_state(self.user)}
+        self.assertEqual(liked, {'a': False, 'b': True, 'c': False})
+        other = User.objects.create_user('alice')
+        self.assertFalse(any(c.liked_by_user for c in
+                             Category.objects.with_like_state(other)))
+
+    def test_lists_show_like_state(self):
+        """
+        Index and category suggestions should show what the user has liked.
+        """
+        self.client.login(username='bob', password='secret')
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['liked'], {self.cats[1].id})
+        self.assertContains(response, 'like-button', count=2)
+        response = self.client.get(reverse('suggest_category'),
+                                   {'suggestion': ''})
+        self.assertContains(response, 'glyphicon-star', count=1)
+
+class CategorySearchTests(TestCase):
+
+    def setUp(self):
+        search.reset()
+
+    def test_index_ranks_by_views(self):
+        """
+        Index should find substrings case-insensitively, best viewed first.
+        """
+        index = search.CategoryIndex([(1, 'Python', 10),
+                                      (2, 'Monty Python', 20),
+                                      (3, 'Django', 30),
+                                      (4, 'python tricks', 5)])
+        self.assertEqual(index.search('python'), [2, 1, 4])
+        self.assertEqual(index.search('PY', 2), [2, 1])
+        self.assertEqual(index.search(''), [3, 2, 1, 4])
+        self.assertEqual(index.search('ruby'), [])
+
+    def test_short_queries(self):
+        """
+        One- and two-letter queries should use current views for rare grams;
+        the order walked for common ones should follow views once it's
+        re-ranked.
+        """
+        index = search.CategoryIndex([(pk, 'item {0}'.format(pk), pk)
+                                      for pk in range(1, 101)])
+        index.update(101, 'Zq', 0)
+        index.update(102, 'zqx', 1)
+        self.assertEqual(index.search('zq'), [102, 101])
+        self.assertEqual(index.search('i', 2), [100, 99])
+        index.bump(1, 1000)
+        index.rank()
+        self.assertEqual(index.search('i', 2), [1, 100])
+        self.assertEqual(index.search('', 1), [1])
+
+    def test_index_follows_category_changes(self):
+        """
+        Saved, renamed, deleted and viewed categories should be reflected in
+        search results without rebuilding the index.
+        """
+        a = add_cat('Alpha', 1, 0)
+        b = add_cat('Alphabet', 2, 0)
+        self.assertEqual(search.search_categories('alpha'), [b, a])
+        counters.get_counter().incr(Category, a.pk, 5)
+        counters.flush()
+        self.assertEqual(search.search_categories('alpha'), [a, b])
+        b.name = 'Beta'
+        b.save()
+        self.assertEqual(search.search_categories('alpha'), [a])
+        a.delete()
+        self.assertEqual(search.search_categories('alpha'), [])
+        add_cat('Gamma Alpha', 0, 0)
+        self.assertEqual([c.name for c in search.search_categories('alpha')],
+                         ['Gamma Alpha'])
+
+    def test_suggestions_are_cached(self):
+        """
+        Repeated suggestions should not touch the database until a category
+        changes.
+        """
+        a = add_cat('Alpha', 1, 0)
+        url = reverse('suggest_category_json')
+        data = json.loads(self.client.get(url, {'suggestion': 'ALP'})
+                          .content.decode())
+        self.assertEqual([c['name'] for c in data['results']], ['Alpha'])
+        self.assertTrue(data['complete'])
+        self.assertEqual(data['results'][0]['url'],
+                         reverse('category', args=['alpha']))
+        with self.assertNumQueries(0):
+            self.assertEqual(search.suggest('alp')[0]['name'], 'Alpha')
+        Page.objects.create(category=a, title='t', url='http://a.b')
+        self.assertEqual(search.suggest('alp')[0]['page_count'], 1)
+        add_cat('Alpine', 5, 0)
+        self.assertEqual([c['name'] for c in search.suggest('alp')],
+                         ['Alpine', 'Alpha'])
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for i in range(23):
+            User.objects.create(username='user{0:02}'.format(i))
+        self.usernames = ['user{0:02}'.format(i) for i in range(23)]
+
+    def test_walk_forward_and_backward(self):
+        """
+        Following next cursors should visit every row exactly once, previous
+        cursors should lead back.
+        """
+        paginator = pagination.KeysetPaginator(User.objects.all(),
+                                               'username', 5)
+        page, seen, numbers = paginator.page(), [], []
+        while True:
+            seen += [u.username for u in page]
+            numbers.append(page.number)
+            if not page.has_next:
+                break
+            page = paginator.page(page.next_cursor)
+        self.assertEqual(seen, self.usernames)
+        self.assertEqual(numbers, [1, 2, 3, 4, 5])
+        page = paginator.page(page.previous_cursor)
+        self.assertEqual(page.number, 4)
+        self.assertEqual([u.username for u in page], self.usernames[15:20])
+
+    def test_window(self):
+        """
+        Window should contain neighbouring pages and the first and the last
+        one, with cursors leading to right rows.
+        """
+        paginator = pagination.KeysetPaginator(User.objects.all(),
+                                               'username', 2)
+        page = paginator.page()
+        window = paginator.window(page, 12, radius=2)
+        self.assertEqual([i for i, cursor in window], [1, 2, 3, 12])
+        page = paginator.page(window[2][1])
+        self.assertEqual([u.username for u in page], self.usernames[4:6])
+        window = paginator.window(page, 12, radius=2)
+        self.assertEqual([i for i, cursor in window], [1, 2, 3, 4, 5, 12])
+        page = paginator.page(window[-1][1])
+        self.assertEqual([u.username for u in page], self.usernames[21:])
+
+    def test_all_users_view(self):
+        """
+        View should accept cursors and reject forged ones.
+        """
+        response = self.client.get(reverse('all_users'), {'pagesize': 15})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user_number'], 23)
+        cursor = response.context['pages'][-1][1]
+        response = self.client.get(reverse('all_users'),
+                                   {'pagesize': 15, 'cursor': cursor})
+        self.assertContains(response, 'user22')
+        self.assertNotContains(response, 'user07')
+        response = self.client.get(reverse('all_users'), {'cursor': 'junk'})
+        self.assertEqual(response.status_code, 404)
+
+class LeaderboardTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_steady_state_needs_no_queries(self):
+        """
+        Once built, boards should be served from cache.
+        """
+        add_cat('test', 1, 1)
+        leaderboards.top('categories')
+        leaderboards.top('pages')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(leaderboards.top('categories')), 1)
+            leaderboards.top('pages')
+            leaderboards.top('pages')
+
+    def test_boards_are_updated_incrementally(self):
+        """
+        Likes, view count flushes and saves should be reflected without
+        rebuilding boards.
+        """
+        cats = [add_cat('cat{0}'.format(i), 0, 10 * i) for i in range(7)]
+        self.assertEqual([c.name for c in leaderboards.top('categories')],
+                         ['cat6', 'cat5', 'cat4', 'cat3', 'cat2'])
+        user = User.objects.create_user('bob', password='secret')
+        votes.like(user, cats[2])
+        with self.assertNumQueries(0):
+            board = leaderboards.top('categories')
+        self.assertEqual([c.likes for c in board], [60, 50, 40, 30, 21])
+        self.assertEqual(leaderboards.top('pages'), [])
+        page = Page.objects.create(category=cats[0], title='p', url='http://a.b')
+        counters.get_counter().incr(Page, page.pk, 3)
+        counters.flush()
+        with self.assertNumQueries(0):
+            board = leaderboards.top('pages')
+        self.assertEqual([(p.title, p.views) for p in board], [('p', 3)])
+        cats[1].likes = 100
+        cats[1].save()
+        self.assertEqual(leaderboards.top('categories')[0].name, 'cat1')
+
+class FragmentCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self, source, **context):
+        t = Template('{% load fungo_extras %}' + source)
+        return t.render(Context(context))
+
+    def test_fragment_is_cached_per_user(self):
+        """
+        Fragment should be rendered once per user, not once per request.
+        """
+        source = '{% fragment "f" %}{{ user.username }} {{ n }}{% endfragment %}'
+        bob = User.objects.create_user('bob')
+        self.assertEqual(self.render(source, user=bob, n=1), 'bob 1')
+        self.assertEqual(self.render(source, user=bob, n=2), 'bob 1')
+        alice = User.objects.create_user('alice')
+        self.assertEqual(self.render(source, user=alice, n=3), 'alice 3')
+
+    def test_versioned_fragment_follows_categories(self):
+        """
+        Versioned fragments should be re-rendered after category changes.
+        """
+        source = ('{% fragment "f" versioned %}{% get_category_list %}'
+                  '{% endfragment %}')
+        cat = add_cat('Python', 0, 0)
+        self.assertIn('Python', self.render(source))
+        with self.assertNumQueries(0):
+            self.assertIn('Python', self.render(source))
+        cat.name = 'Haskell'
+        cat.save()
+        self.assertIn('Haskell', self.render(source))
+
+MACRO_LIBRARY = '''
+{% load kwacros %}
+{% kwacro greet name greeting="Hello" punct="!" %}{{ greeting }}, {{ name }}{{ punct }}{% endkwacro %}
+'''
+
+@override_settings(TEMPLATES=[{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'OPTIONS': {
+        'loaders': [('django.template.loaders.locmem.Loader',
+                     {'macros.html': MACRO_LIBRARY})],
+    },
+}])
+class KwacroTests(TestCase):
+
+    def setUp(self):
+        kwacros._libraries.clear()
+
+    def render(self, source, **context):
+        t = Template('{% load kwacros %}{% loadkwacros "macros.html" %}' +
+                     source)
+        return t.render(Context(context))
+
+    def test_library_is_parsed_once(self):
+        """
+        Macro library should be parsed once and shared between templates.
+        """
+        with mock.patch('fungo.templatetags.kwacros.get_template',
+                        wraps=kwacros.get_template) as get_template:
+            self.assertEqual(self.render('{% usekwacro greet "Bob" %}'),
+                             'Hello, Bob!')
+            self.assertEqual(self.render('{% usekwacro greet n greeting="Hi" %}',
+                                         n='Alice'),
+                             'Hi, Alice!')
+        self.assertEqual(get_template.call_count, 1)
+
+    def test_usekwacro_render_does_not_parse(self):
+        """
+        Rendering a macro should neither load nor parse anything, defaults
+        are compiled when the library is parsed.
+        """
+        t = Template('{% load kwacros %}{% loadkwacros "macros.html" %}'
+                     '{% usekwacro greet name %}')
+        context = Context({'name': 'Bob'})
+        fail = mock.Mock(side_effect=AssertionError('parsed while rendering'))
+        with mock.patch('fungo.templatetags.kwacros.get_template', fail), \
+             mock.patch.object(Parser, 'parse', fail), \
+             mock.patch.object(Parser, 'compile_filter', fail):
+            for i in range(3):
+                self.assertEqual(t.render(context), 'Hello, Bob!')
+        self.assertEqual(fail.call_count, 0)
+
+    def test_macro_scope_is_isolated(self):
+        """
+        Macro arguments should not leak into the caller, and with ‘only’ the
+        macro should not see caller's variables.
+        """
+        self.assertEqual(
+            self.render('{% usekwacro greet "Bob" %} {{ greeting }}{{ name }}',
+                        name='Alice'),
+            'Hello, Bob! Alice')
+        self.assertEqual(
+            self.render('{% usekwacro greet n only %}', n='Eve', punct='?'),
+            'Hello, Eve!')
+        self.assertEqual(
+            self.render('{% usekwacro greet n only %}', n='<b>'),
+            'Hello, &lt;b&gt;!')
+        self.assertEqual(
+            self.render('{% kwacro show %}[{{ x }}]{% endkwacro %}'
+                        '{% usekwacro show %}{% usekwacro show only %}', x=1),
+            '[1][]')
+
+    def test_usekwacro_in_loop(self):
+        """
+        A macro used in a loop, with and without ‘only’, should render every
+        iteration in its own scope. Timings are in ‘benchmarks/kwacros.py’.
+        """
+        users = ['user{0}'.format(i) for i in range(1000)]
+        for only in ('', ' only'):
+            t = Template('{% load kwacros %}{% loadkwacros "macros.html" %}'
+                         '{% for u in users %}'
+                         '{% usekwacro greet u punct="."' + only + ' %}'
+                         '{% endfor %}')
+            context = Context({'users': users})
+            output = t.render(context)
+            self.assertEqual(output.count('Hello, user'), 1000)
+            self.assertIn('Hello, user999.', output)
+            self.assertNotIn('name', context)
+
+class LoaderTests(TestCase):
+
+    def write(self, suffix, text):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def load(self, path, **options):
+        call_command('load_fungo', path, stdout=io.StringIO(), **options)
+
+    def test_jsonl_load_is_idempotent(self):
+        """
+        Loading the same input twice should not duplicate anything, changed
+        records should update existing rows.
+        """
+        records = [{'type': 'category', 'name': 'Python', 'views': 9,
+                    'likes': 3}]
+        records += [{'type': 'page', 'category': 'Python',
+                     'title': 'Page {0}'.format(i),
+                     'url': 'http://example.com/{0}'.format(i)}
+                    for i in range(25)]
+        path = self.write('.jsonl', '\n'.join(json.dumps(r) for r in records))
+        self.load(path, batch_size=7)
+        self.load(path, batch_size=7)
+        self.assertEqual(Category.objects.count(), 1)
+        self.assertEqual(Page.objects.count(), 25)
+        cat = Category.objects.get()
+        self.assertEqual((cat.slug, cat.views, cat.likes), ('python', 9, 3))
+        self.assertEqual(cat.page_count, 25)
+        records[0]['likes'] = 5
+        records[1]['url'] = 'http://example.com/new'
+        path = self.write('.jsonl', '\n'.join(json.dumps(r) for r in records))
+        self.load(path)
+        self.assertEqual(Category.objects.get().likes, 5)
+        self.assertEqual(Page.objects.get(title='Page 0').url,
+                         'http://example.com/new')
+
+    def test_csv_load(self):
+        """
+        CSV input should work too; pages of unknown categories are skipped.
+        """
+        path = self.write('.csv',
+                          'type,name,category,title,url,views\n'
+                          'category,Django,,,,4\n'
+                          'page,,Django,Rocks,http://a.b,2\n'
+                          'page,,Nope,Lost,http://c.d,1\n')
+        self.load(path)
+        self.assertEqual(Category.objects.get().views, 4)
+        self.assertEqual(Page.objects.get().title, 'Rocks')
+
+    def test_bad_counters_are_skipped(self):
+        """
+        Records with counters that aren't numbers should be skipped, not
+        abort the load.
+        """
+        path = self.write('.csv',
+                          'type,name,category,title,url,views\n'
+                          'category,Django,,,,many\n'
+                          'category,Flask,,,,3\n'
+                          'page,,Flask,Rocks,http://a.b,1.5\n'
+                          'page,,Flask,Rolls,http://c.d,\n')
+        self.load(path)
+        self.assertEqual(list(Category.objects.values_list('name', 'views')),
+                         [('Flask', 3)])
+        self.assertEqual(list(Page.objects.values_list('title', 'views')),
+                         [('Rolls', 0)])
+
+    def test_load_invalidates_derived_data(self):
+        """
+        Search suggestions and cached pages should show loaded categories
+        right away.
+        """
+        cache.clear()
+        responsecache.clear()
+        search.reset()
+        add_cat('Python', 1, 0)
+        self.assertEqual([c['name'] for c in search.suggest('py')],
+                         ['Python'])
+        self.assertNotContains(self.client.get(reverse('index')), 'Pyramid')
+        self.load(self.write('.jsonl', json.dumps(
+            {'type': 'category', 'name': 'Pyramid', 'views': 100})))
+        self.assertEqual([c['name'] for c in search.suggest('py')],
+                         ['Pyramid', 'Python'])
+        self.assertContains(self.client.get(reverse('index')), 'Pyramid')
+
+    def test_bad_json_records_are_skipped(self):
+        """
+        Floats, booleans and lines that aren't objects should be skipped.
+        """
+        records = [{'type': 'category', 'name': 'Float', 'views': 1.5},
+                   {'type': 'category', 'name': 'Bool', 'likes': True},
+                   [1], 'x', 7,
+                   {'type': 'category', 'name': 'Good', 'views': '12'}]
+        path = self.write('.jsonl', '\n'.join(json.dumps(r) for r in records))
+        self.load(path)
+        self.assertEqual(list(Category.objects.values_list('name', 'views')),
+                         [('Good', 12)])
+
+@override_settings(FUNGO_CLICK_FLUSH_INTERVAL=3600)
+class ClickLogTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        clicks.drain()
+        cat = add_cat('test', 0, 0)
+        self.page = Page.objects.create(category=cat, title='t',
+                                        url='http://example.com/')
+
+    def test_redirect_does_not_write(self):
+        """
+        Redirect should be served from cache without writes; clicks should
+        get to the database when the queue is drained.
+        """
+        url = reverse('goto')
+        response = self.client.get(url, {'page_id': self.page.id})
+        self.assertRedirects(response, 'http://example.com/',
+                             fetch_redirect_response=False)
+        with self.assertNumQueries(0):
+            self.client.get(url, {'page_id': self.page.id})
+        self.assertEqual(Page.objects.get(pk=self.page.pk).views, 0)
+        self.assertEqual(clicks.drain(), 2)
+        self.assertEqual(Page.objects.get(pk=self.page.pk).views, 2)
+        self.assertEqual(DailyClicks.objects.get(page=self.page).clicks, 2)
+        self.client.get(url, {'page_id': self.page.id})
+        clicks.drain()
+        self.assertEqual(DailyClicks.objects.get(page=self.page).clicks, 3)
+
+    def test_signal_after_write(self):
+        """
+        ‘counters_changed’ should be sent once when clicks are written and
+        not at all when writing them fails.
+        """
+        sent = []
+
+        def receiver(deltas, **kwargs):
+            sent.append(dict(deltas))
+
+        counters_changed.connect(receiver, sender=Page)
+        self.addCleanup(counters_changed.disconnect, receiver, sender=Page)
+        with mock.patch('fungo.clicks._add_daily',
+                        side_effect=OperationalError('disk I/O error')):
+            with self.assertRaises(OperationalError):
+                clicks.write_clicks({(self.page.id, date.today()): 2})
+        self.assertEqual(sent, [])
+        self.assertEqual(Page.objects.get(pk=self.page.pk).views, 0)
+        clicks.write_clicks({(self.page.id, date.today()): 2})
+        self.assertEqual(sent, [{self.page.id: 2}])
+
+    def test_unknown_page(self):
+        """
+        Unknown or malformed page ids should lead to the homepage.
+        """
+        for page_id in (self.page.id + 1, 'junk'):
+            response = self.client.get(reverse('goto'), {'page_id': page_id})
+            self.assertRedirects(response, reverse('index'))
+        self.assertEqual(clicks.drain(), 0)
+
+    def test_changed_url_is_not_stale(self):
+        """
+        Cached URL should be dropped when the page is saved.
+        """
+        self.assertEqual(clicks.page_url(self.page.id), 'http://example.com/')
+        self.page.url = 'http://example.org/'
+        self.page.save()
+        self.assertEqual(clicks.page_url(self.page.id), 'http://example.org/')
+
+class RequestStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        stats.reset()
+        add_cat('test', 1, 1)
+
+    def test_request_is_recorded(self):
+        """
+        Queries, timings and size of a request should be recorded under its
+        view name.
+        """
+        response = self.client.get(reverse('index'))
+        s = stats.snapshot()['views']['fungo.views.index']
+        self.assertEqual(s['requests'], 1)
+        self.assertGreater(s['queries_avg'], 0)
+        self.assertGreater(s['template_ms_avg'], 0)
+        self.assertEqual(s['bytes_avg'], len(response.content))
+        self.assertEqual(sum(s['time_ms_histogram'].values()), 1)
+
+    @override_settings(FUNGO_QUERY_BUDGETS={'default': 0})
+    def test_over_budget(self):
+        """
+        Requests with more queries than allowed should be flagged and
+        logged.
+        """
+        with self.assertLogs('fungo.requests', 'WARNING'):
+            self.client.get(reverse('all_users'))
+        s = stats.snapshot()['views']['fungo.views.all_users']
+        self.assertEqual(s['over_budget'], 1)
+
+    def test_stats_view_is_staff_only(self):
+        """
+        Statistics should be served as JSON to staff only.
+        """
+        url = reverse('stats')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        admin = User.objects.create_user('admin', password='secret')
+        admin.is_staff = True
+        admin.save()
+        self.client.login(username='admin', password='secret')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('fungo.views.request_stats',
+                      json.loads(response.content.decode())['views'])
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Number of queries and bound on rows fetched by every view with cold
+    caches. Data is big enough that an unbounded query or a query per row
+    doesn't fit the budget.
+    """
+
+    CATEGORIES = 100
+    PAGES = 5 # per category
+    USERS = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        Category.objects.bulk_create(
+            Category(name='cat {0}'.format(i), slug='cat-{0}'.format(i),
+                     views=i, likes=i)
+            for i in range(cls.CATEGORIES))
+        cls.cat = Category.objects.get(slug='cat-0')
+        Page.objects.bulk_create(
+            Page(category=cat, title='page {0}'.format(i),
+                 url='http://example.com/', views=i)
+            for cat in Category.objects.all() for i in range(cls.PAGES))
+        cls.page = Page.objects.filter(category=cls.cat)[0]
+        User.objects.bulk_create(User(username='user{0}'.format(i))
+                                 for i in range(cls.USERS))
+        cls.user = User.objects.create_user('test', password='secret')
+        for user in User.objects.all()[:10]:
+            votes.like(user, cls.cat)
+
+    def setUp(self):
+        cache.clear()
+        # The search index is built once per process, not per request.
+        search.reset()
+        search.get_index()
+
+    def tearDown(self):
+        # Don't leave buffered views and clicks to other tests.
+        counters.flush()
+        clicks.drain()
+
+    def login(self):
+        self.client.login(username='test', password='secret')
+        cache.clear()
+
+    def check(self, queries, max_rows, name, args=(), params={}):
+        # Session middleware and ‘AnonymousUser’ are lazy, so everything is
+        # counted, including session and user lookups.
+        with self.assertQueryBudget(queries, max_rows):
+            response = self.client.get(reverse(name, args=args), params)
+        self.assertLess(response.status_code, 400)
+
+    def test_anonymous(self):
+        """
+        Views should stay within budget for anonymous users.
+        """
+        # Leaderboards and trending totals (there are no hits) are built,
+        # visits are counted in a cookie.
+        self.check(4, 10, 'index')
+        self.check(3, self.PAGES + 2, 'category', args=[self.cat.slug])
+        self.check(1, 5, 'suggest_category', params={'suggestion': 'cat 1'})
+        self.check(1, 5, 'suggest_category_json',
+                   params={'suggestion': 'cat 1'})
+        self.check(0, 0, 'suggest_category_json',
+                   params={'suggestion': 'cat 1'})
+        # Page, count and cursors of following pages.
+        self.check(3, 16 + 1 + 31, 'all_users', params={'pagesize': 15})
+        # Profile, for the picture.
+        self.check(1, 0, 'user_page', args=['user1'])
+        self.check(1, 1, 'goto', params={'page_id': self.page.id})
+        self.check(0, 0, 'about')
+
+    def test_authenticated(self):
+        """
+        Views should stay within budget for logged in users.
+        """
+        self.login()
+        # Plus which of the categories the user has liked.
+        self.check(7, 12 + 5, 'index')
+        self.check(5, self.PAGES + 4, 'category', args=[self.cat.slug])
+        # Session, user, category, vote transaction (with a savepoint).
+        self.check(10, 3, 'like_category', params={'category_id': self.cat.id})
+        self.check(3, 5 + 2, 'suggest_category',
+                   params={'suggestion': 'cat 1'})
+        # Plus which of them the user has liked.
+        self.check(4, 5 + 2, 'suggest_category_json',
+                   params={'suggestion': 'cat 1'})
+        self.check(5, 16 + 1 + 31 + 2, 'all_users', params={'pagesize': 15})
+        self.check(2, 2, 'about')
+
+    def test_unbounded_query_is_caught(self):
+        """
+        A query fetching all rows should not fit a small bound on rows,
+        although it's just one query.
+        """
+        with self.assertRaises(AssertionError):
+            with self.assertQueryBudget(1, 10):
+                list(Category.objects.values_list('name', flat=True))
+        with self.assertQueryBudget(1, 10):
+            list(Category.objects.values_list('name', flat=True)[:10])
+
+class SQLiteTuningTests(TransactionTestCase):
+    # Not ‘TestCase’: retries are only done outside of transactions.
+
+    def test_pragmas_are_applied(self):
+        """
+        New connections should get PRAGMAs from settings.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1) # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_retry_on_locked(self):
+        """
+        Transactions should be retried when the database is locked, but not
+        when they are nested in another transaction.
+        """
+        calls = []
+
+        @sqlite.retry_on_locked
+        def write():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'done'
+
+        with mock.patch('fungo.sqlite.time.sleep'):
+            self.assertEqual(write(), 'done')
+            self.assertEqual(len(calls), 3)
+            del calls[:]
+            with transaction.atomic():
+                with self.assertRaises(OperationalError):
+                    write()
+            self.assertEqual(len(calls), 1)
+
+@override_settings(FUNGO_REPLICA_DATABASE='replica')
+@override_settings(FUNGO_RESPONSE_CACHE_ENABLED=False)
+class ReplicaRouterTests(TransactionTestCase):
+    # Not ‘TestCase’: replication copies only what's committed. Response
+    # cache is off, it would serve pages that are read before replication.
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        connections.databases['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(directory, 'replica.sqlite3'),
+        }
+        self.addCleanup(shutil.rmtree, directory)
+
+    def tearDown(self):
+        counters.flush()
+        connections['replica'].close()
+        del connections.databases['replica']
+        delattr(connections._connections, 'replica')
+
+    def category_exists(self, client, slug):
+        response = client.get(reverse('category', args=[slug]))
+        return 'category' in response.context
+
+    def test_reads_outside_of_requests_use_primary(self):
+        """
+        Code that doesn't serve a request should always see the primary.
+        """
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Category), 'default')
+
+    def test_read_your_writes(self):
+        """
+        Reads should go to the replica, unless the client has just written
+        something.
+        """
+        old = add_cat('old', 0, 0)
+        User.objects.create_user('bob', password='secret')
+        routers.replicate()
+        add_cat('new', 0, 0)
+        self.assertTrue(self.category_exists(self.client, 'old'))
+        self.assertFalse(self.category_exists(self.client, 'new'))
+        self.client.login(username='bob', password='secret')
+        response = self.client.get(reverse('like_category'),
+                                   {'category_id': old.id})
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        self.assertTrue(self.category_exists(self.client, 'new'))
+        routers.replicate()
+        self.assertTrue(self.category_exists(Client(), 'new'))
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.cat = add_cat('test', 0, 0)
+
+    def tearDown(self):
+        counters.flush()
+
+    def get(self, url, etag=None):
+        if etag is None:
+            return self.client.get(url)
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_deploy(self):
+        """
+        New deploy should change the ETag, even if data is the same.
+        """
+        url = reverse('index')
+        with override_settings(FUNGO_DEPLOY_VERSION='1'):
+            etag = self.get(url)['ETag']
+            self.assertEqual(self.get(url, etag).status_code, 304)
+        with override_settings(FUNGO_DEPLOY_VERSION='2'):
+            response = self.get(url, etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_category(self):
+        """
+        Unchanged category page should not be rendered again, but the view
+        should be counted; changes of pages should change the ETag.
+        """
+        url = reverse('category', args=[self.cat.slug])
+        etag = self.get(url)['ETag']
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(counters.pending_views(self.cat), 2)
+        page = Page.objects.create(category=self.cat, title='t',
+                                   url='http://a.b')
+        etag = self.get(url, etag)['ETag']
+        clicks.write_clicks({(page.id, date.today()): 1})
+        self.assertEqual(self.get(url, etag).status_code, 200)
+        page.delete()
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+    def test_category_differs_per_user(self):
+        """
+        Logged in user should not get anonymous user's copy.
+        """
+        url = reverse('category', args=[self.cat.slug])
+        etag = self.get(url)['ETag']
+        User.objects.create_user('bob', password='secret')
+        self.client.login(username='bob', password='secret')
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+    def test_index(self):
+        """
+        Homepage should be served with 304 until leaderboards change.
+        """
+        url = reverse('index')
+        etag = self.get(url)['ETag']
+        self.assertEqual(self.get(url, etag).status_code, 304)
+        votes.like(User.objects.create_user('bob'), self.cat)
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+@override_settings(
+    STATICFILES_STORAGE='fungo.storage.FungoStaticFilesStorage')
+class StaticBundleTests(TestCase):
+
+    def render(self):
+        template = Template("{% load fungo_extras %}"
+                            "{% static_bundle 'js/fungo.js' %}")
+        return template.render(Context({}))
+
+    @override_settings(DEBUG=True)
+    def test_sources_without_collectstatic(self):
+        """
+        Before ‘collectstatic’ source files should be linked one by one, in
+        development.
+        """
+        html = self.render()
+        self.assertEqual(html.count('<script'), 4)
+        self.assertIn('/static/js/vendor/jquery.min.js', html)
+
+    def test_missing_manifest_fails(self):
+        """
+        Without DEBUG a file missing from the manifest should be an error,
+        not an unhashed URL.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(STATIC_ROOT=directory):
+            with self.assertRaises(ValueError):
+                self.render()
+
+    def test_collectstatic(self):
+        """
+        ‘collectstatic’ should build hashed, compressed bundles and the tag
+        should link them.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(STATIC_ROOT=directory):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            with open(os.path.join(directory, 'staticfiles.json')) as f:
+                paths = json.load(f)['paths']
+            css = os.path.join(directory, paths['css/fungo.css'])
+            self.assertTrue(os.path.exists(css + '.gz'))
+            with open(css) as f:
+                self.assertIn('glyphicons-halflings-regular.', f.read())
+            html = self.render()
+        self.assertEqual(html, '<script src="/static/{0}"></script>'
+                         .format(paths['js/fungo.js']))
+
+    def test_minify_css(self):
+        """
+        Comments and needless whitespace should be removed from CSS.
+        """
+        css = '/* x */\nbody {\n  padding-top: 50px;\n}\n\na > b, c { x: 1; }'
+        self.assertEqual(storage.minify_css(css),
+                         'body{padding-top:50px}a>b,c{x:1}')
+
+@override_settings(FUNGO_RESPONSE_CACHE_ENABLED=False)
+class VisitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_visits_are_counted_once_a_day(self):
+        """
+        Visit should be counted on the first request of a day only, without
+        touching the database.
+        """
+        url = reverse('index')
+        response = self.client.get(url)
+        self.assertIn(visits.COOKIE_NAME, response.cookies)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertNotIn(visits.COOKIE_NAME, response.cookies)
+        self.assertEqual(response.context['visits'], 1)
+        later = time.time() + visits.DAY + 1
+        with mock.patch('fungo.visits.time.time', return_value=later):
+            response = self.client.get(url)
+        self.assertEqual(response.context['visits'], 2)
+        response = self.client.get(reverse('about'))
+        self.assertEqual(response.context['visits'], 2)
+
+    def test_tampered_cookie(self):
+        """
+        Cookie that's not signed by us should be ignored.
+        """
+        self.client.cookies[visits.COOKIE_NAME] = '100:0'
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['visits'], 1)
+
+    @override_settings(FUNGO_VISITS_STORE='session')
+    def test_session_store(self):
+        """
+        Session store should work the same way.
+        """
+        url = reverse('index')
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response.context['visits'], 1)
+        self.assertIsInstance(self.client.session['last_visit'], int)
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        responsecache.clear()
+        stats.reset()
+        self.cat = add_cat('test', 0, 0)
+        self.other = add_cat('other', 0, 0)
+
+    def tearDown(self):
+        counters.flush()
+        responsecache.clear()
+
+    def assertCached(self, url, cached=True):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context is None and not ctx.captured_queries,
+                         cached)
+        return response
+
+    def test_hits_and_misses(self):
+        """
+        Second anonymous request should be served from cache, without
+        queries, and counted as a hit.
+        """
+        url = reverse('category', args=[self.cat.slug])
+        self.assertCached(url, False)
+        response = self.assertCached(url)
+        self.assertContains(response, 'test')
+        self.assertEqual(counters.pending_views(self.cat), 2)
+        self.assertEqual(stats.snapshot()['counters'],
+                         {'response_cache.hits': 1,
+                          'response_cache.misses': 1})
+
+    def test_logged_in_users_are_not_cached(self):
+        """
+        Requests with a session should always be rendered.
+        """
+        url = reverse('index')
+        self.assertCached(url, False)
+        User.objects.create_user('bob', password='secret')
+        self.client.login(username='bob', password='secret')
+        self.assertCached(url, False)
+        self.assertCached(url, False)
+
+    def test_invalidation(self):
+        """
+        Adding a page should drop the category page and the homepage only.
+        """
+        urls = [reverse('index'), reverse('about'),
+                reverse('category', args=[self.cat.slug]),
+                reverse('category', args=[self.other.slug])]
+        for url in urls:
+            self.assertCached(url, False)
+        Page.objects.create(category=self.cat, title='new page',
+                            url='http://a.b')
+        self.assertContains(self.assertCached(urls[2], False), 'new page')
+        self.assertCached(urls[0], False)
+        self.assertCached(urls[1])
+        self.assertCached(urls[3])
+
+    def test_renamed_category(self):
+        """
+        Page under the old slug should not be served after renaming.
+        """
+        url = reverse('category', args=[self.cat.slug])
+        self.assertCached(url, False)
+        self.cat.name = 'renamed'
+        self.cat.save()
+        self.assertNotContains(self.assertCached(url, False), 'test')
+
+    def test_visits_are_counted_on_hits(self):
+        """
+        Cached homepage should still count visits.
+        """
+        url = reverse('index')
+        self.assertCached(url, False)
+        self.assertCached(url)
+        self.client.cookies.pop(visits.COOKIE_NAME)
+        response = self.assertCached(url)
+        self.assertIn(visits.COOKIE_NAME, response.cookies)
+
+    @override_settings(FUNGO_RESPONSE_CACHE_MAX_ENTRIES=2)
+    def test_least_recently_used_are_evicted(self):
+        """
+        When the cache is full, least recently used entry should go.
+        """
+        a, b, c = [reverse('category', args=[slug])
+                   for slug in ('a', 'b', 'c')]
+        self.assertCached(a, False)
+        self.assertCached(b, False)
+        self.assertCached(a)
+        self.assertCached(c, False)
+        self.assertCached(a)
+        self.assertCached(b, False)
+
+class TrendingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.old = add_cat('old', 1000, 0)
+        self.new = add_cat('new', 0, 0)
+        self.page = Page.objects.create(category=self.new, title='t',
+                                        url='http://a.b')
+
+    def trends(self, window):
+        return [(t.slug, t.hits) for t in trending.top(window)]
+
+    def test_windows(self):
+        """
+        Hits should count in windows they fall into only.
+        """
+        now = timezone.now()
+        trending.add_hits({self.old.id: 5}, now - timedelta(days=2))
+        trending.add_hits({self.new.id: 3}, now)
+        self.assertEqual(self.trends('24h'), [('new', 3)])
+        self.assertEqual(self.trends('7d'), [('old', 5), ('new', 3)])
+
+    def test_incremental_updates(self):
+        """
+        Flushed views and clicks should get to cached totals without a
+        rebuild.
+        """
+        self.assertEqual(self.trends('24h'), [])
+        counters.apply_increments(Category, {self.old.id: 2})
+        clicks.write_clicks({(self.page.id, date.today()): 3})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.trends('24h'), [('new', 3), ('old', 2)])
+        self.assertEqual(HourlyHits.objects.get(category=self.new).hits, 3)
+
+    def test_hits_commit_with_views(self):
+        """
+        If hits can't be written, views should be rolled back with them, so
+        a retry doesn't count either twice.
+        """
+        with mock.patch('fungo.trending._add_hits',
+                        side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                counters.apply_increments(Category, {self.old.id: 2})
+        self.assertEqual(Category.objects.get(pk=self.old.id).views, 1000)
+        counters.apply_increments(Category, {self.old.id: 2})
+        self.assertEqual(Category.objects.get(pk=self.old.id).views, 1002)
+        self.assertEqual(HourlyHits.objects.get(category=self.old).hits, 2)
+
+    def test_hits_are_added_in_bulk(self):
+        """
+        Adding hits should take the same few queries however many
+        categories there are, existing buckets or not.
+        """
+        cats = [add_cat('cat {0}'.format(i), 0, 0) for i in range(20)]
+        trending.add_hits({cat.id: 1 for cat in cats[:10]})
+        # Look up, update, create (in a savepoint).
+        with self.assertNumQueries(5):
+            trending.add_hits({cat.id: 2 for cat in cats})
+        self.assertEqual(
+            sorted(HourlyHits.objects.values_list('hits', flat=True)),
+            [2] * 10 + [3] * 10)
+
+    def test_roll_up(self):
+        """
+        Old hourly buckets should be summed into daily ones, and daily
+        buckets should expire.
+        """
+        now = timezone.now().replace(hour=12)
+        trending.add_hits({self.old.id: 1}, now - timedelta(days=10))
+        trending.add_hits({self.old.id: 2}, now - timedelta(days=10, hours=1))
+        trending.add_hits({self.old.id: 4}, now)
+        self.assertEqual(trending.roll_up(now), 2)
+        self.assertEqual(DailyHits.objects.get(category=self.old).hits, 3)
+        self.assertEqual(HourlyHits.objects.get().hits, 4)
+        trending.roll_up(now + timedelta(days=100))
+        self.assertFalse(DailyHits.objects.exists())
+
+    def test_index(self):
+        """
+        Homepage should show trending categories.
+        """
+        trending.add_hits({self.new.id: 3})
+        trending.hits_added({self.new.id: 3})
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['trending'][0],
+                         ('24h', trending.top('24h')))
+
+class APITests(TestCase):
+
+    def setUp(self):
+        self.cats = [add_cat('cat {0}'.format(i), i, 0) for i in range(5)]
+        self.page = Page.objects.create(category=self.cats[0], title='t',
+                                        url='http://a.b')
+        User.objects.create_user('bob', 'bob@example.com', 'secret')
+
+    def get(self, name, args=(), **params):
+        response = self.client.get(reverse(name, args=args), params)
+        self.assertTrue(response.streaming)
+        return json.loads(b''.join(response.streaming_content).decode())
+
+    def test_cursor_paging(self):
+        """
+        Following ‘next’ cursors should list every category once.
+        """
+        names, cursor = [], ''
+        while cursor is not None:
+            data = self.get('api_categories', limit=2, cursor=cursor)
+            self.assertLessEqual(len(data['results']), 2)
+            names += [c['name'] for c in data['results']]
+            cursor = data['next']
+        self.assertEqual(names, [c.name for c in self.cats])
+
+    def test_fields(self):
+        """
+        Only requested fields (and ‘id’) should be fetched and returned.
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.get('api_pages', args=[self.cats[0].slug],
+                            fields='title,category')
+        self.assertEqual(data['results'],
+                         [{'id': self.page.id, 'title': 't',
+                           'category': self.cats[0].id}])
+        self.assertNotIn('url', ctx.captured_queries[-1]['sql'])
+        user = self.get('api_users')['results'][0]
+        self.assertEqual(sorted(user), ['date_joined', 'id', 'username'])
+
+    def test_bad_parameters(self):
+        """
+        Bad parameters should be reported as such.
+        """
+        url = reverse('api_categories')
+        for params in [{'fields': 'password'}, {'limit': 0},
+                       {'limit': 'x'}, {'cursor': 'x'}]:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('api_pages', args=['nope']))
+        self.assertEqual(response.status_code, 404)
+
+class PictureTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        media = override_settings(MEDIA_ROOT=directory)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user('bob')
+
+    def upload(self, size=(300, 200), image_format='PNG', mode='RGB'):
+        out = io.BytesIO()
+        Image.new(mode, size).save(out, image_format)
+        return SimpleUploadedFile('bob.' + image_format.lower(),
+                                  out.getvalue())
+
+    def test_variants(self):
+        """
+        Saving a profile with a new picture should make its variants in the
+        background and drop variants of the old one.
+        """
+        profile = UserProfile(user=self.user, picture=self.upload())
+        profile.save()
+        images.wait()
+        name = images.variant_name(profile.picture.name, 'small', 'jpg')
+        with default_storage.open(name) as f:
+            self.assertEqual(Image.open(f).size, (48, 48))
+        html = Template("{% load fungo_extras %}"
+                        "{% picture profile.picture 'small' %}").render(
+                            Context({'profile': profile}))
+        self.assertIn(default_storage.url(name), html)
+        profile = UserProfile.objects.get()
+        profile.picture = self.upload(mode='RGBA')
+        profile.save()
+        images.wait()
+        self.assertFalse(default_storage.exists(name))
+        self.assertTrue(default_storage.exists(images.variant_name(
+            profile.picture.name, 'small', 'png')))
+
+    def test_variants_of_same_base_name(self):
+        """
+        Pictures that differ in extension only shouldn't share variants.
+        """
+        self.assertNotEqual(
+            images.variant_names('profile_images/bob.png'),
+            images.variant_names('profile_images/bob.jpg'))
+        alice = User.objects.create_user('alice')
+        UserProfile(user=self.user, picture=self.upload()).save()
+        profile = UserProfile(user=alice,
+                              picture=self.upload(image_format='JPEG'))
+        profile.save()
+        images.wait()
+        name = images.variant_name(profile.picture.name, 'small', 'jpg')
+        UserProfile.objects.get(user=self.user).delete()
+        images.wait()
+        self.assertTrue(default_storage.exists(name))
+
+    def test_validation(self):
+        """
+        Broken, huge and oversized uploads should be rejected.
+        """
+        for upload in [SimpleUploadedFile('bob.png', b'not an image'),
+                       self.upload(size=(5000, 5000), image_format='GIF')]:
+            with self.assertRaises(ValidationError):
+                UserProfile(user=self.user, picture=upload).full_clean()
+        with override_settings(FUNGO_PICTURE_MAX_BYTES=10):
+            with self.assertRaises(ValidationError):
+                UserProfile(user=self.user,
+                            picture=self.upload()).full_clean()
+        UserProfile(user=self.user, picture=self.upload()).full_clean()
@@ -0,0 +1,223 @@
+"""
+Trending categories: most hits (views of the category and clicks on its
+pages) in the last 24 hours and 7 days.
+
+Lifetime totals (‘views’ fields) can't tell what's hot now, so hits are
+also added to per-hour buckets (‘HourlyHits’) whenever view counters are
+flushed, in the same transaction as the views (‘counters_changing’, see
+‘fungo.receivers’), so the two never disagree. Hourly buckets are kept for
+‘FUNGO_TRENDING_HOURLY_RETENTION’ hours, then ‘roll_up’ (‘manage.py
+rollup_hits’) sums them into ‘DailyHits’, which are kept for
+‘FUNGO_TRENDING_DAILY_RETENTION’ days.
+
+Totals per window are kept in the cache and updated incrementally once
+hits are committed (‘counters_changed’). They are rebuilt from the
+buckets (one query per window) when the current hour ends, so that old
+hits leave the windows, or when they get older than
+‘FUNGO_TRENDING_MAX_AGE’, as updates from different processes may race.
+Requests never scan hits.
+"""
+
+import datetime
+import heapq
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from fungo.models import Category, DailyHits, HourlyHits, Page
+from fungo.sqlite import retry_on_locked
+
+DEFAULT_SIZE = 5
+DEFAULT_MAX_AGE = 600 # seconds
+DEFAULT_HOURLY_RETENTION = 8 * 24 # hours, must cover the longest window
+DEFAULT_DAILY_RETENTION = 90 # days
+CACHE_KEY = 'fungo:trending'
+
+# Categories per batch of ‘add_hits’, three parameters each: SQLite doesn't
+# allow more than 999 in a query.
+CHUNK = 300
+
+# window → its length in hours
+WINDOWS = {
+    '24h': 24,
+    '7d':  7 * 24,
+}
+
+Trend = namedtuple('Trend', ['id', 'name', 'slug', 'hits'])
+
+def _setting(name, default):
+    return getattr(settings, 'FUNGO_TRENDING_' + name, default)
+
+def current_hour(now=None):
+    if now is None:
+        now = timezone.now()
+    return now.replace(minute=0, second=0, microsecond=0)
+
+def _window_start(hour, window):
+    return hour - datetime.timedelta(hours=WINDOWS[window] - 1)
+
+def rebuild(hour=None):
+    """
+    Build totals of all windows ending with ‘hour’ from the buckets and
+    cache them.
+    """
+    if hour is None:
+        hour = current_hour()
+    totals, names = {}, {}
+    for window in WINDOWS:
+        rows = (HourlyHits.objects
+                .filter(hour__gte=_window_start(hour, window))
+                .values_list('category', 'category__name', 'category__slug')
+                .annotate(Sum('hits')))
+        totals[window] = {}
+        for pk, name, slug, hits in rows:
+            totals[window][pk] = hits
+            names[pk] = (name, slug)
+    state = {'built_at': time.time(), 'hour': hour, 'totals': totals,
+             'names': names}
+    cache.set(CACHE_KEY, state, _setting('MAX_AGE', DEFAULT_MAX_AGE))
+    return state
+
+def _state():
+    state = cache.get(CACHE_KEY)
+    if (state is None or state['hour'] != current_hour() or
+            time.time() - state['built_at'] > _setting('MAX_AGE',
+                                                       DEFAULT_MAX_AGE)):
+        return rebuild()
+    return state
+
+def invalidate():
+    """
+    Drop cached totals, e.g. when a category is renamed or deleted.
+    """
+    cache.delete(CACHE_KEY)
+
+def top(window):
+    """
+    Return list of ‘Trend’s, categories with most hits in ‘window’.
+    """
+    state = _state()
+    best = heapq.nlargest(_setting('SIZE', DEFAULT_SIZE),
+                          state['totals'][window].items(),
+                          key=lambda item: (item[1], -item[0]))
+    return [Trend(pk, state['names'][pk][0], state['names'][pk][1], hits)
+            for pk, hits in best]
+
+def _totals_changed(hits, hour):
+    state = cache.get(CACHE_KEY)
+    if state is None or state['hour'] != hour:
+        # The next ‘top’ rebuilds the totals anyway.
+        return
+    for totals in state['totals'].values():
+        for pk, n in hits.items():
+            totals[pk] = totals.get(pk, 0) + n
+    missing = [pk for pk in hits if pk not in state['names']]
+    if missing:
+        for pk, name, slug in (Category.objects.filter(pk__in=missing)
+                               .values_list('pk', 'name', 'slug')):
+            state['names'][pk] = (name, slug)
+    for totals in state['totals'].values():
+        for pk in list(totals):
+            if pk not in state['names']:
+                # The category is gone.
+                del totals[pk]
+    cache.set(CACHE_KEY, state, _setting('MAX_AGE', DEFAULT_MAX_AGE))
+
+def _add(model, lookup, n):
+    rows = model.objects.filter(**lookup)
+    if rows.update(hits=F('hits') + n):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(hits=n, **lookup)
+    except IntegrityError:
+        # Somebody has just created the row, add to it then.
+        rows.update(hits=F('hits') + n)
+
+def add_hits(hits, now=None):
+    """
+    Add ‘hits’ (mapping category id → number of hits) to the bucket of the
+    current hour. This must be called in a transaction, call ‘hits_added’
+    once it has committed.
+
+    It's a few statements however many categories there are (they hold
+    the write lock of the flush): existing rows are looked up at once,
+    missing ones are created in bulk and the rest get one ‘UPDATE’ with
+    ‘CASE’.
+    """
+    hour = current_hour(now)
+    hits = {pk: n for pk, n in hits.items() if n > 0}
+    ids = list(hits)
+    for i in range(0, len(ids), CHUNK):
+        _add_hits(hour, {pk: hits[pk] for pk in ids[i:i + CHUNK]})
+
+def _add_hits(hour, hits):
+    rows = HourlyHits.objects.filter(hour=hour, category_id__in=list(hits))
+    existing = set(rows.values_list('category_id', flat=True))
+    if existing:
+        rows.filter(category_id__in=existing).update(hits=F('hits') + Case(
+            *[When(category_id=pk, then=Value(hits[pk])) for pk in existing],
+            default=Value(0), output_field=IntegerField()))
+    missing = [HourlyHits(category_id=pk, hour=hour, hits=n)
+               for pk, n in hits.items() if pk not in existing]
+    if not missing:
+        return
+    try:
+        with transaction.atomic():
+            HourlyHits.objects.bulk_create(missing)
+    except IntegrityError:
+        # Somebody has just created some of the rows, go one by one then.
+        for row in missing:
+            _add(HourlyHits, {'category_id': row.category_id, 'hour': hour},
+                 row.hits)
+
+def hits_added(hits):
+    """
+    Add committed ‘hits’ to cached totals.
+    """
+    hits = {pk: n for pk, n in hits.items() if n > 0}
+    if hits:
+        _totals_changed(hits, current_hour())
+
+def category_hits(page_hits):
+    """
+    Turn hits of pages (mapping page id → number of hits) into hits of
+    their categories.
+    """
+    by_category = defaultdict(int)
+    for pk, category_id in (Page.objects.filter(pk__in=list(page_hits))
+                            .values_list('pk', 'category_id')):
+        by_category[category_id] += page_hits[pk]
+    return by_category
+
+@retry_on_locked
+def roll_up(now=None):
+    """
+    Sum hourly buckets older than retention into daily ones and delete
+    daily buckets older than retention. Return number of hourly buckets
+    rolled up.
+    """
+    if now is None:
+        now = timezone.now()
+    hourly_before = current_hour(now) - datetime.timedelta(
+        hours=_setting('HOURLY_RETENTION', DEFAULT_HOURLY_RETENTION))
+    daily_before = now.date() - datetime.timedelta(
+        days=_setting('DAILY_RETENTION', DEFAULT_DAILY_RETENTION))
+    with transaction.atomic():
+        old = HourlyHits.objects.filter(hour__lt=hourly_before)
+        days = defaultdict(int)
+        n = 0
+        for category_id, hour, hits in old.values_list('category', 'hour',
+                                                       'hits'):
+            days[(category_id, hour.date())] += hits
+            n += 1
+        for (category_id, day), hits in days.items():
+            _add(DailyHits, {'category_id': category_id, 'day': day}, hits)
+        old.delete()
+        DailyHits.objects.filter(day__lt=daily_before).delete()
+    return n
@@ -15,7 +15,14 @@ urlpatterns = [
     url(r'^restricted/$', views.restricted, name='restricted'),
     url(r'^like_category/$', views.like_category, name='like_category'),
     url(r'^suggest_category/$', views.suggest_category, name='suggest_category'),
+    url(r'^suggest_category\.json$', views.suggest_category_json,
+        name='suggest_category_json'),
     url(r'^user/(?P<user_name>[\w\-]+)/$', views.user_page, name='user_page'),
     url(r'^users/$', views.all_users, name='all_users'),
     url(r'^goto/$', views.track_url, name='goto'),
+    url(r'^stats/$', views.request_stats, name='stats'),
+    url(r'^api/categories/$', views.api_categories, name='api_categories'),
+    url(r'^api/category/(?P<category_name_url>[\w\-]+)/pages/$',
+        views.api_pages, name='api_pages'),
+    url(r'^api/users/$', views.api_users, name='api_users'),
 ]
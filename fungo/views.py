@@ -1,54 +1,70 @@
 from django.contrib.auth            import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers       import reverse
-from django.http                    import HttpResponse, Http404
+from django.db.models               import Max
+from django.http                    import (HttpResponse, Http404,
+                                            JsonResponse)
 from django.shortcuts               import render, redirect
 from django.views.decorators.http   import require_GET
 
+from fungo import (api, clicks, conditional, counters, leaderboards,
+                   pagination, responsecache, search, stats, trending, visits,
+                   votes)
 from fungo.forms import CategoryForm, PageForm
-from fungo.models import Category, Page, User
+from fungo.models import Category, Page, User, UserProfile
 
-from datetime import datetime
 
 # Views
 
+def _track_visit(request, response):
+    visits.track(request)
+    visits.save(request, response)
+
+@responsecache.cache_anonymous
 def index (request):
-    # Query the database for a list of ALL categories currently stored.
-    # Order the categories by number of likes in descending order.
-    # Retrieve the top 5 only — or all if less than 5.
-    # Place the list in our ‘context_dict’ dictionary which will be passed
-    # to the template engine.
-    category_list = Category.objects.order_by('-likes')[:5]
-    # ↑ how to query on database level, not on Python level?
-    page_list = Page.objects.order_by('-views')[:5]
+    # Top 5 categories by likes and top 5 pages by views. These come from
+    # cache and are maintained incrementally, so we don't hit the database
+    # here, see ‘fungo.leaderboards’.
+    category_list = leaderboards.top('categories')
+    page_list = leaderboards.top('pages')
 
     context_dict = {'categories': category_list, 'pages': page_list}
 
-    # Get the number of visits to the site. We use the COOKIES.get()
-    # function to obtain the visits cookie. If the cookie exists, the value
-    # returned is casted to an integer. If the cookie doesn't exist, we
-    # default to 1 and cast that.
-    visits = request.session.get('visits', 1)
-    reset_last_visit_time = False
-
-    last_visit = request.session.get('last_visit')
-    if last_visit:
-        last_visit_time = datetime.strptime(last_visit[:-7], "%Y-%m-%d %H:%M:%S")
-
-        if (datetime.now() - last_visit_time).days > 0:
-            visits += 1
-            reset_last_visit_time = True
-    else:
-        reset_last_visit_time = True
-
-    if reset_last_visit_time:
-        request.session['last_visit'] = str(datetime.now())
-        request.session['visits'] = visits
-
-    context_dict['visits'] = visits
-
-    return render(request, 'fungo/index.html', context_dict)
-
+    # What's hot now: most hits in recent windows, kept in cache and
+    # updated as hits come, see ‘fungo.trending’.
+    trends = [(window, trending.top(window))
+              for window in sorted(trending.WINDOWS,
+                                   key=trending.WINDOWS.get)]
+    context_dict['trending'] = trends
+
+    # Leaderboards are shared by all users, so which of the categories the
+    # user has liked is looked up separately, in one query.
+    liked = votes.liked_category_ids(request.user, category_list)
+    context_dict['liked'] = liked
+
+    # Count the visit. The counter lives in a signed cookie (or session)
+    # and is only written when it changes, see ‘fungo.visits’.
+    visit_count = visits.track(request)
+    context_dict['visits'] = visit_count
+
+    # The page is made of the leaderboards, so if the client has seen the
+    # same ones, it can use its copy, see ‘fungo.conditional’.
+    parts = [(c.pk, c.name, c.slug, c.likes) for c in category_list]
+    parts += [(p.pk, p.title, p.url, p.views) for p in page_list]
+    parts += [(window, items) for window, items in trends]
+    etag = conditional.make_etag(request.user, 'index', visit_count,
+                                 sorted(liked), *parts)
+    response = conditional.not_modified(request, etag)
+    if response is None:
+        response = conditional.add_etag(
+            render(request, 'fungo/index.html', context_dict), etag)
+
+    # Logged-out visitors may get this from the response cache, visits are
+    # counted there too, see ‘fungo.responsecache’.
+    responsecache.on_hit(response, _track_visit)
+    return visits.save(request, response)
+
+@responsecache.cache_anonymous
 def category(request, category_name_url):
 
     # Create a context dictionary which we can pass to the template
@@ -60,9 +76,26 @@ def category(request, category_name_url):
         # Can we find a category name slug with the given name? If we can't,
         # the .get() method raises a ‘DoesNotExist’ exception. So the .get()
         # method returns one model instance or raises an exception.
-        cat = Category.objects.get(slug=category_name_url)
+        cat = (Category.objects.with_like_state(request.user)
+               .get(slug=category_name_url))
         context_dict['category_name'] = cat.name
 
+        # The view is only buffered here, it gets to the database with the
+        # next flush, see ‘fungo.counters’.
+        counters.count_view(cat)
+
+        # Everything shown here bumps ‘updated’ of the category or of one of
+        # its pages, and removed pages change the count, so the client's
+        # copy is good if these are the same, see ‘fungo.conditional’.
+        pages_updated = (Page.objects.filter(category=cat)
+                         .aggregate(Max('updated'))['updated__max'])
+        etag = conditional.make_etag(request.user, 'category', cat.pk,
+                                     cat.updated, cat.page_count,
+                                     pages_updated)
+        response = conditional.not_modified(request, etag)
+        if response is not None:
+            return response
+
         # Retrieve all of the associated pages. Note that filter returns >=
         # 1 model instance.
         pages = Page.objects.filter(category=cat).order_by('-views')
@@ -75,25 +108,26 @@ def category(request, category_name_url):
         # category exists.
         context_dict['category'] = cat
 
-        if request.user.is_authenticated:
-            context_dict['can_like'] = request.user not in cat.voters.all()
-        else:
-            context_dict['can_like'] = False
-
-        cat.views += 1;
-        cat.save()
+        # Like state came with the category, see ‘CategoryQuerySet’.
+        context_dict['can_like'] = (request.user.is_authenticated() and
+                                    not cat.liked_by_user)
 
     except Category.DoesNotExist:
         # We get here if we didn't find the specified category. Don't do
         # anything - the template displays the "no category" message for us.
-        pass
+        return render(request, 'fungo/category.html', context_dict)
 
-    # Go render the response and return it to the client.
-    return render(request, 'fungo/category.html', context_dict)
+    # Go render the response and return it to the client. Views are counted
+    # when it's served from the response cache as well.
+    response = conditional.add_etag(
+        render(request, 'fungo/category.html', context_dict), etag)
+    return responsecache.on_hit(
+        response, lambda request, response: counters.count_view(cat))
 
+@responsecache.cache_anonymous(vary=lambda request: [visits.get(request)])
 def about (request):
-    count = request.session.get('visits', 1)
-    return render(request, 'fungo/about.html', {'visits': count})
+    return render(request, 'fungo/about.html',
+                  {'visits': visits.get(request)})
 
 @login_required
 def add_category(request):
@@ -263,36 +297,59 @@ def like_category(request):
     if request.method != 'GET':
         return HttpResponse(0)
 
-    cat_id = request.GET['category_id']
-
-    if not cat_id:
+    try:
+        cat_id = int(request.GET.get('category_id', ''))
+    except ValueError:
         return HttpResponse(0)
 
-    cat = Category.objects.get(id=int(cat_id))
+    # The slug is for dropping the category's page from response cache.
+    cat = Category.objects.filter(id=cat_id).only('likes', 'slug').first()
 
-    if not cat:
+    if cat is None:
         return HttpResponse(0)
 
-    if request.user not in cat.voters.all():
-        cat.likes += 1
-        cat.save()
-        cat.voters.add(request.user)
+    likes = cat.likes
+
+    # Vote insertion and likes increment happen in one transaction, see
+    # ‘fungo.votes’.
+    if votes.like(request.user, cat):
+        likes += 1
 
-    return HttpResponse(cat.likes)
+    return HttpResponse(likes)
 
-def get_category_list(max_results=0, query=''):
-    return Category.objects.filter(
-        name__contains=query).order_by('-views')[:max_results]
+def get_category_list(max_results=0, query='', user=None):
+    # Served from in-memory index, see ‘fungo.search’.
+    return search.search_categories(query, max_results, user)
 
 def suggest_category(request):
 
     if request.method != 'GET':
         return HttpResponse()
 
-    cats = get_category_list(5, request.GET['suggestion'])
+    cats = get_category_list(5, request.GET['suggestion'], request.user)
 
     return render(request, 'fungo/cats.html', {'cats': cats})
 
+SUGGESTIONS = 5
+
+@require_GET
+def suggest_category_json(request):
+    """
+    Top categories whose names contain 'suggestion' as JSON. Results are
+    'complete' if there are fewer of them than asked for: then results for
+    any longer query are among them, and the client filters them itself.
+    """
+    query = request.GET.get('suggestion', '')
+    # The same for everybody and cached, see ‘fungo.search’.
+    results = search.suggest(query, SUGGESTIONS)
+    liked = votes.liked_category_ids(request.user,
+                                     [c['id'] for c in results])
+    cats = [dict(c, liked=c['id'] in liked,
+                 url=reverse('category', args=[c['slug']]))
+            for c in results]
+    return JsonResponse({'query': query, 'results': cats,
+                         'complete': len(cats) < SUGGESTIONS})
+
 @require_GET
 def user_page(request, user_name):
     """
@@ -300,43 +357,49 @@ def user_page(request, user_name):
     let him edit his account.
     """
     # TODO: write me, please
-    return render(request, 'fungo/user_page.html', {'user_name': user_name})
+    profile = (UserProfile.objects.filter(user__username=user_name)
+               .only('picture').first())
+    return render(request, 'fungo/user_page.html',
+                  {'user_name': user_name, 'profile': profile})
 
 @require_GET
+@responsecache.cache_anonymous
 def all_users(request):
     """
     Display page containing links to profiles of all Fungo users. This thing
     is pagified and user can choose how many items will be displayed on a
     page.
 
-    Parameters 'pagesize' and 'page' control result of the view.
+    Parameters 'pagesize' and 'cursor' control result of the view. Cursors
+    are opaque, they are generated by ‘fungo.pagination’.
     """
-    users       = User.objects.all().order_by('username')
-    users_total = len(users)
-    context = {'user_number': len(users)}
-
     try:
         pagesize = int(request.GET.get('pagesize', 15))
-        page     = int(request.GET.get('page', 1))
-
     except ValueError:
         raise Http404
 
+    if pagesize < 1:
+        raise Http404
+
     PAGE_RANGE = 3
 
-    start = pagesize * (page - 1)
-    end   = start + pagesize
-    pages_total = users_total // pagesize
-    if users_total % pagesize > 0:
-        pages_total += 1
-    context['users'] = users[start:end]
-    context['page'] = page
-    context['pages'] = [1]
-    context['pages'] += [i for i in range(page - PAGE_RANGE,
-                                          page + PAGE_RANGE + 1)
-                         if 1 < i < pages_total]
-    if pages_total != 1:
-        context['pages'] += [pages_total]
+    paginator = pagination.KeysetPaginator(User.objects.only('username'),
+                                           'username', pagesize)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except ValueError:
+        raise Http404
+
+    # Total number of users is only needed for the badge and number of the
+    # last page, so approximate one will do.
+    users_total = pagination.cached_count(User.objects.all(),
+                                          'fungo:users:count')
+    pages_total = pagination.pages_total(users_total, pagesize)
+
+    context = {'user_number': users_total}
+    context['users'] = page.object_list
+    context['page'] = page.number
+    context['pages'] = paginator.window(page, pages_total, PAGE_RANGE)
     context['pagesize'] = pagesize
     context['pagesizes'] = [15,30,50]
 
@@ -346,13 +409,53 @@ def all_users(request):
 def track_url(request):
     page_id = request.GET.get('page_id')
 
-    if page_id:
-        try:
-            page = Page.objects.get(id=page_id)
-            page.views += 1
-            page.save()
-            return redirect(page.url)
-        except (Page.DoesNotExist, MultipleObjectsReturned):
-            pass
-    else:
+    try:
+        page_id = int(page_id)
+    except (TypeError, ValueError):
+        return redirect(reverse('index'))
+
+    # URL comes from cache and the click is only queued, so the redirect
+    # doesn't wait for the database, see ‘fungo.clicks’.
+    url = clicks.page_url(page_id)
+
+    if url is None:
         return redirect(reverse('index'))
+
+    clicks.record_click(page_id)
+    return redirect(url)
+
+@require_GET
+def api_categories(request):
+    """
+    All categories as JSON, see ‘fungo.api’ for parameters.
+    """
+    return api.stream(request, Category.objects.all(), api.CATEGORY_FIELDS)
+
+@require_GET
+def api_pages(request, category_name_url):
+    """
+    Pages of a category as JSON.
+    """
+    ids = (Category.objects.filter(slug=category_name_url)
+           .values_list('id', flat=True))
+    if not ids:
+        raise Http404
+    return api.stream(request, Page.objects.filter(category_id=ids[0]),
+                      api.PAGE_FIELDS)
+
+@require_GET
+def api_users(request):
+    """
+    All users as JSON, public fields only.
+    """
+    return api.stream(request, User.objects.all(), api.USER_FIELDS)
+
+@require_GET
+def request_stats(request):
+    """
+    Per-view request statistics collected by ‘RequestStatsMiddleware’ in
+    this process, as JSON. Staff only.
+    """
+    if not request.user.is_staff:
+        raise Http404
+    return JsonResponse(stats.snapshot())
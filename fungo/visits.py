@@ -0,0 +1,96 @@
+"""
+Visit counter shown on the about page.
+
+A visit is counted when the client comes back a day or more after the
+visit that was counted last. The count and time of that visit (as integer
+Unix time) are kept by one of the stores, see ‘FUNGO_VISITS_STORE’:
+
+* ‘cookie’ (default) — compact signed cookie, no database access at all;
+
+* ‘session’ — in the session, so it's as cheap as ‘SESSION_ENGINE’ is
+  (use a cache-based engine).
+
+Either way, nothing is written unless the count has changed, i.e. at most
+once a day per client.
+"""
+
+import time
+
+from django.conf import settings
+
+DAY = 24 * 60 * 60 # seconds
+COOKIE_NAME = 'fungo_visits'
+COOKIE_SALT = 'fungo.visits'
+DEFAULT_COOKIE_AGE = 365 * DAY
+
+class CookieStore:
+
+    def load(self, request):
+        value = request.get_signed_cookie(COOKIE_NAME, None, salt=COOKIE_SALT)
+        try:
+            count, last = value.split(':')
+            return int(count), int(last)
+        except (AttributeError, ValueError):
+            # No cookie, it's been tampered with or it's malformed.
+            return 0, None
+
+    def save(self, request, response, count, last):
+        max_age = getattr(settings, 'FUNGO_VISITS_COOKIE_AGE',
+                          DEFAULT_COOKIE_AGE)
+        response.set_signed_cookie(COOKIE_NAME,
+                                   '{0}:{1}'.format(count, last),
+                                   salt=COOKIE_SALT, max_age=max_age,
+                                   httponly=True)
+
+class SessionStore:
+
+    def load(self, request):
+        return (request.session.get('visits', 0),
+                request.session.get('last_visit'))
+
+    def save(self, request, response, count, last):
+        request.session['visits'] = count
+        request.session['last_visit'] = last
+
+STORES = {
+    'cookie':  CookieStore(),
+    'session': SessionStore(),
+}
+
+def get_store():
+    return STORES[getattr(settings, 'FUNGO_VISITS_STORE', 'cookie')]
+
+def track(request):
+    """
+    Count visit of ‘request’ if it's due and return number of visits. The
+    new count is remembered in ‘save’.
+    """
+    count, last = get_store().load(request)
+    now = int(time.time())
+    if last is None:
+        count, last = 1, now
+    elif not isinstance(last, int):
+        # Older versions kept the time in session as a string.
+        count, last = max(count, 1), now
+    elif now - last >= DAY:
+        count, last = count + 1, now
+    else:
+        return count
+    request.fungo_visit = (count, last)
+    return count
+
+def get(request):
+    """
+    Return number of visits without counting this one.
+    """
+    count, last = get_store().load(request)
+    return max(count, 1)
+
+def save(request, response):
+    """
+    Store the count from ‘track’ if it has changed. Return ‘response’.
+    """
+    visit = getattr(request, 'fungo_visit', None)
+    if visit is not None:
+        get_store().save(request, response, *visit)
+    return response
@@ -0,0 +1,71 @@
+"""
+Vote store: who liked which category.
+
+Votes live in their own table with a unique (user, category) index, so
+checking a vote is a single index lookup instead of loading all voters of
+a category, and liking is one transaction: insert the vote and bump
+‘Category.likes’ and ‘Category.voter_count’ with ‘F()’ expressions. The
+unique index is what makes it safe under concurrency — of two racing likes
+only one insert succeeds.
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from fungo import counters
+from fungo.models import Category, Vote
+from fungo.sqlite import retry_on_locked
+
+def has_liked(user, category):
+    """
+    Return True if ‘user’ has liked ‘category’ (instance or id).
+    """
+    if not user.is_authenticated():
+        return False
+    return Vote.objects.filter(user=user, category=category).exists()
+
+def liked_category_ids(user, categories):
+    """
+    Return set of ids of those categories from ‘categories’ (instances or
+    ids) that ‘user’ has liked. This is one query no matter how many
+    categories are there.
+    """
+    if not user.is_authenticated():
+        return set()
+    ids = [getattr(c, 'pk', c) for c in categories]
+    if not ids:
+        return set()
+    return set(Vote.objects.filter(user=user, category_id__in=ids)
+               .values_list('category_id', flat=True))
+
+def like(user, category):
+    """
+    Register like of ‘category’ (instance or id) by ‘user’. Return False if
+    the user has already liked it, True otherwise.
+    """
+    category_id = getattr(category, 'pk', category)
+    if not _insert_vote(user, category_id):
+        return False
+    # Receivers need the slug, pass it on if we have it.
+    slugs = None
+    if isinstance(category, Category):
+        slugs = {category_id: category.slug}
+    # After the commit, so a failing receiver can't make us retry it.
+    counters.notify(Category, {category_id: 1}, 'likes', slugs)
+    return True
+
+@retry_on_locked
+def _insert_vote(user, category_id):
+    with transaction.atomic():
+        try:
+            # Inner block is a savepoint, so failed insert doesn't break the
+            # outer transaction.
+            with transaction.atomic():
+                Vote.objects.create(user=user, category_id=category_id)
+        except IntegrityError:
+            return False
+        Category.objects.filter(pk=category_id).update(
+            likes=F('likes') + 1, voter_count=F('voter_count') + 1,
+            updated=timezone.now())
+    return True
@@ -43,6 +43,8 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'fungo.middleware.RequestStatsMiddleware',
+    'fungo.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -81,9 +83,42 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # Keep connections open between requests, connection setup
+        # includes PRAGMAs, see ‘fungo.sqlite’.
+        'CONN_MAX_AGE': 600,
+    },
+    # Read replica, see ‘FUNGO_REPLICA_DATABASE’ below and ‘fungo.routers’.
+    # 'replica': {
+    #     'ENGINE': 'django.db.backends.sqlite3',
+    #     'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+    #     'CONN_MAX_AGE': 600,
+    #     'TEST': {'MIRROR': 'default'},
+    # },
 }
 
+DATABASE_ROUTERS = ['fungo.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/1.8/topics/cache/
+
+# Must be shared by all processes: buffered counter flush requests, the
+# loader's leaderboard and fragment refresh, versions of cached responses
+# and trending totals all go through it. Use Memcached or the like when
+# running on more than one machine. Tests and benchmarks use a cache of
+# their own, see ‘fungo.testing’.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+TEST_RUNNER = 'fungo.testing.TestRunner'
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
@@ -110,6 +145,12 @@ STATICFILES_DIRS = [
     STATIC_PATH,
 ]
 
+# ‘collectstatic’ puts hashed, bundled and compressed files here, see
+# ‘fungo.storage’.
+STATIC_ROOT = os.path.join(BASE_DIR, 'static_root')
+
+STATICFILES_STORAGE = 'fungo.storage.FungoStaticFilesStorage'
+
 # Media
 
 # ↓ Absolute path to media directory
@@ -127,3 +168,108 @@ LOGIN_REDIRECT_URL = '/fungo/' # The page to arrive after login.
 LOGIN_URL = '/accounts/login/' # FIXME use 'reverse' here somehow
 
 SITE_ID = 1
+
+# View counters
+
+FUNGO_VIEW_COUNTER = 'fungo.counters.BufferedViewCounter'
+FUNGO_VIEW_COUNTER_FLUSH_INTERVAL = 10 # Seconds between flushes to database.
+
+# Category search
+
+FUNGO_SEARCH_INDEX_MAX_AGE = 300 # Rebuild in-memory index after (seconds).
+FUNGO_SUGGEST_CACHE_SIZE = 1000 # Cached suggestions (queries) per process.
+
+# Homepage leaderboards
+
+FUNGO_LEADERBOARD_SIZE = 5 # Number of top categories and pages to show.
+FUNGO_LEADERBOARD_MAX_AGE = 60 # Rebuild from database after (seconds).
+
+# Fragment cache
+
+FUNGO_FRAGMENT_CACHE_TIMEOUT = 600 # Seconds to keep navbar, title etc.
+
+# Click log
+
+FUNGO_CLICK_FLUSH_INTERVAL = 5 # Seconds between writes of queued clicks.
+FUNGO_CLICK_BATCH_SIZE = 1000 # Write earlier if this many clicks are queued.
+FUNGO_CLICK_DAILY_STATS = True # Keep per-day click counts in ‘DailyClicks’.
+
+# Request statistics
+
+FUNGO_QUERY_BUDGETS = { # Max SQL queries per view, see ‘fungo.middleware’.
+    'default':                10,
+    'fungo.views.index':      7, # With cold leaderboard and trending cache.
+    'fungo.views.category':   6,
+    'fungo.views.all_users':  5,
+}
+
+# SQLite tuning
+
+FUNGO_SQLITE_PRAGMAS = { # Applied to every new connection.
+    'journal_mode': 'WAL',
+    'synchronous':  'NORMAL',
+    'mmap_size':    256 * 1024 * 1024, # bytes
+    'cache_size':   -64 * 1024,        # negative means KiB
+    'busy_timeout': 5000,              # ms
+}
+FUNGO_SQLITE_LOCKED_RETRIES = 5 # Retries of write transactions on lock.
+
+# Read replica
+
+FUNGO_REPLICA_DATABASE = None # Alias of read replica in ‘DATABASES’.
+FUNGO_REPLICA_PIN_SECONDS = 10 # Read from primary for this long after write.
+
+# Static bundles
+
+FUNGO_STATIC_BUNDLES = { # Bundle → source files, see ‘fungo.storage’.
+    'css/fungo.css': [
+        'css/bootstrap.min.css',
+        'css/dashboard.css',
+    ],
+    'js/fungo.js': [
+        'js/vendor/jquery.min.js',
+        'js/fungo-jquery.js',
+        'js/fungo-ajax.js',
+        'js/bootstrap.min.js',
+    ],
+}
+
+# Visit counter
+
+FUNGO_VISITS_STORE = 'cookie' # ‘cookie’ or ‘session’, see ‘fungo.visits’.
+FUNGO_VISITS_COOKIE_AGE = 365 * 24 * 60 * 60 # Seconds to keep the cookie.
+
+# Conditional GET
+
+FUNGO_DEPLOY_VERSION = None # Part of ETags, see ‘fungo.conditional’. None
+                            # means digest of templates and static files.
+
+# Response cache
+
+FUNGO_RESPONSE_CACHE_ENABLED = True # Cache pages for logged-out visitors.
+FUNGO_RESPONSE_CACHE_MAX_ENTRIES = 500 # Per process, least recently used go.
+FUNGO_RESPONSE_CACHE_MAX_BYTES = 16 * 1024 * 1024 # Per process.
+FUNGO_RESPONSE_CACHE_TIMEOUT = 60 # Seconds, bounds staleness of counters.
+
+# Trending categories
+
+FUNGO_TRENDING_SIZE = 5 # Number of trending categories to show per window.
+FUNGO_TRENDING_MAX_AGE = 600 # Rebuild totals from hit buckets after (seconds).
+FUNGO_TRENDING_HOURLY_RETENTION = 8 * 24 # Hours, then rolled up into days.
+FUNGO_TRENDING_DAILY_RETENTION = 90 # Days to keep rolled up hits.
+
+# JSON API
+
+FUNGO_API_DEFAULT_LIMIT = 100 # Rows per response unless ‘limit’ is given.
+FUNGO_API_MAX_LIMIT = 10000 # Responses are streamed, memory use is constant.
+
+# Profile pictures
+
+FUNGO_PICTURE_SIZES = { # Square variants made of uploads, see ‘fungo.images’.
+    'small':  48,
+    'medium': 160,
+    'large':  512,
+}
+FUNGO_PICTURE_WORKERS = 2 # Threads that make the variants.
+FUNGO_PICTURE_MAX_BYTES = 5 * 1024 * 1024 # Largest upload accepted.
+FUNGO_PICTURE_MAX_PIXELS = 4096 * 4096 # Largest image (width × height).
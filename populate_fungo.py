@@ -6,67 +6,68 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fungo_project.settings')
 import django
 django.setup()
 
-from fungo.models import Category, Page
+from fungo import loader
+from fungo.models import Page
 
 def populate():
     """
-    Populate our database with some random stuff.
+    Populate our database with some random stuff. This goes through the
+    same bulk loader as ‘manage.py load_fungo’, so running it twice is
+    harmless.
     """
-    python_cat = add_cat('Python', views=128, likes=64)
+    records = []
 
-    add_page(cat=python_cat,
+    add_cat(records, 'Python', views=128, likes=64)
+
+    add_page(records, cat='Python',
              title='Official Python Tutorial',
              url='http://docs.python.org/3/tutorial')
 
-    add_page(cat=python_cat,
+    add_page(records, cat='Python',
              title="How to Think like a Computer Scientist",
              url="http://www.greenteapress.com/thinkpython/")
 
-    add_page(cat=python_cat,
+    add_page(records, cat='Python',
              title="Learn Python in 10 Minutes",
              url="http://www.korokithakis.net/tutorials/python/")
 
-    django_cat = add_cat("Django", views=64, likes=31)
+    add_cat(records, "Django", views=64, likes=31)
 
-    add_page(cat=django_cat,
+    add_page(records, cat="Django",
              title="Official Django Tutorial",
              url="https://docs.djangoproject.com/en/1.5/intro/tutorial01/")
 
-    add_page(cat=django_cat,
+    add_page(records, cat="Django",
              title="Django Rocks",
              url="http://www.djangorocks.com/")
 
-    add_page(cat=django_cat,
+    add_page(records, cat="Django",
              title="How to Tango with Django",
              url="http://www.tangowithdjango.com/")
 
-    frame_cat = add_cat("Other Frameworks", views=32, likes=13)
+    add_cat(records, "Other Frameworks", views=32, likes=13)
 
-    add_page(cat=frame_cat,
+    add_page(records, cat="Other Frameworks",
              title="Bottle",
              url="http://bottlepy.org/docs/dev/")
 
-    add_page(cat=frame_cat,
+    add_page(records, cat="Other Frameworks",
              title="Flask",
              url="http://flask.pocoo.org")
 
+    print(loader.load(records))
+
     # Print out what we have added to the user.
-    for c in Category.objects.all():
-        for p in Page.objects.filter(category=c):
-            print("- {0} - {1}".format(str(c), str(p)))
-
-def add_page(cat, title, url, views=0):
-    p = Page.objects.get_or_create(category=cat, title=title)[0]
-    p.url=url
-    p.views=views
-    p.save()
-    return p
-
-def add_cat(name, views=0, likes=0):
-    c = Category.objects.get_or_create(name=name)[0]
-    c.views = views
-    c.likes = likes
-    return c
+    for p in Page.objects.select_related('category').order_by('category'):
+        print("- {0} - {1}".format(str(p.category), str(p)))
+
+def add_page(records, cat, title, url, views=0):
+    records.append({'type': 'page', 'category': cat, 'title': title,
+                    'url': url, 'views': views})
+
+def add_cat(records, name, views=0, likes=0):
+    records.append({'type': 'category', 'name': name, 'views': views,
+                    'likes': likes})
 
 # Start execution here!
 if __name__ == '__main__':
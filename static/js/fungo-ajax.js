@@ -11,12 +11,85 @@ $('#likes').click(function(){
     });
 });
 
+$('.like-button').click(function(){
+    var button = $(this);
+    var catid = button.attr('data-catid');
+    $.get('/fungo/like_category', {category_id: catid}, function(data) {
+        $('#like_count_' + catid).html(data);
+        button.hide();
+    });
+});
+
+// Sidebar search. Requests are sent once the user stops typing for a
+// moment, and results are remembered per query. If results for a shorter
+// query are complete (there are fewer than the server's limit), results
+// for a query that starts with it are among them, so no request is needed.
+
+var SUGGEST_DELAY = 200; // ms
+var suggestions = {};
+var suggestTimer = null;
+var currentQuery = null;
+
 $('#suggestion').keyup(function (){
-    lookupSuggestion($(this).val());
+    var query = $(this).val();
+    clearTimeout(suggestTimer);
+    suggestTimer = setTimeout(function() {
+        lookupSuggestion(query);
+    }, SUGGEST_DELAY);
 });
 
+function cachedSuggestion(query) {
+    var key = query.toLowerCase();
+    if (suggestions.hasOwnProperty(key)) {
+        return suggestions[key];
+    }
+    for (var n = key.length - 1; n >= 0; n--) {
+        var shorter = suggestions[key.substring(0, n)];
+        if (shorter && shorter.complete) {
+            var data = {
+                complete: true,
+                results: $.grep(shorter.results, function(c) {
+                    return c.name.toLowerCase().indexOf(key) >= 0;
+                })
+            };
+            suggestions[key] = data;
+            return data;
+        }
+    }
+    return null;
+}
+
+function showSuggestion(data) {
+    var cats = $('#cats').empty();
+    if (!data.results.length) {
+        cats.append($('<p>').text('There are no category present.'));
+        return;
+    }
+    var list = $('<ul class="nav nav-sidebar">');
+    $.each(data.results, function(i, c) {
+        var link = $('<a>').attr('href', c.url).text(c.name + ' ');
+        if (c.liked) {
+            link.append('<span class="glyphicon glyphicon-star"></span> ');
+        }
+        link.append($('<span class="badge">').text(c.page_count));
+        list.append($('<li>').append(link));
+    });
+    cats.append(list);
+}
+
 function lookupSuggestion(query) {
-    $.get('/fungo/suggest_category', {suggestion: query}, function(data){
-        $('#cats').html(data);
+    currentQuery = query;
+    var data = cachedSuggestion(query);
+    if (data) {
+        showSuggestion(data);
+        return;
+    }
+    $.getJSON('/fungo/suggest_category.json', {suggestion: query},
+              function(data) {
+        suggestions[query.toLowerCase()] = data;
+        // Responses may come out of order, show only the latest query.
+        if (query === currentQuery) {
+            showSuggestion(data);
+        }
     });
 };